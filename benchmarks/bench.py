@@ -0,0 +1,403 @@
+# benchmarks/bench.py
+"""Benchmarks do servidor: sintetiza vídeos localmente e mede cada etapa do fluxo.
+
+Etapas medidas (cada uma vira uma entrada `nome -> segundos` no resultado):
+- ingest:*        gravação do upload (ingest_stream; e o caminho antigo save_incoming + move_to_final_structure)
+- probe:*         probe_video (metadados + SHA-1)
+- process:*       process_video por filtro (e uma cadeia), no encoder e alvo configurados
+- thumbs:*        write_thumbnails / write_small_thumbnail
+- preview:*       generate_preview em cada formato (gif, webp, mp4)
+- db:*            insert_video, list_videos (primeira página e página profunda) e buscas, com N linhas
+- http:*          /api/upload, /api/videos (frio e com cache) e /api/videos/<id> pelo test client do Flask
+
+Tudo roda num diretório temporário (MEDIA_ROOT e banco próprios). O resultado vai para
+benchmarks/results/latest.json e é comparado com benchmarks/baseline.json (gerado na própria
+máquina com --update-baseline): etapas mais lentas que a baseline além da tolerância são
+listadas e o processo sai com código 1.
+
+Uso (na raiz do repositório):
+    python benchmarks/bench.py                      # tudo, compara com a baseline
+    python benchmarks/bench.py --quick              # vídeos menores e menos linhas
+    python benchmarks/bench.py --only process,db    # só algumas etapas
+    python benchmarks/bench.py --rows 10000,100000,1000000
+    python benchmarks/bench.py --update-baseline    # grava o resultado como nova baseline
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / 'baseline.json'
+DEFAULT_OUT = BENCH_DIR / 'results' / 'latest.json'
+
+STAGES = ('ingest', 'probe', 'process', 'thumbs', 'preview', 'db', 'http')
+
+# (rótulo, largura, altura, fps, segundos, codec)
+VIDEOS = [
+    ('360p-xvid', 640, 360, 25, 10, 'xvid'),
+    ('720p-h264', 1280, 720, 30, 10, 'h264'),
+    ('1080p-h264', 1920, 1080, 30, 5, 'h264'),
+]
+VIDEOS_QUICK = [
+    ('360p-xvid', 640, 360, 25, 3, 'xvid'),
+    ('720p-h264', 1280, 720, 30, 2, 'h264'),
+]
+ROWS = [10_000, 100_000]
+ROWS_QUICK = [10_000]
+
+def _setup_env(work: Path):
+    """Isola o servidor num diretório temporário. Precisa rodar antes de importar os módulos do servidor."""
+    os.environ['MEDIA_ROOT'] = str(work / 'media')
+    os.environ['DB_PATH'] = str(work / 'bench.db')
+    sys.path.insert(0, str(ROOT / 'server'))
+
+# ==========================
+# Vídeos sintéticos
+# ==========================
+
+def synth_video(path: Path, width: int, height: int, fps: int, seconds: float, codec: str) -> Path:
+    """Gera um vídeo com gradiente em movimento, um retângulo e ruído leve (conteúdo que não
+    comprime trivialmente). 'xvid' usa o cv2.VideoWriter (.avi); 'h264' usa o encoder ffmpeg (.mp4)."""
+    import cv2
+    import numpy as np
+    from encoders import EncoderSettings, open_encoder, ffmpeg_path
+
+    if codec == 'h264' and ffmpeg_path():
+        path = path.with_suffix('.mp4')
+        writer = open_encoder(path, fps, (width, height), True,
+                              EncoderSettings(backend='ffmpeg', preset='ultrafast', crf=20))
+    else:
+        path = path.with_suffix('.avi')
+        writer = open_encoder(path, fps, (width, height), True, EncoderSettings(backend='opencv'))
+    if not writer.isOpened():
+        raise RuntimeError(f"Não foi possível gerar {path.name}")
+
+    rng = np.random.default_rng(0)
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    noise = rng.integers(0, 24, (height, width, 3), dtype=np.uint8)
+    frame = np.empty((height, width, 3), np.uint8)
+    box = max(8, height // 6)
+    for i in range(int(fps * seconds)):
+        t = i * 4
+        frame[..., 0] = (xs + t) % 256
+        frame[..., 1] = (ys + t * 0.5) % 256
+        frame[..., 2] = ((xs[None, :] + ys) * 0.5 + t) % 256
+        frame += np.roll(noise, i, axis=1)
+        x = (i * 7) % max(1, width - box)
+        y = (i * 3) % max(1, height - box)
+        cv2.rectangle(frame, (x, y), (x + box, y + box), (255, 255, 255), -1)
+        cv2.putText(frame, f'{i:05d}', (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, height / 720, (0, 0, 0), 2)
+        writer.write(frame)
+    writer.release()
+    return path
+
+# ==========================
+# Medição
+# ==========================
+
+class Results:
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, name: str, times: list, **extra):
+        self.entries[name] = {
+            'seconds': round(statistics.median(times), 6),
+            'min': round(min(times), 6),
+            'runs': len(times),
+            **({'extra': extra} if extra else {}),
+        }
+        print(f"  {name:<48} {self.entries[name]['seconds'] * 1000:10.2f} ms"
+              + (f"  {extra}" if extra else ''), flush=True)
+
+def measure(fn, repeat: int) -> list:
+    """Tempos de `repeat` execuções de fn()."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+# ==========================
+# Etapas
+# ==========================
+
+def bench_ingest(res: Results, videos: list, repeat: int):
+    from werkzeug.datastructures import FileStorage
+    from storage import ingest_stream, save_incoming, move_to_final_structure
+
+    for label, src in videos:
+        def ingest():
+            with open(src, 'rb') as f:
+                ingest_stream(f, str(uuid.uuid4()), src.name)
+        res.add(f'ingest:stream@{label}', measure(ingest, repeat), mb=round(src.stat().st_size / 1e6, 2))
+
+        def legacy():
+            with open(src, 'rb') as f:
+                path, name, _ = save_incoming(FileStorage(stream=f, filename=src.name))
+            move_to_final_structure(path, str(uuid.uuid4()), name)
+        res.add(f'ingest:save_move@{label}', measure(legacy, repeat))
+
+def bench_probe(res: Results, videos: list, repeat: int):
+    from processing import probe_video
+    for label, src in videos:
+        res.add(f'probe@{label}', measure(lambda: probe_video(src), repeat))
+
+def bench_process(res: Results, videos: list, repeat: int, work: Path, workers: int):
+    from filters import FILTERS
+    from processing import process_video
+
+    for label, src in videos:
+        for spec in [*FILTERS, 'pixelate+edges']:
+            out_dir = work / 'processed' / label
+            stats = {}
+            times = measure(lambda: process_video(src, out_dir, f'{spec}{src.suffix}', spec,
+                                                  workers=workers, stats=stats), repeat)
+            out = out_dir / f'{spec}{src.suffix}'
+            frames = stats.get('frames') or 0
+            res.add(f'process:{spec}@{label}', times, fps=round(frames / statistics.median(times), 1),
+                    out_mb=round(out.stat().st_size / 1e6, 3) if out.exists() else None)
+
+def _sample_frames(src: Path, count: int):
+    import cv2
+    from storage import thumbnail_indices
+    cap = cv2.VideoCapture(str(src))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    frames = []
+    for idx in thumbnail_indices(total, count):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        ok, frame = cap.read()
+        if ok:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+def bench_thumbs(res: Results, videos: list, repeat: int, work: Path):
+    from config import THUMB_WIDTH
+    from storage import write_thumbnails, write_small_thumbnail
+
+    for label, src in videos:
+        frames = _sample_frames(src, 3)
+        thumbs_dir = work / 'thumbs' / label
+        res.add(f'thumbs:jpeg@{label}', measure(lambda: write_thumbnails(frames, thumbs_dir), repeat))
+        res.add(f'thumbs:small@{label}',
+                measure(lambda: write_small_thumbnail(frames[0], thumbs_dir / 'small.webp', THUMB_WIDTH), repeat))
+
+def bench_preview(res: Results, videos: list, repeat: int, work: Path):
+    from previews import PREVIEW_FORMATS, generate_preview
+
+    for label, src in videos:
+        for fmt in PREVIEW_FORMATS:
+            thumbs_dir = work / 'previews' / label / fmt
+            times = measure(lambda: generate_preview(src, thumbs_dir, fmt), repeat)
+            files = list(thumbs_dir.glob('preview.*'))
+            res.add(f'preview:{fmt}@{label}', times, kb=round(files[0].stat().st_size / 1024, 1) if files else None)
+
+def _fake_meta(i: int, created: datetime) -> dict:
+    from config import MEDIA_ROOT
+    vid = str(uuid.UUID(int=i + 1))
+    base = f'{MEDIA_ROOT}/videos/2024/01/01/{vid}'
+    filters = ('grayscale', 'pixelate', 'edges')
+    return {
+        'id': vid,
+        'original_name': f'clip_{i:07d}_{("praia", "cidade", "festa", "jogo")[i % 4]}.mp4',
+        'original_ext': 'mp4',
+        'mime_type': 'video/mp4',
+        'size_bytes': 1_000_000 + (i * 7919) % 50_000_000,
+        'duration_sec': 5.0 + (i % 600),
+        'fps': (24.0, 25.0, 30.0, 60.0)[i % 4],
+        'width': (640, 1280, 1920)[i % 3],
+        'height': (360, 720, 1080)[i % 3],
+        'filter': filters[i % 3],
+        'created_at': (created + timedelta(seconds=i)).isoformat() + 'Z',
+        'path_original': f'{base}/original/video.mp4',
+        'path_processed': f'{base}/processed/video.mp4',
+        'thumb_frame': f'{base}/thumbs/thumb_1.jpg',
+        'thumb_gif': f'{base}/thumbs/preview.gif',
+        'checksum': f'{i:040x}',
+    }
+
+def bench_db(res: Results, rows: list, repeat: int):
+    from db import batch, insert_video, list_videos, search_videos, encode_cursor
+
+    created = datetime(2024, 1, 1)
+    filled = 0
+    for target in sorted(rows):
+        # Completa a tabela até `target` linhas em transações de 10 mil
+        t0 = time.perf_counter()
+        added = target - filled
+        while filled < target:
+            with batch():
+                for i in range(filled, min(target, filled + 10_000)):
+                    insert_video(_fake_meta(i, created))
+            filled = min(target, filled + 10_000)
+        elapsed = time.perf_counter() - t0
+        tag = f'{target // 1000}k'
+        res.add(f'db:insert_per_1k@{tag}', [elapsed / added * 1000], rows_per_sec=round(added / elapsed))
+
+        res.add(f'db:list_first@{tag}', measure(lambda: list_videos(limit=50), repeat * 5))
+        # Página profunda: cursor a ~90% da tabela (keyset não depende da profundidade)
+        deep = search_videos(limit=1, since=(created + timedelta(seconds=target // 10)).isoformat() + 'Z',
+                             until=(created + timedelta(seconds=target // 10 + 1)).isoformat() + 'Z',
+                             sort='created_at')
+        if deep:
+            deep_cursor = encode_cursor(deep[0])
+            res.add(f'db:list_deep@{tag}', measure(lambda: list_videos(limit=50, cursor=deep_cursor), repeat * 5))
+        res.add(f'db:search_text@{tag}', measure(lambda: search_videos(q='cidade', limit=50), repeat * 5))
+        res.add(f'db:search_filter@{tag}',
+                measure(lambda: search_videos(filters=['edges'], ranges={'width': (1280, None)}, limit=50),
+                        repeat * 5))
+
+def bench_http(res: Results, videos: list, repeat: int):
+    import app as server_app
+    from db import list_videos
+
+    client = server_app.app.test_client()
+    label, src = videos[0]
+    data = src.read_bytes()
+
+    def upload():
+        r = client.post('/api/upload', data={'file': (io.BytesIO(data), src.name), 'filter': 'grayscale'},
+                        content_type='multipart/form-data')
+        assert r.status_code in (200, 202), r.get_data(as_text=True)
+    res.add(f'http:upload@{label}', measure(upload, repeat))
+
+    def videos_cold():
+        server_app.response_cache.clear()
+        assert client.get('/api/videos?limit=50').status_code == 200
+    res.add('http:videos_cold', measure(videos_cold, repeat * 5))
+    client.get('/api/videos?limit=50')
+    res.add('http:videos_warm', measure(lambda: client.get('/api/videos?limit=50'), repeat * 5))
+
+    rows = list_videos(limit=1)
+    if rows:
+        vid = rows[0]['id']
+        def detail_cold():
+            server_app.response_cache.clear()
+            assert client.get(f'/api/videos/{vid}').status_code == 200
+        res.add('http:video_detail_cold', measure(detail_cold, repeat * 5))
+
+# ==========================
+# Baseline
+# ==========================
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta: float = 0.002) -> list:
+    """Etapas mais lentas que a baseline além da tolerância: [(nome, baseline, atual, razão)].
+    Diferenças absolutas abaixo de `min_delta` segundos são tratadas como ruído."""
+    regressions = []
+    print(f"\n{'etapa':<48} {'baseline':>12} {'atual':>12} {'razão':>7}")
+    for name, entry in sorted(current.items()):
+        base = baseline.get(name)
+        if not base or not base.get('seconds'):
+            print(f"{name:<48} {'-':>12} {entry['seconds'] * 1000:10.2f}ms {'novo':>7}")
+            continue
+        ratio = entry['seconds'] / base['seconds']
+        flag = ''
+        if ratio > 1 + tolerance and entry['seconds'] - base['seconds'] >= min_delta:
+            flag = '  << REGRESSÃO'
+            regressions.append((name, base['seconds'], entry['seconds'], ratio))
+        elif ratio < 1 - tolerance and base['seconds'] - entry['seconds'] >= min_delta:
+            flag = '  (mais rápido)'
+        print(f"{name:<48} {base['seconds'] * 1000:10.2f}ms {entry['seconds'] * 1000:10.2f}ms {ratio:7.2f}{flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Benchmarks do servidor de vídeo')
+    ap.add_argument('--quick', action='store_true', help='vídeos menores e menos linhas no banco')
+    ap.add_argument('--only', default='', help=f"etapas separadas por vírgula ({','.join(STAGES)})")
+    ap.add_argument('--rows', default='', help='linhas no banco, ex.: 10000,100000,1000000')
+    ap.add_argument('--repeat', type=int, default=3, help='execuções por medição (vale a mediana)')
+    ap.add_argument('--workers', type=int, default=1, help='PROCESS_WORKERS usado no process_video')
+    ap.add_argument('--out', type=Path, default=DEFAULT_OUT, help='arquivo JSON de resultado')
+    ap.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument('--update-baseline', action='store_true', help='grava o resultado como nova baseline')
+    ap.add_argument('--tolerance', type=float, default=0.25, help='piora aceita antes de acusar regressão (0.25 = 25%%)')
+    ap.add_argument('--min-delta', type=float, default=0.002, help='diferença mínima (s) para contar como regressão')
+    ap.add_argument('--keep', action='store_true', help='não apaga o diretório temporário')
+    args = ap.parse_args(argv)
+
+    stages = [s.strip() for s in args.only.split(',') if s.strip()] or list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        ap.error(f"etapas desconhecidas: {', '.join(sorted(unknown))}")
+    rows = [int(r) for r in args.rows.split(',') if r.strip()] or (ROWS_QUICK if args.quick else ROWS)
+
+    work = Path(tempfile.mkdtemp(prefix='video-bench-'))
+    _setup_env(work)
+    from db import init_db
+    from config import DB_PATH
+    from storage import ensure_media_root
+    ensure_media_root()
+    init_db(DB_PATH)
+
+    res = Results()
+    started = time.perf_counter()
+    try:
+        videos = []
+        if set(stages) & {'ingest', 'probe', 'process', 'thumbs', 'preview', 'http'}:
+            print('Gerando vídeos sintéticos...', flush=True)
+            (work / 'src').mkdir()
+            for label, w, h, fps, seconds, codec in (VIDEOS_QUICK if args.quick else VIDEOS):
+                videos.append((label, synth_video(work / 'src' / label, w, h, fps, seconds, codec)))
+        for stage in stages:
+            print(f'[{stage}]', flush=True)
+            if stage == 'ingest':
+                bench_ingest(res, videos, args.repeat)
+            elif stage == 'probe':
+                bench_probe(res, videos, args.repeat)
+            elif stage == 'process':
+                bench_process(res, videos, args.repeat, work, args.workers)
+            elif stage == 'thumbs':
+                bench_thumbs(res, videos, args.repeat, work)
+            elif stage == 'preview':
+                bench_preview(res, videos, args.repeat, work)
+            elif stage == 'db':
+                bench_db(res, rows, args.repeat)
+            elif stage == 'http':
+                bench_http(res, videos, args.repeat)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    import cv2
+    result = {
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count(), 'opencv': cv2.__version__},
+        'options': {'quick': args.quick, 'repeat': args.repeat, 'workers': args.workers, 'rows': rows},
+        'total_sec': round(time.perf_counter() - started, 2),
+        'results': res.entries,
+    }
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f'\nResultado em {args.out}')
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f'Baseline atualizada em {args.baseline}')
+        return 0
+    if not args.baseline.exists():
+        print('Sem baseline para comparar (rode com --update-baseline).')
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+    regressions = compare(res.entries, baseline.get('results', {}), args.tolerance, args.min_delta)
+    if regressions:
+        print(f'\n{len(regressions)} etapa(s) mais lentas que a baseline (tolerância {args.tolerance:.0%}).')
+        return 1
+    print('\nSem regressões.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
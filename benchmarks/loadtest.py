@@ -0,0 +1,139 @@
+# benchmarks/loadtest.py
+"""Teste de carga local: leitores do catálogo concorrendo com uploads lentos.
+
+Contra um servidor já rodando (de preferência `python server/serve.py`), dispara:
+- `--readers` threads pedindo /api/videos, / (galeria) e /api/health em laço;
+- `--uploads` threads enviando vídeos por /api/upload/stream a `--rate` KB/s (clientes lentos).
+
+Ao final mostra a latência (p50/p95/p99/máx.) das leituras e quantos uploads foram aceitos ou
+recusados com 503. Com o servidor bem configurado as leituras não devem piorar muito enquanto os
+uploads estão em andamento, e o excesso de uploads deve receber 503 + Retry-After.
+
+Uso:
+    python benchmarks/loadtest.py --url http://localhost:5000 --readers 8 --uploads 6 --rate 256 --duration 30
+"""
+import argparse
+import http.client
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit, urlencode
+
+READ_PATHS = ('/api/videos?limit=50', '/', '/api/health')
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def reader(base: str, stop: threading.Event, latencies: list, errors: Counter):
+    i = 0
+    while not stop.is_set():
+        path = READ_PATHS[i % len(READ_PATHS)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base + path, timeout=30) as r:
+                r.read()
+            latencies.append(time.perf_counter() - t0)
+        except urllib.error.HTTPError as e:
+            errors[e.code] += 1
+        except OSError as e:
+            errors[type(e).__name__] += 1
+
+def slow_upload(base: str, data: bytes, rate_kbs: float, results: Counter, stop: threading.Event):
+    """Envia o vídeo em blocos de 16 KB respeitando a taxa pedida; repete até o fim do teste."""
+    parts = urlsplit(base)
+    block = 16 * 1024
+    delay = block / (rate_kbs * 1024) if rate_kbs > 0 else 0
+    while not stop.is_set():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        query = urlencode({'filename': 'loadtest.avi', 'filter': 'grayscale'})
+        try:
+            conn.putrequest('POST', f'/api/upload/stream?{query}')
+            conn.putheader('Content-Type', 'application/octet-stream')
+            conn.putheader('Content-Length', str(len(data)))
+            conn.endheaders()
+            for off in range(0, len(data), block):
+                conn.send(data[off:off + block])
+                if delay:
+                    time.sleep(delay)
+            resp = conn.getresponse()
+            resp.read()
+            results[resp.status] += 1
+            if resp.status == 503:
+                time.sleep(min(5, int(resp.getheader('Retry-After') or 1)))
+        except OSError as e:
+            results[type(e).__name__] += 1
+        finally:
+            conn.close()
+
+def _video_bytes(path: str | None) -> bytes:
+    if path:
+        return Path(path).read_bytes()
+    # Vídeo sintético pequeno (mesmo gerador dos benchmarks)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'server'))
+    from bench import synth_video
+    with tempfile.TemporaryDirectory() as d:
+        return synth_video(Path(d) / 'loadtest', 320, 240, 25, 2, 'xvid').read_bytes()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Teste de carga: catálogo x uploads lentos')
+    ap.add_argument('--url', default='http://localhost:5000')
+    ap.add_argument('--readers', type=int, default=8)
+    ap.add_argument('--uploads', type=int, default=4)
+    ap.add_argument('--rate', type=float, default=256, help='KB/s por upload (0 = sem limite)')
+    ap.add_argument('--duration', type=float, default=20)
+    ap.add_argument('--file', help='vídeo a enviar (padrão: sintético)')
+    args = ap.parse_args(argv)
+    base = args.url.rstrip('/')
+    data = _video_bytes(args.file)
+
+    def run(uploads: int) -> dict:
+        stop = threading.Event()
+        latencies, errors, results = [], Counter(), Counter()
+        threads = [threading.Thread(target=reader, args=(base, stop, latencies, errors), daemon=True)
+                   for _ in range(args.readers)]
+        threads += [threading.Thread(target=slow_upload, args=(base, data, args.rate, results, stop), daemon=True)
+                    for _ in range(uploads)]
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join(timeout=5)
+        return {
+            'reads': len(latencies),
+            'reads_per_sec': round(len(latencies) / args.duration, 1),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(max(latencies, default=0) * 1000, 1),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+            'read_errors': dict(errors),
+            'uploads': {str(k): v for k, v in results.items()},
+        }
+
+    # Linha de base: leituras sem uploads
+    print(f'Leituras sem uploads ({args.duration:.0f}s, {args.readers} leitores)...', flush=True)
+    idle = run(0)
+    print(json.dumps(idle, ensure_ascii=False))
+    print(f'Leituras com {args.uploads} uploads a {args.rate:g} KB/s...', flush=True)
+    loaded = run(args.uploads)
+    print(json.dumps(loaded, ensure_ascii=False))
+    if idle['p95_ms']:
+        print(f"p95 das leituras: {idle['p95_ms']} ms -> {loaded['p95_ms']} ms "
+              f"({loaded['p95_ms'] / idle['p95_ms']:.1f}x)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# client/catalog.py
+import bisect
+
+import requests
+
+class Catalog:
+    """Cópia local do catálogo do servidor, indexada por id e mantida por deltas de
+    GET /api/videos/changes: cada atualização traz só o que mudou desde o último cursor.
+
+    `fetch()` faz a parte de rede (pode rodar em outra thread) e `apply()` aplica o delta; as
+    duas não devem rodar ao mesmo tempo para o mesmo catálogo. A ordem de exibição é do mais
+    novo para o mais antigo (created_at, id), mantida por busca binária a cada alteração.
+    """
+    def __init__(self, base_url: str, session: requests.Session | None = None, fields: str = '',
+                 page_size: int = 2000):
+        self.base_url = base_url.rstrip('/')
+        self.http = session or requests.Session()
+        self.fields = fields
+        self.page_size = page_size
+        self.cursor = '0'
+        self.rows = {}    # id -> linha
+        self._keys = []   # (created_at, id) em ordem crescente
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _key(row: dict) -> tuple:
+        return (row.get('created_at') or '', row['id'])
+
+    def row_at(self, index: int) -> dict:
+        """Linha na posição `index` da exibição (0 = mais nova)."""
+        return self.rows[self._keys[len(self._keys) - 1 - index][1]]
+
+    def index_of(self, vid: str) -> int | None:
+        row = self.rows.get(vid)
+        if row is None:
+            return None
+        pos = bisect.bisect_left(self._keys, self._key(row))
+        return len(self._keys) - 1 - pos
+
+    def fetch(self) -> dict:
+        """Busca todas as alterações desde o cursor atual (várias páginas, se preciso).
+        Devolve o delta acumulado para `apply`; não altera o catálogo."""
+        cursor, changed, deleted = self.cursor, {}, set()
+        reset = False
+        while True:
+            params = {'since': cursor, 'limit': self.page_size}
+            if self.fields:
+                params['fields'] = self.fields
+            r = self.http.get(f'{self.base_url}/api/videos/changes', params=params, timeout=30)
+            r.raise_for_status()
+            page = r.json()
+            if page.get('reset') and not reset:
+                # Cursor de outro banco (servidor recriado): recomeça do zero
+                cursor, changed, deleted, reset = '0', {}, set(), True
+                continue
+            for row in page['changed']:
+                changed[row['id']] = row
+                deleted.discard(row['id'])
+            for vid in page['deleted']:
+                changed.pop(vid, None)
+                deleted.add(vid)
+            cursor = page['cursor']
+            if not page['more']:
+                break
+        return {'changed': list(changed.values()), 'deleted': list(deleted), 'cursor': cursor, 'reset': reset}
+
+    def apply(self, delta: dict) -> bool:
+        """Aplica um delta de `fetch`. Devolve True se algo mudou."""
+        if delta['reset']:
+            self.rows.clear()
+            self._keys.clear()
+        for vid in delta['deleted']:
+            self._remove(vid)
+        for row in delta['changed']:
+            old = self.rows.get(row['id'])
+            if old is not None and self._key(old) != self._key(row):
+                self._remove(row['id'])
+                old = None
+            self.rows[row['id']] = row
+            if old is None:
+                bisect.insort(self._keys, self._key(row))
+        self.cursor = delta['cursor']
+        return bool(delta['reset'] or delta['changed'] or delta['deleted'])
+
+    def _remove(self, vid: str):
+        row = self.rows.pop(vid, None)
+        if row is None:
+            return
+        pos = bisect.bisect_left(self._keys, self._key(row))
+        if pos < len(self._keys) and self._keys[pos][1] == vid:
+            del self._keys[pos]
@@ -1,34 +1,202 @@
 # client/client_tk.py
 import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, filedialog, messagebox
 import requests
+from requests.adapters import HTTPAdapter
 import os
-import cv2
+
+from catalog import Catalog
+from player import MediaCache, start_playback
+from uploader import ResumableUploader, UploadCancelled, PARALLEL_CHUNKS
 
 #Coloque seu IP aqui
 SERVER_BASE_URL = os.environ.get('SERVER_BASE_URL', 'http://0.0.0.0:5000')
+# Campos do histórico (a API devolve só estes em vez da linha inteira)
+HISTORY_FIELDS = 'id,created_at,original_name,filter,fps,width,height,duration_sec,checksum,original_url,processed_url,preview_url,hls_url'
+# Intervalo entre sincronizações automáticas do histórico (0 = só manual/após uploads)
+HISTORY_POLL_MS = int(os.environ.get('CLIENT_HISTORY_POLL_MS', '10000'))
+# Arquivos enviados ao mesmo tempo (cada um ainda manda PARALLEL_CHUNKS blocos em paralelo)
+PARALLEL_UPLOADS = int(os.environ.get('CLIENT_PARALLEL_UPLOADS', '3'))
+# Threads para as demais chamadas de rede (histórico etc.)
+NET_WORKERS = int(os.environ.get('CLIENT_NET_WORKERS', '2'))
+VIDEO_TYPES = [('Vídeos', '*.mp4 *.mov *.avi *.mkv')]
+
+def make_session(pool_size: int) -> requests.Session:
+    """Sessão HTTP única com keep-alive; o pool comporta todas as requisições simultâneas."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class Transfer:
+    """Um arquivo da fila de envio. Os campos só são alterados na thread do Tk."""
+    def __init__(self, path: str, filt: str):
+        self.path = path
+        self.filter = filt
+        self.cancel = threading.Event()
+        self.future = None
+        self.item = None
+        self.status = 'Na fila'
+        self.done = 0
+        try:
+            self.total = os.path.getsize(path)
+        except OSError:
+            self.total = 0
+        self.finished = False
+
+    @property
+    def progress_text(self) -> str:
+        pct = 100.0 * self.done / self.total if self.total else 0.0
+        return f'{self.done / 1e6:.1f} / {self.total / 1e6:.1f} MB ({pct:.0f}%)'
+
+class HistoryView(ttk.Frame):
+    """Treeview virtualizado: o widget só tem as linhas que cabem na tela e a barra de rolagem
+    percorre o catálogo inteiro, então desenhar custa o mesmo com 100 ou 100 mil vídeos.
+    A seleção é guardada pelo id do vídeo, não pela posição."""
+    HEADER_HEIGHT = 24
+
+    def __init__(self, master, catalog: Catalog, columns, format_row):
+        super().__init__(master)
+        self.catalog = catalog
+        self.format_row = format_row
+        self.top = 0
+        self.visible = 20
+        self.selected_id = None
+        self._ids = []  # id do vídeo em cada linha visível
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in columns], show='headings', selectmode='browse')
+        for name, text, width in columns:
+            self.tree.heading(name, text=text)
+            self.tree.column(name, width=width)
+        self.scroll = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scroll)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scroll.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.tree.bind('<Up>', lambda e: self._move(-1))
+        self.tree.bind('<Down>', lambda e: self._move(1))
+        self.tree.bind('<Prior>', lambda e: self._move(-self.visible))
+        self.tree.bind('<Next>', lambda e: self._move(self.visible))
+
+    def anchor(self):
+        """Id da primeira linha visível quando a lista está rolada (None no topo), para `redraw`
+        manter a mesma linha no topo quando chegam vídeos novos."""
+        return self._ids[0] if self.top > 0 and self._ids else None
+
+    def redraw(self, anchor=None):
+        n = len(self.catalog)
+        if anchor is not None:
+            index = self.catalog.index_of(anchor)
+            if index is not None:
+                self.top = index
+        self.top = max(0, min(self.top, n - self.visible))
+        count = min(self.visible, n - self.top)
+        items = self.tree.get_children()
+        for iid in items[count:]:
+            self.tree.delete(iid)
+        self._ids = []
+        selected = ()
+        for i in range(count):
+            row = self.catalog.row_at(self.top + i)
+            iid = items[i] if i < len(items) else self.tree.insert('', tk.END, iid=f'slot{i}')
+            self.tree.item(iid, values=self.format_row(row))
+            self._ids.append(row['id'])
+            if row['id'] == self.selected_id:
+                selected = (iid,)
+        self.tree.selection_set(selected)
+        self.scroll.set(self.top / n, (self.top + count) / n) if n else self.scroll.set(0, 1)
+
+    def scroll_by(self, rows: int):
+        self.top += rows
+        self.redraw()
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.top = int(float(amount) * len(self.catalog))
+        elif unit == 'pages':
+            self.top += int(amount) * self.visible
+        else:
+            self.top += int(amount)
+        self.redraw()
+
+    def _on_resize(self, event):
+        try:
+            row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        except (ValueError, tk.TclError):
+            row_height = 20
+        visible = max(1, (event.height - self.HEADER_HEIGHT) // row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.redraw()
+
+    def _on_select(self, _event):
+        sel = self.tree.selection()
+        # Seleção vazia = a linha escolhida saiu da tela; continua selecionada
+        if sel and sel[0] in self.tree.get_children():
+            index = self.tree.index(sel[0])
+            if index < len(self._ids):
+                self.selected_id = self._ids[index]
+
+    def _move(self, delta: int):
+        n = len(self.catalog)
+        if not n:
+            return 'break'
+        index = self.catalog.index_of(self.selected_id) if self.selected_id else None
+        index = self.top if index is None else max(0, min(n - 1, index + delta))
+        self.selected_id = self.catalog.row_at(index)['id']
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.visible:
+            self.top = index - self.visible + 1
+        self.redraw()
+        return 'break'
 
 class VideoClientApp(tk.Tk):
+    """Toda chamada de rede roda em pools de threads; os resultados voltam para a thread do Tk
+    via after() (ver `_post`). Os widgets só são tocados na thread do Tk."""
     def __init__(self):
         super().__init__()
         self.title('Cliente de Vídeo — Upload e Histórico')
-        self.geometry('900x600')
+        self.geometry('900x720')
 
         self.file_path = tk.StringVar()
         self.filter_var = tk.StringVar(value='grayscale')
 
+        self.http = make_session(PARALLEL_UPLOADS * PARALLEL_CHUNKS + NET_WORKERS + 2)
+        self.uploader = ResumableUploader(SERVER_BASE_URL, session=self.http)
+        self.upload_pool = ThreadPoolExecutor(PARALLEL_UPLOADS, thread_name_prefix='upload')
+        self.net_pool = ThreadPoolExecutor(NET_WORKERS, thread_name_prefix='net')
+        self.progress_text = tk.StringVar(value='')
+        self.status_text = tk.StringVar(value='')
+
+        self._transfers = {}          # iid da fila -> Transfer
+        self.catalog = Catalog(SERVER_BASE_URL, session=self.http, fields=HISTORY_FIELDS)
+        self.media_cache = MediaCache()
+        self._refreshing = False
+        self._refresh_again = False
+        self._refresh_timer = None
+        self._closing = False
+
         self._build_ui()
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
         self.refresh_history()
+        self.after(200, self._offer_resume)
 
     def _build_ui(self):
         frm = ttk.Frame(self, padding=12)
         frm.pack(fill=tk.BOTH, expand=True)
 
-        # Linha de seleção de arquivo
+        # Linha de seleção de arquivo (vários caminhos separados por os.pathsep)
         row1 = ttk.Frame(frm)
         row1.pack(fill=tk.X, pady=6)
-        ttk.Label(row1, text='Arquivo de vídeo:').pack(side=tk.LEFT)
+        ttk.Label(row1, text='Arquivos de vídeo:').pack(side=tk.LEFT)
         ttk.Entry(row1, textvariable=self.file_path, width=60).pack(side=tk.LEFT, padx=6)
         ttk.Button(row1, text='Escolher...', command=self.choose_file).pack(side=tk.LEFT)
 
@@ -36,25 +204,41 @@ class VideoClientApp(tk.Tk):
         row2 = ttk.Frame(frm)
         row2.pack(fill=tk.X, pady=6)
         ttk.Label(row2, text='Filtro:').pack(side=tk.LEFT)
-        ttk.Combobox(row2, textvariable=self.filter_var, values=['grayscale','pixelate','edges'], width=12, state='readonly').pack(side=tk.LEFT, padx=6)
+        ttk.Combobox(row2, textvariable=self.filter_var, values=['grayscale','pixelate','edges','pixelate+edges'], width=14, state='readonly').pack(side=tk.LEFT, padx=6)
         ttk.Button(row2, text='Enviar', command=self.upload).pack(side=tk.LEFT, padx=6)
         ttk.Button(row2, text='Atualizar Histórico', command=self.refresh_history).pack(side=tk.LEFT, padx=6)
 
+        # Fila de envios, com progresso por arquivo
+        self.queue_tree = ttk.Treeview(frm, columns=('file','filter','status','progress'), show='headings', height=6)
+        self.queue_tree.heading('file', text='Arquivo')
+        self.queue_tree.heading('filter', text='Filtro')
+        self.queue_tree.heading('status', text='Situação')
+        self.queue_tree.heading('progress', text='Progresso')
+        self.queue_tree.column('file', width=300)
+        self.queue_tree.column('filter', width=100)
+        self.queue_tree.column('status', width=220)
+        self.queue_tree.column('progress', width=180)
+        self.queue_tree.pack(fill=tk.X, pady=4)
+
+        row_queue = ttk.Frame(frm)
+        row_queue.pack(fill=tk.X)
+        ttk.Button(row_queue, text='Cancelar Selecionados', command=self.cancel_selected).pack(side=tk.LEFT, padx=4)
+        ttk.Button(row_queue, text='Cancelar Todos', command=self.cancel_all).pack(side=tk.LEFT, padx=4)
+        ttk.Button(row_queue, text='Limpar Finalizados', command=self.clear_finished).pack(side=tk.LEFT, padx=4)
+
+        # Progresso total da fila
+        row_prog = ttk.Frame(frm)
+        row_prog.pack(fill=tk.X, pady=6)
+        self.progress = ttk.Progressbar(row_prog, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Label(row_prog, textvariable=self.progress_text, width=36).pack(side=tk.LEFT, padx=6)
+
         # Tabela de histórico
-        self.tree = ttk.Treeview(frm, columns=('id','name','filter','fps','res','dur'), show='headings')
-        self.tree.heading('id', text='ID')
-        self.tree.heading('name', text='Arquivo')
-        self.tree.heading('filter', text='Filtro')
-        self.tree.heading('fps', text='FPS')
-        self.tree.heading('res', text='Resolução')
-        self.tree.heading('dur', text='Duração (s)')
-        self.tree.column('id', width=60)
-        self.tree.column('name', width=260)
-        self.tree.column('filter', width=80)
-        self.tree.column('fps', width=60)
-        self.tree.column('res', width=120)
-        self.tree.column('dur', width=100)
-        self.tree.pack(fill=tk.BOTH, expand=True, pady=8)
+        self.history = HistoryView(frm, self.catalog, [
+            ('id', 'ID', 60), ('name', 'Arquivo', 260), ('filter', 'Filtro', 80),
+            ('fps', 'FPS', 60), ('res', 'Resolução', 120), ('dur', 'Duração (s)', 100),
+        ], self._format_row)
+        self.history.pack(fill=tk.BOTH, expand=True, pady=8)
 
         # Botões de ação do histórico
         row3 = ttk.Frame(frm)
@@ -65,51 +249,194 @@ class VideoClientApp(tk.Tk):
         ttk.Button(row3, text='Reproduzir Original (OpenCV)', command=lambda: self.play_selected('original_url')).pack(side=tk.LEFT, padx=4)
         ttk.Button(row3, text='Reproduzir Processado (OpenCV)', command=lambda: self.play_selected('processed_url')).pack(side=tk.LEFT, padx=4)
 
+        ttk.Label(frm, textvariable=self.status_text, anchor=tk.W).pack(fill=tk.X, pady=(6, 0))
+
+    # ---- threads -> Tk ----
+    def _post(self, fn, *args):
+        """Agenda `fn(*args)` na thread do Tk; pode ser chamado de qualquer thread."""
+        if self._closing:
+            return
+        try:
+            self.after(0, fn, *args)
+        except (RuntimeError, tk.TclError):
+            pass  # janela já destruída
+
+    def _run_async(self, fn, on_done, on_error, *args):
+        """Roda `fn(*args)` no pool de rede e entrega o resultado (ou a exceção) na thread do Tk."""
+        def callback(fut):
+            err = fut.exception()
+            if err is not None:
+                self._post(on_error, err)
+            else:
+                self._post(on_done, fut.result())
+        self.net_pool.submit(fn, *args).add_done_callback(callback)
+
+    # ---- fila de envios ----
     def choose_file(self):
-        path = filedialog.askopenfilename(filetypes=[('Vídeos','*.mp4 *.mov *.avi *.mkv')])
-        if path:
-            self.file_path.set(path)
+        paths = filedialog.askopenfilenames(filetypes=VIDEO_TYPES)
+        if paths:
+            self.file_path.set(os.pathsep.join(paths))
 
     def upload(self):
-        path = self.file_path.get()
-        if not os.path.isfile(path):
-            messagebox.showerror('Erro', 'Selecione um arquivo válido')
+        paths = [p.strip() for p in self.file_path.get().split(os.pathsep) if p.strip()]
+        invalid = [p for p in paths if not os.path.isfile(p)]
+        if not paths or invalid:
+            messagebox.showerror('Erro', 'Selecione arquivos válidos' + (':\n\n' + '\n'.join(invalid) if invalid else ''))
             return
         filt = self.filter_var.get()
-        try:
-            with open(path, 'rb') as f:
-                files = {'file': (os.path.basename(path), f, 'application/octet-stream')}
-                data = {'filter': filt}
-                r = requests.post(f'{SERVER_BASE_URL}/api/upload', files=files, data=data, timeout=300)
-            r.raise_for_status()
-            resp = r.json()
-            messagebox.showinfo('Sucesso', f"Upload ok! ID: {resp.get('id')}")
-            self.refresh_history()
-        except Exception as e:
-            messagebox.showerror('Falha no upload', str(e))
+        for path in paths:
+            self._start_upload(path, filt)
+        self.file_path.set('')
+
+    def _start_upload(self, path, filt):
+        """Põe o arquivo na fila; o envio em blocos roda no pool de uploads."""
+        if any(t.path == path and not t.finished for t in self._transfers.values()):
+            return  # já está na fila (a sessão retomável é por caminho)
+        t = Transfer(path, filt)
+        t.item = self.queue_tree.insert('', tk.END, values=(os.path.basename(path), filt, t.status, t.progress_text))
+        self._transfers[t.item] = t
+        t.future = self.upload_pool.submit(self._run_transfer, t)
+        t.future.add_done_callback(lambda fut: self._post(self._transfer_finished, t, fut))
+        self._update_total()
+
+    def _run_transfer(self, t: Transfer):
+        if t.cancel.is_set():
+            raise UploadCancelled()
+        self._post(self._set_status, t, 'Enviando')
+        return self.uploader.upload(t.path, t.filter, cancel=t.cancel,
+                                    on_progress=lambda done, total: self._post(self._set_progress, t, done, total))
+
+    def _set_status(self, t: Transfer, status: str):
+        if not t.finished:
+            t.status = status
+            self._refresh_transfer(t)
+
+    def _set_progress(self, t: Transfer, done, total):
+        t.done, t.total = done, total
+        self._refresh_transfer(t)
+        self._update_total()
+
+    def _transfer_finished(self, t: Transfer, fut):
+        t.finished = True
+        err = None if fut.cancelled() else fut.exception()
+        if fut.cancelled():
+            t.status = 'Cancelado'
+        elif isinstance(err, UploadCancelled):
+            t.status = 'Cancelado (pode ser retomado)'
+        elif err is not None:
+            t.status = f'Falhou: {err}'
+        else:
+            resp = fut.result()
+            t.done = t.total
+            t.status = f"Concluído — {resp.get('status')} (job {str(resp.get('job_id') or '')[:8]})"
+            self._schedule_refresh()
+        self._refresh_transfer(t)
+        self._update_total()
+
+    def _refresh_transfer(self, t: Transfer):
+        if self.queue_tree.exists(t.item):
+            self.queue_tree.item(t.item, values=(os.path.basename(t.path), t.filter, t.status, t.progress_text))
+
+    def _update_total(self):
+        active = [t for t in self._transfers.values() if not t.finished]
+        counted = [t for t in self._transfers.values() if not t.finished or t.status.startswith('Concluído')]
+        done = sum(t.done for t in counted)
+        total = sum(t.total for t in counted)
+        pct = 100.0 * done / total if total else 0.0
+        self.progress['value'] = pct
+        if active:
+            self.progress_text.set(f'{len(active)} na fila — {done / 1e6:.1f} / {total / 1e6:.1f} MB ({pct:.0f}%)')
+        else:
+            self.progress_text.set('Fila vazia' if not self._transfers else 'Fila concluída')
+
+    def cancel_selected(self):
+        self._cancel([self._transfers[i] for i in self.queue_tree.selection() if i in self._transfers])
+
+    def cancel_all(self):
+        self._cancel(list(self._transfers.values()))
+
+    def _cancel(self, transfers):
+        for t in transfers:
+            if t.finished:
+                continue
+            t.cancel.set()
+            # Se ainda não começou sai da fila na hora; senão para antes do próximo bloco
+            if not t.future.cancel():
+                self._set_status(t, 'Cancelando...')
+
+    def clear_finished(self):
+        for iid, t in list(self._transfers.items()):
+            if t.finished:
+                self.queue_tree.delete(iid)
+                del self._transfers[iid]
+        self._update_total()
+
+    def _offer_resume(self):
+        pending = self.uploader.pending()
+        if not pending:
+            return
+        names = '\n'.join(os.path.basename(p['path']) for p in pending)
+        if messagebox.askyesno('Uploads pendentes', f'Retomar uploads interrompidos?\n\n{names}'):
+            for p in pending:
+                self._start_upload(p['path'], p['filter'])
+
+    def on_close(self):
+        """Cancela a fila (os envios em andamento ficam retomáveis) e fecha sem esperar a rede."""
+        self._closing = True
+        for t in self._transfers.values():
+            t.cancel.set()
+        self.upload_pool.shutdown(wait=False, cancel_futures=True)
+        self.net_pool.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
+
+    # ---- histórico ----
+    def _schedule_refresh(self, delay_ms: int = 1000):
+        """Vários uploads terminando juntos geram uma única atualização do histórico."""
+        if self._refresh_timer is not None:
+            self.after_cancel(self._refresh_timer)
+        self._refresh_timer = self.after(delay_ms, self.refresh_history)
 
     def refresh_history(self):
-        try:
-            r = requests.get(f'{SERVER_BASE_URL}/api/videos?limit=200', timeout=30)
-            r.raise_for_status()
-            rows = r.json()
-            # Limpa tabela
-            for i in self.tree.get_children():
-                self.tree.delete(i)
-            self._rows_cache = rows
-            for v in rows:
-                res = f"{v.get('width')}x{v.get('height')}"
-                self.tree.insert('', tk.END, values=(v.get('id','')[:8], v.get('original_name'), v.get('filter'), f"{v.get('fps',0):.1f}", res, f"{v.get('duration_sec',0):.2f}"))
-        except Exception as e:
-            messagebox.showerror('Erro', str(e))
+        """Busca só as alterações desde a última sincronização e as aplica na cópia local."""
+        if self._refresh_timer is not None:
+            self.after_cancel(self._refresh_timer)
+            self._refresh_timer = None
+        if self._refreshing:
+            self._refresh_again = True
+            return
+        self._refreshing = True
+        self._run_async(self.catalog.fetch, self._apply_history, self._history_failed)
+
+    @staticmethod
+    def _format_row(v):
+        res = f"{v.get('width')}x{v.get('height')}"
+        return (v.get('id','')[:8], v.get('original_name'), v.get('filter'), f"{v.get('fps') or 0:.1f}", res, f"{v.get('duration_sec') or 0:.2f}")
+
+    def _apply_history(self, delta):
+        anchor = self.history.anchor()
+        if self.catalog.apply(delta):
+            self.history.redraw(anchor)
+        self.status_text.set(f'{len(self.catalog)} vídeos no histórico')
+        self._history_done()
+
+    def _history_failed(self, err):
+        self.status_text.set(f'Falha ao atualizar o histórico: {err}')
+        self._history_done()
+
+    def _history_done(self):
+        self._refreshing = False
+        if self._refresh_again:
+            self._refresh_again = False
+            self.refresh_history()
+        elif self._refresh_timer is None and HISTORY_POLL_MS:
+            self._refresh_timer = self.after(HISTORY_POLL_MS, self.refresh_history)
 
     def _get_selected_row(self):
-        sel = self.tree.selection()
-        if not sel:
+        row = self.catalog.rows.get(self.history.selected_id)
+        if not row:
             messagebox.showwarning('Atenção', 'Selecione uma linha do histórico')
             return None
-        idx = self.tree.index(sel[0])
-        return self._rows_cache[idx]
+        return row
 
     def open_selected(self, key):
         import webbrowser
@@ -130,23 +457,17 @@ class VideoClientApp(tk.Tk):
         if not url:
             messagebox.showwarning('Atenção', 'URL não disponível')
             return
-        threading.Thread(target=self._play_stream, args=(url,), daemon=True).start()
+        self.status_text.set('Abrindo vídeo...')
+        # Erros do player chegam da thread dele: a caixa de mensagem abre na thread do Tk
+        self._run_async(start_playback, self._play_started, self._play_failed,
+                        row, key, self.http, self.media_cache, lambda msg: self._post(self._play_failed, msg))
 
-    def _play_stream(self, url):
-        cap = cv2.VideoCapture(url)
-        if not cap.isOpened():
-            messagebox.showerror('Erro', 'Não foi possível abrir o vídeo para reprodução')
-            return
-        win = 'Reprodução (ESC para sair)'
-        while True:
-            ok, frame = cap.read()
-            if not ok:
-                break
-            cv2.imshow(win, frame)
-            if cv2.waitKey(1) & 0xFF == 27:
-                break
-        cap.release()
-        cv2.destroyWindow(win)
+    def _play_started(self, _player):
+        self.status_text.set('')
+
+    def _play_failed(self, err):
+        self.status_text.set('')
+        messagebox.showerror('Erro', str(err))
 
 if __name__ == '__main__':
     app = VideoClientApp()
@@ -0,0 +1,265 @@
+# client/player.py
+"""Reprodução no cliente.
+
+- `MediaCache`: mídia baixada fica em disco, por id do vídeo e URL; repetir um vídeo não usa a rede.
+- `Player`: uma thread decodifica e enche um buffer limitado de quadros; outra apresenta cada
+  quadro no seu PTS (relógio de parede), descartando quadros atrasados em vez de atrasar o vídeo.
+- `start_playback`: toca do cache se já houver o arquivo; senão começa pela menor rendition HLS
+  (ou pelo próprio arquivo via HTTP) enquanto baixa o arquivo completo, e troca para ele ao terminar.
+
+Erros são entregues pelo callback `on_error`; o player nunca toca na interface Tk.
+"""
+import hashlib
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import cv2
+import requests
+
+CACHE_DIR = Path(os.environ.get('CLIENT_CACHE_DIR', str(Path.home() / '.video_client_cache')))
+CACHE_MAX_BYTES = int(os.environ.get('CLIENT_CACHE_MAX_MB', '2048')) * 1024 * 1024
+# Quadros decodificados à frente da apresentação
+BUFFER_FRAMES = int(os.environ.get('CLIENT_PLAYER_BUFFER', '48'))
+# Atraso (s) a partir do qual um quadro é descartado para alcançar o relógio
+LATE_DROP_SEC = 0.05
+DOWNLOAD_BLOCK = 1024 * 1024
+
+class MediaCache:
+    """Arquivos de mídia baixados, em <dir>/<id>/<tipo>-<hash do caminho da URL><ext>. O servidor
+    serve /media como imutável (cada caminho tem um conteúdo só), então o caminho identifica o
+    arquivo: saídas diferentes do mesmo upload não se sobrescrevem. O download vai para um
+    .part (retomado com Range se interrompido) e só é renomeado quando completo. Passando de
+    `max_bytes`, apaga os arquivos usados há mais tempo."""
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def path_for(self, vid: str, kind: str, url: str) -> Path:
+        media_path = urlsplit(url).path
+        ext = Path(media_path).suffix or '.bin'
+        return self.root / vid / f"{kind}-{hashlib.sha1(media_path.encode('utf-8')).hexdigest()[:16]}{ext}"
+
+    def get(self, path: Path) -> Path | None:
+        """O arquivo, se já estiver completo no cache (e marca como usado agora)."""
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def download(self, url: str, path: Path, session: requests.Session, cancel: threading.Event | None = None) -> Path | None:
+        """Baixa `url` para `path`. Devolve None se outro download do mesmo arquivo já estiver em
+        andamento ou se `cancel` for setado (o .part fica para continuar depois)."""
+        with self._lock:
+            if path in self._active:
+                return None
+            self._active.add(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            part = path.with_name(path.name + '.part')
+            for _ in range(2):
+                offset = part.stat().st_size if part.exists() else 0
+                headers = {'Range': f'bytes={offset}-'} if offset else {}
+                with session.get(url, headers=headers, stream=True, timeout=30) as r:
+                    if r.status_code == 416:
+                        part.unlink(missing_ok=True)  # .part maior que o arquivo (mudou no servidor)
+                        continue
+                    r.raise_for_status()
+                    with open(part, 'ab' if offset and r.status_code == 206 else 'wb') as f:
+                        for block in r.iter_content(DOWNLOAD_BLOCK):
+                            if cancel is not None and cancel.is_set():
+                                return None
+                            f.write(block)
+                part.replace(path)
+                self._evict(keep=path)
+                return path
+            return None
+        finally:
+            with self._lock:
+                self._active.discard(path)
+
+    def _evict(self, keep: Path):
+        files = []
+        for p in self.root.rglob('*'):
+            if p.is_file() and not p.name.endswith('.part'):
+                st = p.stat()
+                files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files, key=lambda f: f[0]):
+            if total <= self.max_bytes:
+                break
+            if p != keep:
+                p.unlink(missing_ok=True)
+                total -= size
+
+class Player:
+    """Um vídeo numa janela do OpenCV (ESC ou fechar a janela encerra)."""
+    def __init__(self, source: str, title: str = 'Reprodução (ESC para sair)', on_error=None,
+                 buffer_frames: int = BUFFER_FRAMES):
+        self.source = source
+        self.title = title
+        self.on_error = on_error
+        self.stopped = threading.Event()
+        self.dropped = 0
+        self._frames = queue.Queue(maxsize=max(1, buffer_frames))
+        self._switch = None
+        self._switch_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._present, daemon=True, name='player').start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def switch_to(self, source: str):
+        """Passa a decodificar de `source` a partir do ponto atual (mesma linha do tempo)."""
+        with self._switch_lock:
+            self._switch = source
+
+    # ---- decodificação ----
+    def _put(self, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self._frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            self._put((None, 'Não foi possível abrir o vídeo para reprodução'))
+            return
+        step = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        last_pts = None
+        seeking = False  # depois de uma troca, pula até alcançar o ponto onde estava
+        try:
+            while not self.stopped.is_set():
+                with self._switch_lock:
+                    source, self._switch = self._switch, None
+                if source is not None:
+                    new = cv2.VideoCapture(source)
+                    if new.isOpened():
+                        if last_pts:
+                            new.set(cv2.CAP_PROP_POS_MSEC, last_pts * 1000.0)
+                        cap.release()
+                        cap = new
+                        seeking = last_pts is not None
+                        step = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                pts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if seeking:
+                    if pts <= last_pts:
+                        continue  # o seek cai no quadro-chave anterior ao ponto da troca
+                    seeking = False
+                elif last_pts is not None:
+                    if pts <= last_pts:
+                        pts = last_pts + step  # fonte sem PTS confiável
+                last_pts = pts
+                if not self._put((pts, frame)):
+                    break
+        finally:
+            cap.release()
+        self._put((None, None))
+
+    # ---- apresentação ----
+    def _present(self):
+        threading.Thread(target=self._decode, daemon=True, name='player-decode').start()
+        clock = None  # (instante, pts) de referência
+        shown = False
+        try:
+            while not self.stopped.is_set():
+                stalled = self._frames.empty()
+                try:
+                    pts, frame = self._frames.get(timeout=0.05)
+                except queue.Empty:
+                    if shown and not self._pump(1):
+                        break
+                    continue
+                if frame is None or isinstance(frame, str):
+                    if frame and self.on_error:
+                        self.on_error(frame)
+                    break
+                now = time.perf_counter()
+                if clock is None:
+                    clock = (now, pts)
+                delay = clock[0] + (pts - clock[1]) - now
+                if delay < 0 and stalled:
+                    # Buffer tinha esvaziado (rede/decodificação lenta): retoma daqui, sem pular quadros
+                    clock, delay = (now, pts), 0
+                elif delay < -LATE_DROP_SEC:
+                    self.dropped += 1
+                    continue
+                if delay > 0:
+                    if shown and not self._pump(int(delay * 1000)):
+                        break
+                    if not shown:
+                        time.sleep(delay)
+                cv2.imshow(self.title, frame)
+                shown = True
+                if not self._pump(1):
+                    break
+        finally:
+            self.stopped.set()
+            if shown:
+                cv2.destroyWindow(self.title)
+
+    def _pump(self, wait_ms: int) -> bool:
+        """Processa eventos da janela por até `wait_ms`; False se o usuário encerrou."""
+        if cv2.waitKey(max(1, wait_ms)) & 0xFF == 27:
+            return False
+        return cv2.getWindowProperty(self.title, cv2.WND_PROP_VISIBLE) >= 1
+
+def preview_source(row: dict, key: str, session: requests.Session) -> str | None:
+    """Menor rendition HLS do vídeo processado, se houver: pouca banda, começa a tocar rápido."""
+    url = row.get('hls_url')
+    if key != 'processed_url' or not url:
+        return None
+    try:
+        r = session.get(url, timeout=10)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None
+    best, bandwidth = None, None
+    lines = r.text.splitlines()
+    for i, line in enumerate(lines[:-1]):
+        if not line.startswith('#EXT-X-STREAM-INF'):
+            continue
+        attrs = dict(a.split('=', 1) for a in line.split(':', 1)[1].split(',') if '=' in a)
+        bw = int(attrs.get('BANDWIDTH', '0') or 0)
+        if bandwidth is None or bw < bandwidth:
+            best, bandwidth = lines[i + 1].strip(), bw
+    return urljoin(url, best) if best else None
+
+def start_playback(row: dict, key: str, session: requests.Session, cache: MediaCache, on_error=None) -> Player:
+    """Toca `row[key]` (original_url ou processed_url). Faz rede: chamar fora da thread do Tk."""
+    url = row[key]
+    kind = key.removesuffix('_url')
+    title = f"{row.get('original_name') or row['id'][:8]} [{kind}] (ESC para sair)"
+    path = cache.path_for(row['id'], kind, url)
+    local = cache.get(path)
+    if local is not None:
+        return Player(str(local), title, on_error).start()
+
+    player = Player(preview_source(row, key, session) or url, title, on_error).start()
+
+    def fetch():
+        try:
+            done = cache.download(url, path, session)
+        except (requests.RequestException, OSError):
+            return  # a reprodução continua pela rede; o cache fica para a próxima
+        if done is not None and not player.stopped.is_set():
+            player.switch_to(str(done))
+
+    threading.Thread(target=fetch, daemon=True, name='player-download').start()
+    return player
@@ -0,0 +1,154 @@
+# client/uploader.py
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+
+CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+PARALLEL_CHUNKS = int(os.environ.get('UPLOAD_PARALLEL_CHUNKS', '4'))
+CHUNK_RETRIES = 5
+# Sessões em andamento, para retomar depois de fechar o cliente
+STATE_FILE = Path(os.environ.get('UPLOAD_STATE_FILE', str(Path.home() / '.video_client_uploads.json')))
+
+class UploadCancelled(Exception):
+    pass
+
+class ResumableUploader:
+    """Cliente do protocolo de upload retomável do servidor.
+
+    POST /api/uploads abre a sessão, os blocos vão em PUT paralelos com offset e SHA-1,
+    GET /api/uploads/<id> diz o que já chegou e POST /api/uploads/<id>/finalize monta o arquivo.
+    A sessão de cada arquivo fica salva em STATE_FILE; um novo envio do mesmo arquivo
+    (mesmo caminho, tamanho e data de modificação) continua de onde parou.
+    """
+    def __init__(self, base_url: str, session: requests.Session | None = None,
+                 chunk_size: int = CHUNK_SIZE, parallel: int = PARALLEL_CHUNKS, state_file: Path = STATE_FILE):
+        self.base_url = base_url.rstrip('/')
+        self.http = session or requests.Session()
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.state_file = state_file
+        self._state_lock = threading.Lock()
+
+    # ---- estado local ----
+    def _load_state(self) -> dict:
+        try:
+            return json.loads(self.state_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: dict):
+        tmp = self.state_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding='utf-8')
+        tmp.replace(self.state_file)
+
+    def _remember(self, path: str, entry: dict | None):
+        with self._state_lock:
+            state = self._load_state()
+            if entry is None:
+                state.pop(path, None)
+            else:
+                state[path] = entry
+            self._save_state(state)
+
+    @staticmethod
+    def _fingerprint(path: str) -> dict:
+        st = os.stat(path)
+        return {'size': st.st_size, 'mtime': st.st_mtime}
+
+    def pending(self) -> list:
+        """Uploads interrompidos cujo arquivo ainda existe sem alterações."""
+        out = []
+        for path, entry in self._load_state().items():
+            try:
+                if self._fingerprint(path) == entry.get('fingerprint'):
+                    out.append({'path': path, **entry})
+            except OSError:
+                continue
+        return out
+
+    # ---- protocolo ----
+    def _open_session(self, path: str, filt: str) -> dict:
+        fp = self._fingerprint(path)
+        entry = self._load_state().get(path)
+        if entry and entry.get('fingerprint') == fp and entry.get('filter') == filt:
+            r = self.http.get(f"{self.base_url}/api/uploads/{entry['session']}", timeout=30)
+            if r.ok and r.json().get('status') == 'open':
+                return r.json()
+        r = self.http.post(f"{self.base_url}/api/uploads", json={
+            'filename': os.path.basename(path), 'size': fp['size'], 'filter': filt, 'chunk_size': self.chunk_size,
+        }, timeout=30)
+        r.raise_for_status()
+        info = r.json()
+        self._remember(path, {'session': info['id'], 'filter': filt, 'fingerprint': fp})
+        return info
+
+    def _send_chunk(self, sid: str, path: str, offset: int, length: int, cancel: threading.Event | None):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        digest = hashlib.sha1(data).hexdigest()
+        self._request('put', f"{self.base_url}/api/uploads/{sid}", cancel, params={'offset': offset}, data=data,
+                      headers={'X-Chunk-SHA1': digest, 'Content-Type': 'application/octet-stream'}, timeout=120)
+        return length
+
+    def _request(self, method: str, url: str, cancel: threading.Event | None, **kwargs) -> requests.Response:
+        """Requisição com até CHUNK_RETRIES tentativas para erros de rede e 5xx (esperando o
+        Retry-After do 503 de servidor sobrecarregado, se vier). Erros 4xx sobem na hora."""
+        for attempt in range(CHUNK_RETRIES):
+            if cancel is not None and cancel.is_set():
+                raise UploadCancelled()
+            wait = 2 ** attempt
+            try:
+                r = self.http.request(method, url, **kwargs)
+                if r.status_code < 500:
+                    r.raise_for_status()
+                    return r
+                if r.headers.get('Retry-After', '').isdigit():
+                    wait = int(r.headers['Retry-After'])
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == CHUNK_RETRIES - 1:
+                    raise
+            if cancel is not None:
+                cancel.wait(min(30, wait))
+            else:
+                time.sleep(min(30, wait))
+        r.raise_for_status()
+        return r
+
+    def upload(self, path: str, filt: str, on_progress=None, cancel: threading.Event | None = None) -> dict:
+        """Envia (ou retoma) o arquivo e devolve a resposta do finalize.
+        `on_progress(bytes_enviados, total)` é chamado da thread de upload. Com `cancel` setado, para
+        antes do próximo bloco com UploadCancelled (a sessão continua salva e pode ser retomada)."""
+        if cancel is not None and cancel.is_set():
+            raise UploadCancelled()
+        info = self._open_session(path, filt)
+        sid, size, chunk = info['id'], info['size'], info['chunk_size']
+        done = info['bytes_received']
+        if on_progress:
+            on_progress(done, size)
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            futures = [pool.submit(self._send_chunk, sid, path, off, min(chunk, size - off), cancel)
+                       for off in info['missing']]
+            try:
+                for fut in as_completed(futures):
+                    done += fut.result()
+                    if on_progress:
+                        on_progress(done, size)
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                raise
+
+        if cancel is not None and cancel.is_set():
+            raise UploadCancelled()
+        # O finalize também passa pelo limite de requisições pesadas do servidor (503 + Retry-After)
+        r = self._request('post', f"{self.base_url}/api/uploads/{sid}/finalize", cancel, timeout=300)
+        self._remember(path, None)
+        return r.json()
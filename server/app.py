@@ -1,131 +1,836 @@
+import hashlib
+import json
+import mimetypes
 import os
+import threading
+import time
 import uuid
-from flask import Flask, request, jsonify, send_from_directory, abort, render_template_string
+from collections import OrderedDict
+from functools import wraps
+from flask import Flask, Response, request, jsonify, send_file, abort, make_response, g
+from werkzeug.security import safe_join
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlencode
 
-from config import MEDIA_ROOT, DB_PATH, ALLOWED_EXTS, SERVER_HOST, SERVER_PORT, SERVER_DEBUG
-from db import init_db, insert_video, list_videos, get_video
+from config import (
+    MEDIA_ROOT, DB_PATH, ALLOWED_EXTS, SERVER_HOST, SERVER_PORT, SERVER_DEBUG, JOB_WORKERS, MAX_UPLOAD_BYTES,
+    UPLOAD_CHUNK_SIZE, UPLOAD_MAX_CHUNK_SIZE, MEDIA_CACHE_MAX_AGE, MEDIA_ACCEL, MEDIA_ACCEL_PREFIX, OUTPUT_HLS,
+    API_MAX_PAGE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, THUMB_WIDTHS, GALLERY_PAGE_SIZE, OUTPUT_TARGET,
+    HEAVY_CONCURRENCY, HEAVY_SLOT_WAIT, MAX_QUEUED_JOBS, RETRY_AFTER_SEC, CHANGES_MAX_PAGE,
+    MEDIA_CHECKSUM_CACHE_SIZE,
+)
+from db import (
+    init_db, list_videos, get_video, get_job, get_latest_job_for_video, find_video_by_checksum,
+    insert_upload_session, get_upload_session, update_upload_session, claim_upload_session,
+    record_upload_chunk, list_upload_chunks, list_outputs, encode_cursor, search_videos,
+    catalog_revision, count_jobs, video_changes, COLUMNS, RANGE_COLUMNS,
+)
 from storage import (
-    ensure_media_root, save_incoming, move_to_final_structure,
-    write_meta_json, generate_thumbnails, generate_preview_gif, public_paths_for,
+    ensure_media_root, ingest_stream, IngestError, public_paths_for,
+    create_upload_file, write_upload_chunk, finish_upload_file, small_thumb_path, small_thumbnail,
 )
-from processing import process_video, probe_video
+from processing import probe_video, file_sha1, parse_target
+from encoders import EncoderSettings
+from filters import build_chain, describe_filters
+from dedup import store_original, stats as dedup_stats
+from cache import ResponseCache, CachedResponse
+from metrics import counter, histogram, render as render_metrics
+from jobs import enqueue_job, public_job, start_workers, plan_outputs, finish_video, refresh_meta_outputs
+from lifecycle import LifecycleError, trash_video, warm, touch, quota_error, storage_report, start_gc
+
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
 
 app = Flask(__name__)
+# Uploads multipart acima do limite são recusados pelo Werkzeug antes de serem lidos
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+app.config['USE_X_SENDFILE'] = MEDIA_ACCEL == 'sendfile'
 
 def allowed_file(filename: str):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTS
 
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+REQUEST_SECONDS = histogram('video_http_request_seconds', 'Latência das requisições por endpoint', ['endpoint', 'method'])
+REQUESTS = counter('video_http_requests_total', 'Requisições por endpoint e status', ['endpoint', 'method', 'status'])
+MEDIA_BYTES = counter('video_media_bytes_served_total', 'Bytes entregues por /media (exceto via nginx)', ['kind'])
+UPLOAD_STAGE_SECONDS = histogram('video_upload_stage_seconds', 'Etapas do upload no servidor web', ['stage'])
+UPLOAD_BYTES = counter('video_upload_bytes_total', 'Bytes de vídeo recebidos', ['endpoint'])
+SHED = counter('video_http_shed_total', 'Requisições pesadas recusadas com 503', ['reason'])
+
+_heavy_slots = threading.BoundedSemaphore(HEAVY_CONCURRENCY)
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(resp):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Rótulo pela regra da rota (/api/videos/<vid>), não pela URL: cardinalidade fixa
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=resp.status_code)
+    return resp
+
+def catalog_cached(view):
+    """Respostas do catálogo: servidas do cache enquanto a revisão do catálogo não muda, sempre com
+    ETag (If-None-Match igual responde 304). Só respostas 200 são guardadas."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        rev = catalog_revision()
+        key = request.full_path
+        entry = response_cache.get(key, rev)
+        if entry is None:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            body = resp.get_data()
+            headers = {k: resp.headers[k] for k in ('X-Next-Cursor', 'Link') if k in resp.headers}
+            entry = CachedResponse(body, resp.mimetype, hashlib.sha1(body).hexdigest(), headers, rev)
+            response_cache.put(key, entry)
+        resp = Response(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+        resp.set_etag(entry.etag)
+        # O cliente pode guardar, mas revalida sempre (barato: 304 sem corpo)
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
+    return wrapper
+
+def _overloaded(reason: str, message: str):
+    SHED.inc(reason=reason)
+    resp = jsonify({"error": message, "retry_after": RETRY_AFTER_SEC})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(RETRY_AFTER_SEC)
+    return resp
+
+def heavy(check_backlog: bool = True):
+    """Requisições pesadas (gravam o vídeo em disco e/ou enfileiram processamento): no máximo
+    HEAVY_CONCURRENCY ao mesmo tempo, para que uploads lentos não ocupem todas as threads do
+    servidor e o catálogo/mídia continuem respondendo. Com `check_backlog`, recusa também quando a
+    fila de jobs passou de MAX_QUEUED_JOBS. Nos dois casos: 503 + Retry-After, antes de ler o corpo."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if check_backlog and MAX_QUEUED_JOBS:
+                queued = count_jobs('queued')
+                if queued >= MAX_QUEUED_JOBS:
+                    return _overloaded('backlog', f"Fila de processamento cheia ({queued} jobs); tente mais tarde")
+            if not _heavy_slots.acquire(timeout=HEAVY_SLOT_WAIT):
+                return _overloaded('concurrency', "Servidor ocupado com outros uploads; tente mais tarde")
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _heavy_slots.release()
+        return wrapper
+    return decorator
+
 # ==========================
 # Endpoints
 # ==========================
 
 @app.route('/api/health')
 def health():
-    return {"ok": True, "time": datetime.utcnow().isoformat() + "Z"}
+    return {"ok": True, "time": datetime.utcnow().isoformat() + "Z", "queued_jobs": count_jobs('queued')}
+
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato texto do Prometheus (servidor web + snapshots dos workers)."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def _want_hls(value) -> bool:
+    if value is None:
+        return OUTPUT_HLS
+    return str(value).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+def _filter_specs(*values, default: str | None = 'grayscale') -> list:
+    """Junta os filtros pedidos: valores repetidos e/ou listas separadas por vírgula, sem repetir.
+    Sem nenhum filtro, vale `default`."""
+    specs = []
+    for value in values:
+        for item in (value if isinstance(value, (list, tuple)) else [value]):
+            for spec in str(item or '').split(','):
+                spec = spec.strip().lower()
+                if spec and spec not in specs:
+                    specs.append(spec)
+    return specs or ([default] if default else [])
+
+def _parse_filters(specs: list, raw_params) -> list:
+    """Valida os filtros pedidos ("a" ou "a+b" cada) e seus parâmetros (objeto JSON ou string JSON,
+    no formato {"filtro": {...}}, valendo para todas as cadeias). Devolve uma FilterChain por filtro."""
+    if isinstance(raw_params, str):
+        try:
+            raw_params = json.loads(raw_params) if raw_params.strip() else {}
+        except ValueError:
+            raise ValueError("Campo 'params' não é um JSON válido")
+    if raw_params is not None and not isinstance(raw_params, dict):
+        raise ValueError("Campo 'params' deve ser um objeto")
+    chains = []
+    for spec in specs:
+        chain = build_chain(spec, raw_params)
+        if chain.name not in {c.name for c in chains}:
+            chains.append(chain)
+    return chains
+
+def _parse_encoder(raw) -> EncoderSettings:
+    """Configuração de codificação pedida (objeto JSON ou string JSON com backend, codec, preset,
+    crf, threads e audio); campos ausentes usam os padrões do config."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw) if raw.strip() else None
+        except ValueError:
+            raise ValueError("Campo 'encoder' não é um JSON válido")
+    return EncoderSettings.from_params(raw)
+
+def _parse_target(raw) -> str | None:
+    """Resolução/fps de saída pedidos ("720p@24", "480p", "@15", "source"); sem valor vale OUTPUT_TARGET."""
+    return parse_target(OUTPUT_TARGET if raw is None else str(raw))
+
+def _chain_params(chains: list) -> dict:
+    params = {}
+    for chain in chains:
+        params.update(chain.params())
+    return params
+
+def _register_upload(vid: str, paths: dict, original_name: str, mime_type, sha1: str, chains: list,
+                     hls: bool = OUTPUT_HLS, encoder: EncoderSettings | None = None,
+                     target: str | None = None, timings: dict | None = None):
+    """Depois que o original está gravado: deduplica, reaproveita resultados em cache e enfileira
+    um único job para os filtros que faltam. O primeiro filtro é o principal do vídeo.
+    `timings` (segundos por etapa já feita no upload) segue no job até o meta.json."""
+    timings = dict(timings or {})
+    with UPLOAD_STAGE_SECONDS.time(stage='register') as t:
+        store_original(sha1, paths['path_original'])
+
+        encoder = encoder or EncoderSettings()
+        codec = encoder.cache_tag(paths['path_original'].name)
+        primary = chains[0]
+        cached, pending = plan_outputs(vid, paths, sha1, chains, codec, hls, primary.name, target)
+    timings['register_sec'] = round(t.elapsed, 4)
+    params = {
+        "kind": "upload",
+        "filter": primary.name,
+        "filters": [c.name for c in chains],
+        "filter_params": primary.params(),
+        "outputs": pending,
+        "original_name": original_name,
+        "mime_type": mime_type,
+        "ext": paths['ext'],
+        "dir_uuid": str(paths['dir_uuid']),
+        "path_original": str(paths['path_original']),
+        "sha1": sha1,
+        "codec": codec,
+        "encoder": encoder.to_dict(),
+        "target": target,
+        "hls": hls,
+        "timings": timings,
+        "created_at": datetime.utcnow().isoformat() + 'Z',
+    }
+
+    # Mesmos bytes + mesmos filtros já processados: responde na hora com os arquivos existentes
+    if not pending:
+        source = find_video_by_checksum(sha1) or probe_video(paths['path_original'], sha1)
+        meta = finish_video(vid, params, source, {'cached': True}, timings)
+        return jsonify({
+            "ok": True,
+            "id": vid,
+            "status": "done",
+            "cached": True,
+            "filter": primary.name,
+            "filters": params['filters'],
+            **public_paths_for(meta),
+            "outputs": _public_outputs(meta),
+            "detail_url": f"/api/videos/{vid}",
+        })
+
+    job_id = enqueue_job(vid, params)
+
+    return jsonify({
+        "ok": True,
+        "id": vid,
+        "job_id": job_id,
+        "status": "queued",
+        "filter": primary.name,
+        "filters": params['filters'],
+        "cached_filters": cached,
+        "hls": hls,
+        "job_url": f"/api/jobs/{job_id}",
+        "status_url": f"/api/videos/{vid}/status",
+        "detail_url": f"/api/videos/{vid}",
+    }), 202
 
 @app.route('/api/upload', methods=['POST'])
+@heavy()
 def upload():
     if 'file' not in request.files:
         return jsonify({"error": "Campo 'file' ausente"}), 400
 
     f = request.files['file']
-    chosen_filter = (request.form.get('filter') or 'grayscale').strip().lower()
     if f.filename == '':
         return jsonify({"error": "Arquivo não selecionado"}), 400
     if not allowed_file(f.filename):
         return jsonify({"error": f"Extensão não permitida: {f.filename}"}), 400
+    quota = quota_error(request.content_length or 0)
+    if quota:
+        return jsonify({"error": quota}), 507
+    try:
+        chains = _parse_filters(_filter_specs(request.form.getlist('filter'), request.form.get('filters')),
+                                request.form.get('params'))
+        encoder = _parse_encoder(request.form.get('encoder'))
+        target = _parse_target(request.form.get('target'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     ensure_media_root()
-    incoming_path, original_name = save_incoming(f)
-
     vid = str(uuid.uuid4())
-    paths = move_to_final_structure(incoming_path, vid, original_name)
+    try:
+        with UPLOAD_STAGE_SECONDS.time(stage='ingest') as t:
+            paths, sha1, size = ingest_stream(f.stream, vid, f.filename)
+    except IngestError as e:
+        return jsonify({"error": str(e)}), e.status
+    UPLOAD_BYTES.inc(size, endpoint='multipart')
 
-    meta_probe = probe_video(paths['path_original'])
+    return _register_upload(vid, paths, f.filename, getattr(f, 'mimetype', None), sha1, chains,
+                            hls=_want_hls(request.form.get('hls')), encoder=encoder, target=target,
+                            timings={'ingest_sec': round(t.elapsed, 4)})
 
-    dst_dir = paths['dir_processed'] / chosen_filter
-    dst_dir.mkdir(parents=True, exist_ok=True)
-    ok, processed_path = process_video(
-        src_path=paths['path_original'],
-        dst_dir=dst_dir,
-        out_name='video' + paths['ext'],
-        filter_name=chosen_filter,
-    )
-    if not ok:
-        return jsonify({"error": "Falha ao processar vídeo"}), 500
+@app.route('/api/upload/stream', methods=['POST', 'PUT'])
+@heavy()
+def upload_stream():
+    """Upload com o vídeo como corpo cru da requisição (sem multipart): o corpo é lido em blocos
+    direto para a pasta final, sem o buffer/arquivo temporário do Werkzeug.
+    Nome, filtros, parâmetros, HLS, encoder e alvo de saída vêm na query string (`filename`, `filter`
+    repetido ou `filters` separados por vírgula, `params`, `hls`, `encoder`, `target`) ou nos
+    cabeçalhos X-Filename/X-Filter/X-HLS."""
+    filename = request.args.get('filename') or request.headers.get('X-Filename') or ''
+    if not filename:
+        return jsonify({"error": "Parâmetro 'filename' ausente"}), 400
+    if not allowed_file(filename):
+        return jsonify({"error": f"Extensão não permitida: {filename}"}), 400
+    if (request.content_length or 0) > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Arquivo maior que o limite de {MAX_UPLOAD_BYTES} bytes"}), 413
+    quota = quota_error(request.content_length or 0)
+    if quota:
+        return jsonify({"error": quota}), 507
+    try:
+        chains = _parse_filters(_filter_specs(request.args.getlist('filter'), request.args.get('filters'),
+                                              request.headers.get('X-Filter')),
+                                request.args.get('params'))
+        encoder = _parse_encoder(request.args.get('encoder'))
+        target = _parse_target(request.args.get('target'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Thumbnails
-    thumbs = generate_thumbnails(processed_path, paths['dir_thumbs'], num_frames=1)
-    first_frame_path = thumbs[0] if thumbs else None
+    ensure_media_root()
+    vid = str(uuid.uuid4())
+    try:
+        with UPLOAD_STAGE_SECONDS.time(stage='ingest') as t:
+            paths, sha1, size = ingest_stream(request.stream, vid, filename)
+    except IngestError as e:
+        return jsonify({"error": str(e)}), e.status
+    UPLOAD_BYTES.inc(size, endpoint='stream')
 
-    # Preview GIF
-    preview_gif_path = generate_preview_gif(processed_path, paths['dir_thumbs'], fps=5, max_frames=20)
+    return _register_upload(vid, paths, filename, request.mimetype or None, sha1, chains,
+                            hls=_want_hls(request.args.get('hls') or request.headers.get('X-HLS')),
+                            encoder=encoder, target=target, timings={'ingest_sec': round(t.elapsed, 4)})
 
-    meta = {
-        "id": vid,
-        "original_name": original_name,
-        "original_ext": paths['ext'][1:],
-        "mime_type": getattr(f, 'mimetype', None),
-        "size_bytes": os.path.getsize(paths['path_original']),
-        "duration_sec": meta_probe.get('duration_sec'),
-        "fps": meta_probe.get('fps'),
-        "width": meta_probe.get('width'),
-        "height": meta_probe.get('height'),
-        "filter": chosen_filter,
-        "created_at": datetime.utcnow().isoformat() + 'Z',
-        "path_original": str(paths['path_original']),
-        "path_processed": str(processed_path),
-        "thumb_frame": str(first_frame_path) if first_frame_path else None,
-        "thumb_gif": str(preview_gif_path) if preview_gif_path else None,
-        "checksums": meta_probe.get('checksums', {}),
-        "params": {"filter": chosen_filter}
+# ==========================
+# Upload retomável em blocos
+# ==========================
+
+def _upload_session_view(sess: dict):
+    chunks = list_upload_chunks(sess['id'])
+    received = [c['offset'] for c in chunks]
+    have = set(received)
+    return {
+        "id": sess['id'],
+        "filename": sess['filename'],
+        "size": sess['size_bytes'],
+        "chunk_size": sess['chunk_size'],
+        "filter": sess['filter'],
+        "filters": _filter_specs(sess['filter']),
+        "params": json.loads(sess['params']) if sess.get('params') else {},
+        "status": sess['status'],
+        "video_id": sess['video_id'],
+        "received": received,
+        "missing": [o for o in range(0, sess['size_bytes'], sess['chunk_size']) if o not in have],
+        "bytes_received": sum(c['length'] for c in chunks),
+        "upload_url": f"/api/uploads/{sess['id']}",
     }
 
-    write_meta_json(paths['dir_uuid'] / 'meta.json', meta)
-    init_db(DB_PATH)
-    insert_video(meta)
+@app.route('/api/uploads', methods=['POST'])
+@heavy()
+def api_upload_create():
+    """Abre uma sessão de upload. Corpo JSON: filename, size, filter (ou lista em filters) e
+    (opcionais) params e chunk_size."""
+    body = request.get_json(silent=True) or {}
+    filename = body.get('filename') or ''
+    try:
+        chains = _parse_filters(_filter_specs(body.get('filter'), body.get('filters')), body.get('params'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        size = int(body.get('size') or 0)
+        chunk_size = min(int(body.get('chunk_size') or UPLOAD_CHUNK_SIZE), UPLOAD_MAX_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Campos 'size'/'chunk_size' inválidos"}), 400
+    if not allowed_file(filename):
+        return jsonify({"error": f"Extensão não permitida: {filename}"}), 400
+    if size <= 0 or chunk_size <= 0:
+        return jsonify({"error": "Arquivo vazio"}), 400
+    if size > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Arquivo maior que o limite de {MAX_UPLOAD_BYTES} bytes"}), 413
+    quota = quota_error(size)
+    if quota:
+        return jsonify({"error": quota}), 507
+
+    ensure_media_root()
+    sid = str(uuid.uuid4())
+    create_upload_file(sid, size)
+    insert_upload_session(sid, filename, size, chunk_size, ','.join(c.name for c in chains), _chain_params(chains))
+    return jsonify(_upload_session_view(get_upload_session(sid))), 201
+
+@app.route('/api/uploads/<sid>', methods=['GET'])
+def api_upload_status(sid):
+    sess = get_upload_session(sid)
+    if not sess:
+        return jsonify({"error": "não encontrado"}), 404
+    return jsonify(_upload_session_view(sess))
+
+@app.route('/api/uploads/<sid>', methods=['PUT'])
+@heavy(check_backlog=False)
+def api_upload_chunk(sid):
+    """Recebe um bloco no offset `?offset=N`. O cabeçalho X-Chunk-SHA1, se enviado, é conferido."""
+    sess = get_upload_session(sid)
+    if not sess:
+        return jsonify({"error": "não encontrado"}), 404
+    if sess['status'] != 'open':
+        return jsonify({"error": "Sessão já finalizada"}), 409
+    offset = request.args.get('offset', type=int)
+    size, chunk_size = sess['size_bytes'], sess['chunk_size']
+    if offset is None or offset < 0 or offset >= size or offset % chunk_size:
+        return jsonify({"error": "Offset inválido"}), 400
+    data = request.get_data(cache=False)
+    if len(data) != min(chunk_size, size - offset):
+        return jsonify({"error": "Tamanho do bloco inválido"}), 400
+    digest = hashlib.sha1(data).hexdigest()
+    expected = request.headers.get('X-Chunk-SHA1')
+    if expected and expected.lower() != digest:
+        return jsonify({"error": "Checksum do bloco não confere"}), 422
+
+    write_upload_chunk(sid, offset, data)
+    record_upload_chunk(sid, offset, len(data), digest)
+    UPLOAD_BYTES.inc(len(data), endpoint='chunked')
+    return jsonify({"ok": True, "offset": offset, "length": len(data), "sha1": digest})
+
+@app.route('/api/uploads/<sid>/finalize', methods=['POST'])
+@heavy()
+def api_upload_finalize(sid):
+    """Com todos os blocos recebidos, monta o original na pasta final e segue o fluxo normal de upload
+    (`?hls=1` pede também a saída HLS; `?encoder=` traz a configuração de codificação em JSON e
+    `?target=` a resolução/fps de saída)."""
+    sess = get_upload_session(sid)
+    if not sess:
+        return jsonify({"error": "não encontrado"}), 404
+    try:
+        encoder = _parse_encoder(request.args.get('encoder'))
+        target = _parse_target(request.args.get('target'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if sess['status'] == 'done':
+        return jsonify({"ok": True, "id": sess['video_id'], "status_url": f"/api/videos/{sess['video_id']}/status"})
+    view = _upload_session_view(sess)
+    if view['missing']:
+        return jsonify({"error": "Blocos pendentes", "missing": view['missing']}), 409
+
+    if not claim_upload_session(sid):
+        return jsonify({"error": "Finalização em andamento"}), 409
+
+    vid = str(uuid.uuid4())
+    try:
+        with UPLOAD_STAGE_SECONDS.time(stage='finalize') as t:
+            paths, sha1 = finish_upload_file(sid, vid, sess['filename'])
+    except IngestError as e:
+        update_upload_session(sid, status='open')
+        return jsonify({"error": str(e)}), e.status
+    update_upload_session(sid, status='done', video_id=vid)
+    chains = _parse_filters(_filter_specs(sess['filter']), sess.get('params'))
+    return _register_upload(vid, paths, sess['filename'], None, sha1, chains,
+                            hls=_want_hls(request.args.get('hls')), encoder=encoder, target=target,
+                            timings={'finalize_sec': round(t.elapsed, 4)})
 
-    public = public_paths_for(meta)
+@app.route('/api/filters', methods=['GET'])
+def api_filters():
+    return jsonify(describe_filters())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    return jsonify({**dedup_stats(), "responses": response_cache.stats()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "não encontrado"}), 404
+    return jsonify(public_job(job))
+
+@app.route('/api/videos/<vid>/status', methods=['GET'])
+def api_video_status(vid):
+    job = get_latest_job_for_video(vid)
+    ready = get_video(vid) is not None
+    if not job and not ready:
+        return jsonify({"error": "não encontrado"}), 404
     return jsonify({
-        "ok": True,
         "id": vid,
-        "filter": chosen_filter,
-        "original_url": public['original_url'],
-        "processed_url": public['processed_url'],
-        "thumb_url": public['thumb_url'],
-        "preview_url": public['preview_url'],
-        "detail_url": f"/api/videos/{vid}",
+        "ready": ready,
+        "job": public_job(job) if job else None,
     })
 
+# Campos que podem ser pedidos em `fields=`: colunas do vídeo e URLs públicas
+VIDEO_FIELDS = set(COLUMNS) | {'rev', 'original_url', 'processed_url', 'thumb_url', 'preview_url', 'hls_url', 'thumb_small_url'}
+
+def _search_params(args) -> dict:
+    """Critérios de busca da query string: filter/filters, min_<faixa>/max_<faixa>, since, until, q e sort.
+    Levanta ValueError para valores inválidos."""
+    ranges = {}
+    for name in RANGE_COLUMNS:
+        lo, hi = args.get(f'min_{name}'), args.get(f'max_{name}')
+        if lo is None and hi is None:
+            continue
+        try:
+            ranges[name] = (float(lo) if lo is not None else None, float(hi) if hi is not None else None)
+        except ValueError:
+            raise ValueError(f"Valor inválido para a faixa '{name}'")
+    return {
+        'filters': _filter_specs(args.getlist('filter'), args.get('filters'), default=None),
+        'ranges': ranges,
+        'since': args.get('since'),
+        'until': args.get('until'),
+        'q': (args.get('q') or '').strip() or None,
+        'sort': args.get('sort') or '-created_at',
+    }
+
+def _parse_fields(raw) -> list | None:
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in VIDEO_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}")
+    return fields
+
 @app.route('/api/videos', methods=['GET'])
+@catalog_cached
 def api_videos():
-    rows = list_videos(limit=int(request.args.get('limit', 100)))
+    """Busca no catálogo, paginada por cursor: o corpo continua sendo a lista de vídeos e, se houver
+    mais, o cabeçalho X-Next-Cursor (e Link rel="next") traz o valor para `?cursor=`.
+    Filtros: filter, min_/max_ (width, height, duration, size, fps), since/until (created_at),
+    q (trecho do nome original); ordem em sort (ex.: -created_at, duration, -size, name);
+    `fields=id,filter,thumb_url` devolve só esses campos."""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), API_MAX_PAGE)
+    try:
+        params = _search_params(request.args)
+        fields = _parse_fields(request.args.get('fields'))
+        rows = search_videos(**params, limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    next_cursor = encode_cursor(rows[-1], params['sort']) if len(rows) == limit else None
+    for r in rows:
+        r.update(public_paths_for(r))
+    if fields:
+        rows = [{k: r.get(k) for k in fields} for r in rows]
+    resp = jsonify(rows)
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+        resp.headers['Link'] = f'<{_next_page_url(next_cursor)}>; rel="next"'
+    return resp
+
+@app.route('/api/videos/changes', methods=['GET'])
+def api_video_changes():
+    """Sincronização incremental do catálogo: vídeos novos/alterados (`changed`) e ids removidos
+    (`deleted`) depois de `since` (cursor devolvido pela chamada anterior; 0 ou ausente = tudo).
+    Com `more` verdadeiro há mais alterações: chamar de novo com o `cursor` recebido. Com `reset`,
+    o cursor não vale neste servidor e o cliente deve descartar a cópia local e recomeçar do 0.
+    `fields=` como em /api/videos (id e rev sempre vêm)."""
+    limit = min(max(request.args.get('limit', CHANGES_MAX_PAGE, type=int), 1), CHANGES_MAX_PAGE)
+    try:
+        fields = _parse_fields(request.args.get('fields'))
+        delta = video_changes(request.args.get('since'), limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = delta['changed']
     for r in rows:
         r.update(public_paths_for(r))
-    return jsonify(rows)
+    if fields:
+        keep = ['id', 'rev', *(f for f in fields if f not in ('id', 'rev'))]
+        rows = [{k: r.get(k) for k in keep} for r in rows]
+    resp = jsonify({**delta, 'changed': rows})
+    resp.cache_control.no_store = True
+    return resp
+
+def _next_page_url(cursor: str) -> str:
+    args = request.args.to_dict(flat=False)
+    args['cursor'] = [cursor]
+    return '/api/videos?' + urlencode(args, doseq=True)
 
 @app.route('/api/videos/<vid>', methods=['GET'])
+@catalog_cached
 def api_video_detail(vid):
     row = get_video(vid)
     if not row:
         return jsonify({"error": "não encontrado"}), 404
     row.update(public_paths_for(row))
+    row['outputs'] = _public_outputs(row)
     return jsonify(row)
 
+@app.route('/api/videos/<vid>', methods=['DELETE'])
+def api_video_delete(vid):
+    """Apaga o vídeo: some do catálogo na hora e os arquivos vão para a lixeira (removidos pelo GC
+    depois de TRASH_RETENTION_HOURS). 409 se houver um job processando o vídeo."""
+    try:
+        result = trash_video(vid)
+    except LifecycleError as e:
+        return jsonify({"error": str(e)}), e.status
+    if result is None:
+        return jsonify({"error": "não encontrado"}), 404
+    with _media_checksums_lock:
+        _media_checksums.pop(vid, None)
+    return jsonify(result)
+
+@app.route('/api/videos/<vid>/warm', methods=['POST'])
+def api_video_warm(vid):
+    """Regera as saídas processadas de um vídeo frio (só original e thumbnails em disco)."""
+    result = warm(vid)
+    if result is None:
+        return jsonify({"error": "não encontrado"}), 404
+    return _warm_response(vid, result)
+
+def _warm_response(vid: str, result: dict):
+    if result['status'] == 'hot':
+        return jsonify({"ok": True, "id": vid, "status": "hot", "detail_url": f"/api/videos/{vid}"})
+    resp = jsonify({"error": "Vídeo processado sendo regerado; tente de novo em instantes", "id": vid,
+                    "status": "warming", "job_id": result['job_id'], "job_url": f"/api/jobs/{result['job_id']}",
+                    "retry_after": RETRY_AFTER_SEC})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(RETRY_AFTER_SEC)
+    return resp
+
+@app.route('/api/storage', methods=['GET'])
+def api_storage():
+    """Uso de disco por tipo e por dia (índice no banco), cotas, lixeira e última passada do GC."""
+    return jsonify(storage_report())
+
+def _public_outputs(row: dict) -> list:
+    """Saídas processadas do vídeo (uma por filtro). Vídeos anteriores ao fan-out só têm a principal."""
+    outputs = list_outputs(row['id'])
+    if row['filter'] not in {o['filter'] for o in outputs}:
+        outputs.insert(0, {**row, 'params': {}})
+    return [{
+        "filter": o['filter'],
+        "params": o.get('params') or {},
+        **{k: v for k, v in public_paths_for(o).items() if k not in {'original_url', 'thumb_small_url'}},
+    } for o in outputs]
+
+@app.route('/api/videos/<vid>/derive', methods=['POST'])
+@heavy()
+def api_video_derive(vid):
+    """Gera novas saídas para um vídeo já processado, a partir do original guardado.
+    Corpo JSON: filters (lista ou "a,b"), params, hls, encoder e target. Filtros que o vídeo já tem são ignorados."""
+    row = get_video(vid)
+    if not row:
+        return jsonify({"error": "não encontrado"}), 404
+    body = request.get_json(silent=True) or {}
+    try:
+        chains = _parse_filters(_filter_specs(body.get('filters'), body.get('filter'), request.args.get('filters')),
+                                body.get('params'))
+        encoder = _parse_encoder(body.get('encoder'))
+        target = _parse_target(body.get('target'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    hls = _want_hls(body.get('hls', request.args.get('hls')))
+
+    have = {o['filter'] for o in list_outputs(vid)} | {row['filter']}
+    existing = [c.name for c in chains if c.name in have]
+    chains = [c for c in chains if c.name not in have]
+    path_original = Path(row['path_original'])
+    sha1 = row.get('checksum') or file_sha1(path_original)
+    dirs = {
+        'dir_uuid': path_original.parents[1],
+        'dir_processed': path_original.parents[1] / 'processed',
+        'ext': path_original.suffix,
+    }
+    codec = encoder.cache_tag(path_original.name)
+    cached, pending = plan_outputs(vid, dirs, sha1, chains, codec, hls, row['filter'], target)
+    result = {"ok": True, "id": vid, "existing": existing, "cached_filters": cached,
+              "detail_url": f"/api/videos/{vid}"}
+    if not pending:
+        if cached:
+            refresh_meta_outputs(vid, dirs['dir_uuid'])
+        return jsonify({**result, "status": "done", "outputs": _public_outputs(row)})
+
+    job_id = enqueue_job(vid, {
+        "kind": "derive",
+        "filter": row['filter'],
+        "outputs": pending,
+        "ext": dirs['ext'],
+        "dir_uuid": str(dirs['dir_uuid']),
+        "path_original": str(path_original),
+        "sha1": sha1,
+        "codec": codec,
+        "encoder": encoder.to_dict(),
+        "target": target,
+        "hls": hls,
+    })
+    return jsonify({
+        **result,
+        "job_id": job_id,
+        "status": "queued",
+        "filters": [p['filter'] for p in pending],
+        "job_url": f"/api/jobs/{job_id}",
+        "status_url": f"/api/videos/{vid}/status",
+    }), 202
+
+# Checksum do original por vídeo (LRU com até MEDIA_CHECKSUM_CACHE_SIZE entradas)
+_media_checksums = OrderedDict()
+_media_checksums_lock = threading.Lock()
+
+def _media_checksum(parts: list):
+    """SHA-1 do original ao qual o arquivo pertence: vem do nome em blobs/ ou da linha do vídeo
+    em videos/yyyy/mm/dd/<uuid>/... (só resultados encontrados ficam em memória)."""
+    if len(parts) == 3 and parts[0] == 'blobs':
+        return parts[2].split('.', 1)[0]
+    if len(parts) >= 5 and parts[0] == 'videos':
+        vid = parts[4]
+        with _media_checksums_lock:
+            checksum = _media_checksums.get(vid)
+            if checksum is not None:
+                _media_checksums.move_to_end(vid)
+                return checksum
+        row = get_video(vid)
+        if not row or not row.get('checksum'):
+            return None
+        with _media_checksums_lock:
+            _media_checksums[vid] = row['checksum']
+            while len(_media_checksums) > MEDIA_CHECKSUM_CACHE_SIZE:
+                _media_checksums.popitem(last=False)
+        return row['checksum']
+    return None
+
+def _media_etag(subpath: str, parts: list, st: os.stat_result):
+    """ETag forte: o próprio SHA-1 para o original; para derivados, hash do SHA-1 do original com
+    caminho, tamanho e mtime. Sem checksum conhecido, usa o ETag padrão do Werkzeug."""
+    checksum = _media_checksum(parts)
+    if not checksum:
+        return True
+    if parts[0] == 'blobs' or (len(parts) >= 6 and parts[5] == 'original'):
+        return checksum
+    raw = f"{checksum}:{subpath}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _is_output_path(vid: str, target: str) -> bool:
+    """`target` é o vídeo processado ou a playlist HLS de uma das saídas registradas do vídeo."""
+    target = os.path.abspath(target)
+    return any(os.path.abspath(o[k]) == target
+               for o in list_outputs(vid) for k in ('path_processed', 'path_hls') if o.get(k))
+
+# Pastas de MEDIA_ROOT servidas em /media; o resto (trash/, uploads/, incoming/, metrics/) é interno
+MEDIA_PUBLIC_DIRS = {'videos', 'blobs', 'thumbcache'}
+
 @app.route('/media/<path:subpath>')
 def media_serve(subpath):
-    base = Path(MEDIA_ROOT)
-    target = base / subpath
-    if not target.exists():
+    target = safe_join(MEDIA_ROOT, subpath)
+    if target is None:
+        abort(404)
+    # Caminho já normalizado ("videos/../trash/x" vira "trash/x")
+    subpath = os.path.relpath(target, MEDIA_ROOT).replace(os.sep, '/')
+    parts = subpath.split('/')
+    if parts[0] not in MEDIA_PUBLIC_DIRS:
         abort(404)
-    return send_from_directory(base, subpath, as_attachment=False)
+    video = parts[4] if len(parts) >= 6 and parts[0] == 'videos' else None
+    if not os.path.isfile(target):
+        # Vídeo frio: o processado saiu do disco e é regerado sob demanda (só para caminhos de saídas conhecidas)
+        if video is None or parts[5] != 'processed' or not _is_output_path(video, target):
+            abort(404)
+        result = warm(video)
+        if result is None or (result['status'] == 'hot' and not os.path.isfile(target)):
+            abort(404)
+        if result['status'] != 'hot':
+            return _warm_response(video, result)
+    if video is not None:
+        touch(video)
+    st = os.stat(target)
+    etag = _media_etag(subpath, parts, st)
+    # Caminhos com UUID/SHA-1 nunca mudam de conteúdo: o navegador pode guardar por tempo indeterminado
+    immutable = parts[0] in {'videos', 'blobs'}
+
+    if MEDIA_ACCEL == 'nginx':
+        # O nginx serve os bytes (com Range e sendfile); aqui só se responde ao condicional
+        resp = Response(mimetype=mimetypes.guess_type(target)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + subpath
+        resp.last_modified = st.st_mtime
+        if isinstance(etag, str):
+            resp.set_etag(etag)
+        else:
+            resp.add_etag()
+    else:
+        # Com MEDIA_ACCEL=sendfile o Flask só emite X-Sendfile (USE_X_SENDFILE, configurado abaixo)
+        resp = send_file(target, etag=etag, conditional=True, max_age=MEDIA_CACHE_MAX_AGE)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.cache_control.public = True
+    resp.cache_control.max_age = MEDIA_CACHE_MAX_AGE if immutable else 0
+    if immutable:
+        resp.cache_control.immutable = True
+    if MEDIA_ACCEL == 'nginx':
+        return resp.make_conditional(request)
+    # Tamanho já ajustado pelo Range/304 do send_file
+    MEDIA_BYTES.inc(resp.content_length or 0, kind=parts[0])
+    return resp
 
 # ==========================
 # Galeria web
 # ==========================
 
+@app.route('/thumbs/<vid>/<int:width>')
+def thumb_small(vid, width):
+    """Miniatura reduzida (THUMB_FORMAT) do vídeo, numa das larguras de THUMB_WIDTHS. Gerada na primeira
+    requisição a partir do thumbnail grande e servida do cache em disco daí em diante."""
+    if width not in THUMB_WIDTHS:
+        abort(404)
+    path = small_thumb_path(vid, width)
+    if not path.exists():
+        row = get_video(vid)
+        path = small_thumbnail(vid, row.get('thumb_frame'), width) if row else None
+        if path is None:
+            abort(404)
+    resp = send_file(path, conditional=True, max_age=MEDIA_CACHE_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+CARDS_TEMPLATE = """
+{% for v in videos %}
+  <div class="card">
+    <img class="thumb" src="{{ v.thumb_small_url or v.preview_url }}" alt="thumb"
+         loading="lazy" decoding="async" width="320" height="180">
+    <div class="meta">
+      <div><b>ID:</b> {{ v.id }}</div>
+      <div><b>Filtro:</b> {{ v.filter }}</div>
+      <div><b>Resolução:</b> {{ v.width }}×{{ v.height }} @ {{ v.fps }} fps</div>
+      <div><b>Duração:</b> {{ '%.2f' % (v.duration_sec or 0) }} s</div>
+      <div><b>Original:</b> {{ v.original_name }}</div>
+    </div>
+    <div class="links">
+      <a href="{{ v.original_url }}" target="_blank">Original</a>
+      <a href="{{ v.processed_url }}" target="_blank">Processado</a>
+      {% if v.preview_url %}<a href="{{ v.preview_url }}" target="_blank">Preview</a>{% endif %}
+      {% if v.thumb_url %}<a href="{{ v.thumb_url }}" target="_blank">Thumb</a>{% endif %}
+      <a href="/api/videos/{{ v.id }}" target="_blank">JSON</a>
+    </div>
+  </div>
+{% endfor %}
+"""
+
 TEMPLATE = """
 <!doctype html>
 <html>
@@ -136,44 +841,65 @@ TEMPLATE = """
     body { font-family: system-ui, -apple-system, Segoe UI, Roboto, sans-serif; margin: 24px; }
     .grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 16px; }
     .card { border: 1px solid #ddd; border-radius: 12px; padding: 12px; }
-    .thumb { width: 100%; border-radius: 8px; object-fit: cover; aspect-ratio: 16/9; }
+    .thumb { width: 100%; height: auto; border-radius: 8px; object-fit: cover; aspect-ratio: 16/9; background: #eee; }
     .meta { font-size: 12px; color: #444; margin-top: 6px; line-height: 1.4; }
     .links { margin-top: 8px; display: flex; gap: 8px; }
+    #more { margin: 24px 0; text-align: center; }
     a { text-decoration: none; color: #0b6; }
   </style>
 </head>
 <body>
   <h1>Galeria de Vídeos Processados</h1>
-  <div class="grid">
-    {% for v in videos %}
-      <div class="card">
-        <img class="thumb" src="{{ v.thumb_url or v.preview_url }}" alt="thumb">
-        <div class="meta">
-          <div><b>ID:</b> {{ v.id }}</div>
-          <div><b>Filtro:</b> {{ v.filter }}</div>
-          <div><b>Resolução:</b> {{ v.width }}×{{ v.height }} @ {{ v.fps }} fps</div>
-          <div><b>Duração:</b> {{ '%.2f' % (v.duration_sec or 0) }} s</div>
-          <div><b>Original:</b> {{ v.original_name }}</div>
-        </div>
-        <div class="links">
-          <a href="{{ v.original_url }}" target="_blank">Original</a>
-          <a href="{{ v.processed_url }}" target="_blank">Processado</a>
-          {% if v.preview_url %}<a href="{{ v.preview_url }}" target="_blank">Preview</a>{% endif %}
-          <a href="/api/videos/{{ v.id }}" target="_blank">JSON</a>
-        </div>
-      </div>
-    {% endfor %}
-  </div>
+  <div class="grid" id="grid">{{ cards|safe }}</div>
+  {% if next_cursor %}
+  <div id="more" data-cursor="{{ next_cursor }}"><a href="/?cursor={{ next_cursor }}">Mais vídeos</a></div>
+  {% endif %}
+  <script>
+    // Rolagem infinita: busca só os cards da próxima página (?partial=1) quando o fim se aproxima
+    const more = document.getElementById('more');
+    if (more && 'IntersectionObserver' in window) {
+      let loading = false;
+      new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loading || !more.dataset.cursor) return;
+        loading = true;
+        try {
+          const r = await fetch('/?partial=1&cursor=' + encodeURIComponent(more.dataset.cursor));
+          if (!r.ok) return;
+          document.getElementById('grid').insertAdjacentHTML('beforeend', await r.text());
+          more.dataset.cursor = r.headers.get('X-Next-Cursor') || '';
+          if (!more.dataset.cursor) more.remove();
+        } finally {
+          loading = false;
+        }
+      }, {rootMargin: '800px'}).observe(more);
+    }
+  </script>
 </body>
 </html>
 """
 
+# Compilados uma única vez (render_template_string recompila a cada chamada)
+CARDS = app.jinja_env.from_string(CARDS_TEMPLATE)
+GALLERY_TEMPLATE = app.jinja_env.from_string(TEMPLATE)
+
 @app.route('/')
+@catalog_cached
 def gallery():
-    rows = list_videos(limit=100)
+    """Galeria paginada por cursor (GALLERY_PAGE_SIZE cards por página). Com `?partial=1` devolve só os
+    cards, usados pela rolagem infinita; o cursor da página seguinte vai em X-Next-Cursor."""
+    try:
+        rows = list_videos(limit=GALLERY_PAGE_SIZE, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == GALLERY_PAGE_SIZE else None
     for r in rows:
         r.update(public_paths_for(r))
-    return render_template_string(TEMPLATE, videos=rows)
+    cards = CARDS.render(videos=rows)
+    resp = make_response(cards if request.args.get('partial') else GALLERY_TEMPLATE.render(
+        cards=cards, next_cursor=next_cursor))
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
 
 # ==========================
 # Inicialização
@@ -182,4 +908,8 @@ def gallery():
 if __name__ == '__main__':
     Path(MEDIA_ROOT).mkdir(parents=True, exist_ok=True)
     init_db(DB_PATH)
+    # Com o reloader do modo debug o módulo roda duas vezes; os workers sobem só no processo filho
+    if not SERVER_DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers(JOB_WORKERS)
+        start_gc()
     app.run(host=SERVER_HOST, port=SERVER_PORT, debug=SERVER_DEBUG)
@@ -0,0 +1,72 @@
+# server/cache.py
+"""Cache em memória das respostas do catálogo (/, /api/videos e /api/videos/<id>).
+
+Guarda o corpo já serializado (JSON ou HTML) e o ETag de cada resposta, com limite de entradas
+(LRU) e de idade (TTL). A invalidação é pela revisão do catálogo (db.catalog_revision), que os
+triggers do banco incrementam a cada escrita em videos/video_outputs — inclusive as feitas pelos
+processos worker —, então uma revisão nova descarta tudo o que foi montado com a anterior.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class CachedResponse:
+    def __init__(self, body: bytes, mimetype: str, etag: str, headers: dict, rev: int):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.headers = headers
+        self.rev = rev
+        self.created = time.monotonic()
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._rev = None
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key: str, rev: int) -> CachedResponse | None:
+        with self._lock:
+            if rev != self._rev:
+                if self._entries:
+                    self._counters['invalidations'] += 1
+                self._entries.clear()
+                self._rev = rev
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        with self._lock:
+            # Montada com uma revisão que já ficou para trás: não guarda
+            if entry.rev != self._rev:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            **counters,
+            'entries': size,
+            'hit_ratio': round(counters['hits'] / lookups, 3) if lookups else None,
+        }
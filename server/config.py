@@ -7,6 +7,31 @@ MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(Path(__file__).resolve().parents[1
 
 # Caminho do banco SQLite
 DB_PATH = os.environ.get('DB_PATH', 'server.db')
+# Conexões SQLite mantidas abertas no pool de cada processo
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+# Tamanho máximo de página em GET /api/videos
+API_MAX_PAGE = int(os.environ.get('API_MAX_PAGE', '500'))
+# Máximo de alterações por página em /api/videos/changes (linhas menores, páginas maiores)
+CHANGES_MAX_PAGE = int(os.environ.get('CHANGES_MAX_PAGE', '2000'))
+# Miniaturas pequenas (galeria/listas): larguras servidas em /thumbs/<id>/<largura>, formato e qualidade
+THUMB_WIDTHS = [int(w) for w in (os.environ.get('THUMB_WIDTHS') or '160,320,640').split(',')]
+THUMB_WIDTH = int(os.environ.get('THUMB_WIDTH', '320'))
+THUMB_FORMAT = os.environ.get('THUMB_FORMAT', 'webp')  # 'webp' ou 'jpg'
+THUMB_QUALITY = int(os.environ.get('THUMB_QUALITY', '70'))
+# Preview animado: formato ('gif', 'webp' ou 'mp4' mudo em loop), largura, quadros amostrados,
+# fps de reprodução, cores da paleta única do GIF e qualidade do WebP
+PREVIEW_FORMAT = os.environ.get('PREVIEW_FORMAT', 'gif')
+PREVIEW_WIDTH = int(os.environ.get('PREVIEW_WIDTH', '320'))
+PREVIEW_FRAMES = int(os.environ.get('PREVIEW_FRAMES', '20'))
+PREVIEW_FPS = int(os.environ.get('PREVIEW_FPS', '5'))
+PREVIEW_COLORS = int(os.environ.get('PREVIEW_COLORS', '128'))
+PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY', '60'))
+# Cards por página da galeria (paginação por cursor)
+GALLERY_PAGE_SIZE = int(os.environ.get('GALLERY_PAGE_SIZE', '24'))
+
+# Cache das respostas do catálogo (entradas e idade máxima em segundos; 0 entradas desliga)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
 
 # Extensões permitidas
 ALLOWED_EXTS = set((os.environ.get('ALLOWED_EXTS') or 'mp4,mov,avi,mkv').split(','))
@@ -16,5 +41,95 @@ SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
 SERVER_PORT = int(os.environ.get('SERVER_PORT', '5000'))
 SERVER_DEBUG = os.environ.get('SERVER_DEBUG', '1') == '1'
 
+# Servidor de produção (serve.py): 'waitress', 'werkzeug' (threaded, sem reloader) ou 'auto' (waitress se instalado)
+SERVER_RUNNER = os.environ.get('SERVER_RUNNER', 'auto')
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '16'))
+SERVER_CONNECTION_LIMIT = int(os.environ.get('SERVER_CONNECTION_LIMIT', '200'))
+# Requisições pesadas (uploads, finalização, derive) simultâneas; as demais threads ficam livres
+# para catálogo e mídia. Sem vaga em HEAVY_SLOT_WAIT segundos, responde 503
+HEAVY_CONCURRENCY = int(os.environ.get('HEAVY_CONCURRENCY', str(max(1, SERVER_THREADS // 4))))
+HEAVY_SLOT_WAIT = float(os.environ.get('HEAVY_SLOT_WAIT', '2'))
+# Jobs na fila a partir dos quais novos uploads/derive recebem 503 + Retry-After (0 = sem limite)
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', '50'))
+RETRY_AFTER_SEC = int(os.environ.get('RETRY_AFTER_SEC', '30'))
+
 # Base URL pública do servidor (usada para montar links /media/...)
 SERVER_BASE_URL = os.environ.get('SERVER_BASE_URL', f'http://localhost:{SERVER_PORT}')
+
+# Fila de processamento (jobs em SQLite consumidos por processos worker)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '0.5'))
+
+# Processamento paralelo por segmentos (divide o vídeo em faixas de frames). Cada um dos JOB_WORKERS
+# jobs usa até PROCESS_WORKERS processos: o padrão divide as CPUs entre eles
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', str(max(1, (os.cpu_count() or 1) // max(1, JOB_WORKERS)))))
+PARALLEL_MIN_FRAMES = int(os.environ.get('PARALLEL_MIN_FRAMES', '600'))
+
+# Binário do ffmpeg (concatenação dos segmentos sem recodificar, HLS, áudio). Fora do PATH, usa o do pacote
+# imageio-ffmpeg (requirements.txt); sem nenhum dos dois o processamento paralelo fica desligado
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+
+# Codificação do vídeo processado (cada upload pode sobrescrever em `encoder`):
+# backend 'opencv' (cv2.VideoWriter), 'ffmpeg' (quadros crus por pipe) ou 'auto' (ffmpeg se houver);
+# codec/preset/CRF/threads valem para o ffmpeg (threads 0 = automático); audio repassa o áudio do original
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'auto')
+ENCODER_CODEC = os.environ.get('ENCODER_CODEC', 'libx264')
+ENCODER_PRESET = os.environ.get('ENCODER_PRESET', 'ultrafast')
+ENCODER_CRF = int(os.environ.get('ENCODER_CRF', '23'))
+ENCODER_THREADS = int(os.environ.get('ENCODER_THREADS', '0'))
+ENCODER_AUDIO = os.environ.get('ENCODER_AUDIO', '0') == '1'
+
+# Laço de processamento: 'serial' ou 'pipeline' (decodificação, filtro e codificação em threads)
+PROCESS_MODE = os.environ.get('PROCESS_MODE', 'pipeline')
+# Lotes em trânsito entre os estágios do pipeline (limita a memória: PIPELINE_DEPTH x FILTER_BATCH quadros)
+PIPELINE_DEPTH = int(os.environ.get('PIPELINE_DEPTH', '3'))
+# Quadros empilhados por lote entregue aos filtros
+FILTER_BATCH = int(os.environ.get('FILTER_BATCH', '4'))
+
+# Resolução/fps de saída padrão (ex.: "720p@24", "480p", "@15"); vazio mantém os da fonte.
+# Cada upload pode pedir outro em `target`; nunca amplia nem aumenta o fps
+OUTPUT_TARGET = os.environ.get('OUTPUT_TARGET', '')
+
+# Tamanho máximo aceito por upload (bytes)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(4 * 1024 ** 3)))
+
+# Uploads retomáveis: tamanho padrão e máximo de cada bloco (bytes)
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('UPLOAD_MAX_CHUNK_SIZE', str(64 * 1024 * 1024)))
+
+# Entrega de /media: cache no cliente e, opcionalmente, delegação ao proxy da frente
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+# '' (Flask envia os bytes), 'nginx' (X-Accel-Redirect) ou 'sendfile' (X-Sendfile, Apache/lighttpd)
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '').lower()
+# Location interna do nginx que aponta para MEDIA_ROOT (usada com MEDIA_ACCEL=nginx)
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Checksums de originais guardados em memória para o ETag de /media (LRU, por vídeo)
+MEDIA_CHECKSUM_CACHE_SIZE = int(os.environ.get('MEDIA_CHECKSUM_CACHE_SIZE', '10000'))
+
+# Saída HLS opcional (renditions em segmentos + master playlist em processed/<filtro>/hls/)
+OUTPUT_HLS = os.environ.get('OUTPUT_HLS', '0') == '1'
+HLS_RENDITIONS = [int(h) for h in (os.environ.get('HLS_RENDITIONS') or '1080,720,360').split(',')]
+HLS_SEGMENT_SEC = int(os.environ.get('HLS_SEGMENT_SEC', '4'))
+
+# Métricas (/metrics, formato Prometheus): snapshots gravados pelos processos worker
+METRICS_DIR = os.environ.get('METRICS_DIR', str(Path(MEDIA_ROOT) / 'metrics'))
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get('METRICS_SNAPSHOT_INTERVAL', '5'))
+# Grava em meta.json o tempo de cada etapa do upload/processamento
+META_TIMINGS = os.environ.get('META_TIMINGS', '1') == '1'
+
+# Ciclo de vida do armazenamento (lifecycle.py): coleta periódica de lixo (0 = desligada)
+GC_INTERVAL_SEC = float(os.environ.get('GC_INTERVAL_SEC', '600'))
+# Vídeos apagados ficam em trash/ por este tempo antes de sair do disco
+TRASH_RETENTION_HOURS = float(os.environ.get('TRASH_RETENTION_HOURS', '24'))
+# Sobras de uploads (incoming/, sessões retomáveis paradas, uploads cujo job falhou) mais velhas que isto são removidas
+ORPHAN_MAX_AGE_HOURS = float(os.environ.get('ORPHAN_MAX_AGE_HOURS', '24'))
+# Saídas extras (filtros além do principal) de vídeos sem acesso há N dias são removidas (0 = nunca)
+OUTPUT_RETENTION_DAYS = float(os.environ.get('OUTPUT_RETENTION_DAYS', '0'))
+# Vídeos sem acesso há N dias ficam "frios": só original e thumbnails; o processado é regerado
+# quando pedido de novo (0 = desligado)
+COLD_AFTER_DAYS = float(os.environ.get('COLD_AFTER_DAYS', '0'))
+# Intervalo mínimo entre registros de acesso do mesmo vídeo no banco
+ACCESS_TOUCH_INTERVAL = float(os.environ.get('ACCESS_TOUCH_INTERVAL', '3600'))
+# Cotas de disco (0 = sem limite): total e por dia (bytes gravados no dia); uploads acima recebem 507
+DISK_QUOTA_BYTES = int(os.environ.get('DISK_QUOTA_BYTES', '0'))
+DAILY_QUOTA_BYTES = int(os.environ.get('DAILY_QUOTA_BYTES', '0'))
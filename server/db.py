@@ -1,7 +1,20 @@
 # server/db.py
+import base64
+import json
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 
+from config import DB_POOL_SIZE
+from metrics import histogram, timed
+
+# Tempo de cada função pública do banco (rótulo op = nome da função)
+DB_SECONDS = histogram('video_db_call_seconds', 'Duração das chamadas ao banco SQLite', ['op'])
+_timed = timed(DB_SECONDS)
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS videos (
     id TEXT PRIMARY KEY,
@@ -18,49 +31,973 @@ CREATE TABLE IF NOT EXISTS videos (
     path_original TEXT,
     path_processed TEXT,
     thumb_frame TEXT,
-    thumb_gif TEXT
+    thumb_gif TEXT,
+    checksum TEXT,
+    path_hls TEXT
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    video_id TEXT,
+    status TEXT,
+    progress REAL,
+    params TEXT,
+    error TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_video ON jobs(video_id);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    sha1 TEXT PRIMARY KEY,
+    path TEXT,
+    size_bytes INTEGER,
+    refcount INTEGER,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS derived (
+    cache_key TEXT PRIMARY KEY,
+    sha1 TEXT,
+    filter TEXT,
+    params TEXT,
+    codec TEXT,
+    path_processed TEXT,
+    thumb_frame TEXT,
+    thumb_gif TEXT,
+    path_hls TEXT,
+    refcount INTEGER,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_derived_sha1 ON derived(sha1);
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    size_bytes INTEGER,
+    chunk_size INTEGER,
+    filter TEXT,
+    params TEXT,
+    status TEXT,
+    video_id TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    session_id TEXT,
+    offset INTEGER,
+    length INTEGER,
+    sha1 TEXT,
+    PRIMARY KEY (session_id, offset)
+);
+
+CREATE TABLE IF NOT EXISTS video_outputs (
+    video_id TEXT,
+    filter TEXT,
+    params TEXT,
+    path_processed TEXT,
+    thumb_frame TEXT,
+    thumb_gif TEXT,
+    path_hls TEXT,
+    created_at TEXT,
+    PRIMARY KEY (video_id, filter)
 );
 """
 
 COLUMNS = [
     'id','original_name','original_ext','mime_type','size_bytes','duration_sec','fps','width','height',
-    'filter','created_at','path_original','path_processed','thumb_frame','thumb_gif'
+    'filter','created_at','path_original','path_processed','thumb_frame','thumb_gif','checksum','path_hls'
 ]
 
+def _ensure_columns(conn, table: str, columns: dict):
+    """Adiciona colunas novas em bancos criados por versões anteriores do schema."""
+    existing = {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def _execute_script(conn, script: str):
+    # executescript faria COMMIT implícito e soltaria o lock da migração
+    stmt = ''
+    for part in script.split(';'):
+        stmt += part + ';'
+        # Corpos de trigger têm ';' internos: só executa quando a instrução estiver completa
+        if sqlite3.complete_statement(stmt):
+            if stmt.strip(' \n;'):
+                conn.execute(stmt)
+            stmt = ''
+
+def _migration_1(conn):
+    """Schema base. Bancos criados antes das migrações versionadas recebem as colunas que faltam."""
+    _execute_script(conn, SCHEMA)
+    _ensure_columns(conn, 'videos', {'checksum': 'TEXT', 'path_hls': 'TEXT'})
+    _ensure_columns(conn, 'derived', {'path_hls': 'TEXT'})
+    _ensure_columns(conn, 'upload_sessions', {'params': 'TEXT'})
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_checksum ON videos(checksum)")
+
+def _migration_2(conn):
+    """Índices da listagem: ordem por (created_at, id) para paginação por cursor e filtro por tipo."""
+    _execute_script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_videos_created ON videos(created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_videos_filter ON videos(filter, created_at);
+    DROP INDEX IF EXISTS idx_jobs_video;
+    CREATE INDEX IF NOT EXISTS idx_jobs_video ON jobs(video_id, created_at);
+    """)
+
+def _migration_3(conn):
+    """Busca no catálogo: índices para faixas (duração, tamanho, resolução), saídas por filtro e
+    índice FTS5 (trigram) sobre original_name, mantido por triggers. Sem FTS5 no SQLite, a busca
+    por nome cai para LIKE."""
+    _execute_script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_videos_duration ON videos(duration_sec, id);
+    CREATE INDEX IF NOT EXISTS idx_videos_size ON videos(size_bytes, id);
+    CREATE INDEX IF NOT EXISTS idx_videos_height ON videos(height, width);
+    CREATE INDEX IF NOT EXISTS idx_outputs_filter ON video_outputs(filter, video_id);
+    DROP INDEX IF EXISTS idx_videos_filter;
+    CREATE INDEX IF NOT EXISTS idx_videos_filter_created ON videos(filter, created_at, id);
+    """)
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5("
+                     "original_name, content='videos', content_rowid='rowid', tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    _execute_script(conn, """
+    CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+        INSERT INTO videos_fts(rowid, original_name) VALUES (new.rowid, new.original_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+        INSERT INTO videos_fts(videos_fts, rowid, original_name) VALUES ('delete', old.rowid, old.original_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF original_name ON videos BEGIN
+        INSERT INTO videos_fts(videos_fts, rowid, original_name) VALUES ('delete', old.rowid, old.original_name);
+        INSERT INTO videos_fts(rowid, original_name) VALUES (new.rowid, new.original_name);
+    END
+    """)
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+
+def _migration_4(conn):
+    """Revisão do catálogo: contador incrementado por triggers a cada escrita em videos e
+    video_outputs, de qualquer processo. Os caches de resposta comparam com ele para invalidar."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS catalog_rev (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        rev INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO catalog_rev (id, rev) VALUES (1, 0);
+    """)
+    for table in ('videos', 'video_outputs'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_rev_{event.lower()} AFTER {event} ON {table} "
+                         f"BEGIN UPDATE catalog_rev SET rev = rev + 1 WHERE id = 1; END")
+
+def _migration_5(conn):
+    """Sincronização incremental: cada vídeo guarda em `rev` a revisão do catálogo da sua última
+    alteração (inclusive das saídas em video_outputs) e vídeos removidos deixam uma lápide em
+    video_tombstones. Os triggers da migração 4 são trocados por versões que também marcam a linha."""
+    _ensure_columns(conn, 'videos', {'rev': 'INTEGER'})
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS video_tombstones (
+        id TEXT PRIMARY KEY,
+        rev INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tombstones_rev ON video_tombstones(rev, id);
+    CREATE INDEX IF NOT EXISTS idx_videos_rev ON videos(rev, id);
+    """)
+    for table in ('videos', 'video_outputs'):
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_rev_{event}")
+    bump = "UPDATE catalog_rev SET rev = rev + 1 WHERE id = 1;"
+    # Linhas existentes entram todas numa revisão nova (> 0, para aparecerem em since=0)
+    conn.execute(bump)
+    conn.execute("UPDATE videos SET rev = (SELECT rev FROM catalog_rev WHERE id = 1)")
+    current = "(SELECT rev FROM catalog_rev WHERE id = 1)"
+    # UPDATE OF sem a coluna rev: a marcação feita pelo próprio trigger não dispara outro
+    _execute_script(conn, f"""
+    CREATE TRIGGER IF NOT EXISTS videos_rev_insert AFTER INSERT ON videos BEGIN
+        {bump}
+        UPDATE videos SET rev = {current} WHERE rowid = new.rowid;
+        DELETE FROM video_tombstones WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS videos_rev_update AFTER UPDATE OF {', '.join(COLUMNS)} ON videos BEGIN
+        {bump}
+        UPDATE videos SET rev = {current} WHERE rowid = new.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS videos_rev_delete AFTER DELETE ON videos BEGIN
+        {bump}
+        INSERT OR REPLACE INTO video_tombstones (id, rev) VALUES (old.id, {current});
+    END;
+    CREATE TRIGGER IF NOT EXISTS video_outputs_rev_insert AFTER INSERT ON video_outputs BEGIN
+        {bump}
+        UPDATE videos SET rev = {current} WHERE id = new.video_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS video_outputs_rev_update AFTER UPDATE ON video_outputs BEGIN
+        {bump}
+        UPDATE videos SET rev = {current} WHERE id IN (old.video_id, new.video_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS video_outputs_rev_delete AFTER DELETE ON video_outputs BEGIN
+        {bump}
+        UPDATE videos SET rev = {current} WHERE id = old.video_id;
+    END
+    """)
+
+def _usage_sql(table: str, kind: str, row: str, day: str, sign: str) -> str:
+    """UPSERT em disk_usage somando (sign='+') ou tirando (sign='-') os bytes da linha `row` (new/old)."""
+    size = 'size_bytes' if table == 'blobs' else 'bytes'
+    return (f"INSERT INTO disk_usage (day, kind, bytes, files) "
+            f"VALUES (COALESCE(substr({row}.{day}, 1, 10), ''), '{kind}', {sign}COALESCE({row}.{size}, 0), {sign}1) "
+            f"ON CONFLICT(day, kind) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files;")
+
+def _migration_6(conn):
+    """Ciclo de vida: índice de uso de disco por dia (disk_usage, mantido por triggers em blobs,
+    derived e trash, para as cotas não varrerem o disco), lixeira, estado quente/frio e último
+    acesso de cada vídeo, e a chave do cache de derivados em cada saída."""
+    _ensure_columns(conn, 'video_outputs', {'cache_key': 'TEXT'})
+    _ensure_columns(conn, 'derived', {'bytes': 'INTEGER'})
+    _execute_script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_outputs_cache_key ON video_outputs(cache_key);
+    CREATE INDEX IF NOT EXISTS idx_blobs_refcount ON blobs(refcount);
+    CREATE INDEX IF NOT EXISTS idx_derived_refcount ON derived(refcount);
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs(status, updated_at);
+    CREATE TABLE IF NOT EXISTS disk_usage (
+        day TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        files INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, kind)
+    );
+    CREATE TABLE IF NOT EXISTS trash (
+        video_id TEXT PRIMARY KEY,
+        path TEXT,
+        bytes INTEGER,
+        deleted_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_trash_deleted ON trash(deleted_at);
+    CREATE TABLE IF NOT EXISTS video_storage (
+        video_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL DEFAULT 'hot',
+        last_access TEXT,
+        cold_at TEXT
+    );
+    """)
+    # Uso já existente: originais (blobs); derivados antigos não têm tamanho e entram quando o GC medir
+    conn.execute("INSERT OR REPLACE INTO disk_usage (day, kind, bytes, files) "
+                 "SELECT COALESCE(substr(created_at, 1, 10), ''), 'original', SUM(COALESCE(size_bytes, 0)), COUNT(*) "
+                 "FROM blobs GROUP BY 1")
+    for table, kind, day in (('blobs', 'original', 'created_at'), ('derived', 'processed', 'created_at'),
+                             ('trash', 'trash', 'deleted_at')):
+        size = 'size_bytes' if table == 'blobs' else 'bytes'
+        _execute_script(conn, f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_usage_insert AFTER INSERT ON {table} BEGIN
+            {_usage_sql(table, kind, 'new', day, '')}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_usage_update AFTER UPDATE OF {size}, {day} ON {table} BEGIN
+            {_usage_sql(table, kind, 'old', day, '-')}
+            {_usage_sql(table, kind, 'new', day, '')}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_usage_delete AFTER DELETE ON {table} BEGIN
+            {_usage_sql(table, kind, 'old', day, '-')}
+        END
+        """)
+
+# Cada migração roda uma única vez; PRAGMA user_version guarda quantas já foram aplicadas
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5, _migration_6]
+
 def connect(db_path: str):
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # A conexão pode ser usada por outra thread depois de devolvida ao pool (nunca por duas ao mesmo tempo)
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
     conn.row_factory = sqlite3.Row
+    # WAL: leitores não bloqueiam o escritor (e vice-versa); NORMAL basta com WAL
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
-_conn_cache = {}
-def _get_conn(db_path: str):
-    if db_path not in _conn_cache:
-        _conn_cache[db_path] = connect(db_path)
-    return _conn_cache[db_path]
+class _Pool:
+    """Conexões reaproveitadas entre requisições. Cada chamada pega uma conexão livre (ou abre
+    uma nova) e a devolve ao final; até `size` conexões ficam guardadas."""
+    def __init__(self, db_path: str, size: int):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()
 
-def init_db(db_path: str):
-    conn = _get_conn(db_path)
-    conn.execute(SCHEMA)
-    conn.commit()
+    def get(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return connect(self.db_path)
+
+    def put(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self.idle.qsize() < self.size:
+            self.idle.put(conn)
+        else:
+            conn.close()
 
-# Para simplificar, usaremos o arquivo padrão 'server.db'
+# Banco usado pelas funções abaixo; init_db troca pelo caminho configurado
 DEFAULT_DB = 'server.db'
+_db_path = DEFAULT_DB
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+def _pool(db_path: str | None = None) -> _Pool:
+    db_path = db_path or _db_path
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = _Pool(db_path, DB_POOL_SIZE)
+        return _pools[db_path]
+
+@contextmanager
+def _db(db_path: str | None = None):
+    """Conexão do pool para uma operação: commit no fim, rollback em caso de erro.
+    Dentro de `batch()`, usa a conexão (e a transação) do lote."""
+    conn = getattr(_local, 'batch', None)
+    if conn is not None:
+        yield conn
+        return
+    pool = _pool(db_path)
+    conn = pool.get()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.put(conn)
+
+@contextmanager
+def batch():
+    """Agrupa as escritas feitas dentro do bloco (nesta thread) numa única transação: um commit só."""
+    if getattr(_local, 'batch', None) is not None:
+        yield
+        return
+    with _db() as conn:
+        _local.batch = conn
+        try:
+            yield
+        finally:
+            _local.batch = None
 
+def init_db(db_path: str):
+    """Passa a usar `db_path` e aplica as migrações pendentes (serializadas entre processos)."""
+    global _db_path
+    _db_path = db_path
+    with _db(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+@_timed
 def insert_video(meta: dict):
-    conn = _get_conn(DEFAULT_DB)
-    q = f"INSERT OR REPLACE INTO videos ({', '.join(COLUMNS)}) VALUES ({', '.join(['?']*len(COLUMNS))})"
-    values = [meta.get(k) for k in COLUMNS]
-    conn.execute(q, values)
-    conn.commit()
+    with _db() as conn:
+        # UPSERT (e não INSERT OR REPLACE) preserva o rowid usado pelo índice de busca videos_fts
+        q = (f"INSERT INTO videos ({', '.join(COLUMNS)}) VALUES ({', '.join(['?']*len(COLUMNS))}) "
+             f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])}")
+        meta = {**meta, 'checksum': meta.get('checksum') or (meta.get('checksums') or {}).get('sha1')}
+        values = [meta.get(k) for k in COLUMNS]
+        conn.execute(q, values)
+
+# Ordenações aceitas na busca (prefixo '-' = decrescente) e faixas numéricas filtráveis
+SORT_COLUMNS = {
+    'created_at': 'created_at', 'name': 'original_name', 'duration': 'duration_sec',
+    'size': 'size_bytes', 'width': 'width', 'height': 'height',
+}
+RANGE_COLUMNS = {
+    'width': 'width', 'height': 'height', 'duration': 'duration_sec', 'size': 'size_bytes', 'fps': 'fps',
+}
+
+def _parse_sort(sort: str) -> tuple:
+    key = (sort or '-created_at').strip()
+    desc = key.startswith('-')
+    key = key.lstrip('-+')
+    if key not in SORT_COLUMNS:
+        raise ValueError(f"Ordenação inválida: {sort}")
+    return key, SORT_COLUMNS[key], desc
+
+def encode_cursor(row: dict, sort: str = '-created_at') -> str:
+    key, col, _ = _parse_sort(sort)
+    raw = json.dumps([key, row[col], row['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, sort: str = '-created_at') -> tuple:
+    """Posição (valor da coluna de ordenação, id) de um cursor de encode_cursor.
+    Levanta ValueError se o cursor for inválido ou de outra ordenação."""
+    key = _parse_sort(sort)[0]
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_key, value, vid = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor inválido") from e
+    if cursor_key != key:
+        raise ValueError("Cursor inválido para esta ordenação")
+    return value, str(vid)
+
+def _has_fts(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'videos_fts'").fetchone() is not None
+
+@_timed
+def search_videos(filters: list | None = None, ranges: dict | None = None, since: str | None = None,
+                  until: str | None = None, q: str | None = None, sort: str = '-created_at',
+                  limit: int = 100, cursor: str | None = None):
+    """Busca no catálogo com paginação por cursor (keyset) na ordem pedida.
+
+    `filters`: vídeos com alguma saída nesses filtros; `ranges`: {'duration': (min, max), ...} com
+    chaves de RANGE_COLUMNS (None = sem limite); `since`/`until`: faixa de created_at em ISO 8601 (`until` exclusivo, ex.: até '2024-02-01');
+    `q`: trecho do nome original (FTS5 trigram a partir de 3 caracteres, senão LIKE).
+    Levanta ValueError para ordenação, faixa ou cursor inválidos.
+    """
+    key, col, desc = _parse_sort(sort)
+    where, args = [], []
+    if filters:
+        marks = ', '.join('?' * len(filters))
+        where.append(f"(filter IN ({marks}) OR id IN (SELECT video_id FROM video_outputs WHERE filter IN ({marks})))")
+        args += [*filters, *filters]
+    for name, (lo, hi) in (ranges or {}).items():
+        if name not in RANGE_COLUMNS:
+            raise ValueError(f"Faixa inválida: {name}")
+        if lo is not None:
+            where.append(f"{RANGE_COLUMNS[name]} >= ?")
+            args.append(lo)
+        if hi is not None:
+            where.append(f"{RANGE_COLUMNS[name]} <= ?")
+            args.append(hi)
+    if since:
+        where.append("created_at >= ?")
+        args.append(since)
+    if until:
+        where.append("created_at < ?")
+        args.append(until)
+    if cursor:
+        where.append(f"({col}, id) {'<' if desc else '>'} (?, ?)")
+        args += list(decode_cursor(cursor, sort))
+
+    order = 'DESC' if desc else 'ASC'
+    with _db() as conn:
+        if q:
+            if len(q) >= 3 and _has_fts(conn):
+                where.append("rowid IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)")
+                args.append('"' + q.replace('"', '""') + '"')
+            else:
+                where.append("original_name LIKE ? ESCAPE '\\'")
+                args.append('%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        sql = "SELECT * FROM videos"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {col} {order}, id {order} LIMIT ?"
+        cur = conn.execute(sql, [*args, limit])
+        return [dict(r) for r in cur.fetchall()]
+
+def list_videos(limit: int = 100, cursor: str | None = None):
+    """Vídeos do mais novo para o mais antigo, paginados por cursor (índice idx_videos_created)."""
+    return search_videos(limit=limit, cursor=cursor)
+
+@_timed
+def catalog_revision() -> int:
+    with _db() as conn:
+        return conn.execute("SELECT rev FROM catalog_rev WHERE id = 1").fetchone()[0]
+
+def parse_change_cursor(cursor: str | None) -> tuple:
+    """Posição no feed de alterações: 'N' (tudo depois da revisão N) ou 'N:id' (meio de uma
+    revisão, quando a página anterior parou nela). Levanta ValueError se o cursor for inválido."""
+    rev, sep, vid = (cursor or '0').partition(':')
+    try:
+        rev = int(rev)
+    except ValueError:
+        raise ValueError("Cursor de alterações inválido") from None
+    if rev < 0 or (sep and not vid):
+        raise ValueError("Cursor de alterações inválido")
+    return rev, vid or None
 
-def list_videos(limit: int = 100):
-    conn = _get_conn(DEFAULT_DB)
-    cur = conn.execute("SELECT * FROM videos ORDER BY created_at DESC LIMIT ?", (limit,))
-    return [dict(r) for r in cur.fetchall()]
+@_timed
+def video_changes(cursor: str | None = None, limit: int = 1000) -> dict:
+    """Vídeos novos/alterados e ids removidos depois de `cursor`, na ordem em que mudaram.
 
+    Devolve {'changed': [linhas], 'deleted': [ids], 'cursor': posição para a próxima chamada,
+    'more': se a página encheu, 'rev': revisão atual do catálogo, 'reset': cursor de outro banco
+    (à frente da revisão atual), o cliente deve recomeçar do zero}. Tudo sai do mesmo snapshot.
+    Levanta ValueError para cursor inválido."""
+    rev, vid = parse_change_cursor(cursor)
+    if vid is None:
+        after, args = "rev > ?", [rev]
+    else:
+        after, args = "(rev, id) > (?, ?)", [rev, vid]
+    with _db() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        current = conn.execute("SELECT rev FROM catalog_rev WHERE id = 1").fetchone()[0]
+        keys = conn.execute(
+            f"SELECT rev, id, 0 AS deleted FROM videos WHERE {after} "
+            f"UNION ALL SELECT rev, id, 1 FROM video_tombstones WHERE {after} "
+            f"ORDER BY rev, id LIMIT ?", [*args, *args, limit]).fetchall()
+        live = [k['id'] for k in keys if not k['deleted']]
+        rows = {}
+        for i in range(0, len(live), 500):
+            part = live[i:i + 500]
+            for r in conn.execute(f"SELECT * FROM videos WHERE id IN ({', '.join('?' * len(part))})", part):
+                rows[r['id']] = dict(r)
+    more = len(keys) == limit
+    if not keys:
+        next_cursor = cursor or '0'
+    elif more:
+        next_cursor = f"{keys[-1]['rev']}:{keys[-1]['id']}"
+    else:
+        next_cursor = str(keys[-1]['rev'])
+    return {
+        'changed': [rows[k['id']] for k in keys if not k['deleted'] and k['id'] in rows],
+        'deleted': [k['id'] for k in keys if k['deleted']],
+        'cursor': next_cursor,
+        'more': more,
+        'rev': current,
+        'reset': rev > current,
+    }
+
+@_timed
 def get_video(vid: str):
-    conn = _get_conn(DEFAULT_DB)
-    cur = conn.execute("SELECT * FROM videos WHERE id = ?", (vid,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM videos WHERE id = ?", (vid,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+@_timed
+def find_video_by_checksum(sha1: str):
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM videos WHERE checksum = ? LIMIT 1", (sha1,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+# ==========================
+# Saídas processadas (uma por filtro em processed/<filtro>/)
+# ==========================
+
+OUTPUT_COLUMNS = ['video_id','filter','params','path_processed','thumb_frame','thumb_gif','path_hls','created_at','cache_key']
+
+def _output_row(row):
+    out = dict(row)
+    out['params'] = json.loads(out['params']) if out.get('params') else {}
+    return out
+
+@_timed
+def insert_output(vid: str, filter_name: str, params: dict | None, files: dict, cache_key: str | None = None):
+    """Grava a saída; `cache_key` é a entrada de derived que ela referencia (refcount)."""
+    with _db() as conn:
+        values = [vid, filter_name, json.dumps(params or {}), files.get('path_processed'), files.get('thumb_frame'),
+                  files.get('thumb_gif'), files.get('path_hls'), _now(), cache_key]
+        conn.execute(
+            f"INSERT OR REPLACE INTO video_outputs ({', '.join(OUTPUT_COLUMNS)}) "
+            f"VALUES ({', '.join(['?']*len(OUTPUT_COLUMNS))})",
+            values,
+        )
+
+@_timed
+def get_output(vid: str, filter_name: str):
+    with _db() as conn:
+        row = conn.execute("SELECT * FROM video_outputs WHERE video_id = ? AND filter = ?", (vid, filter_name)).fetchone()
+        return _output_row(row) if row else None
+
+@_timed
+def list_outputs(vid: str):
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM video_outputs WHERE video_id = ? ORDER BY created_at", (vid,))
+        return [_output_row(r) for r in cur.fetchall()]
+
+@_timed
+def delete_outputs(vid: str, filters: list | None = None) -> list:
+    """Remove as saídas do vídeo (todas ou só as de `filters`) e devolve as linhas removidas."""
+    with _db() as conn:
+        sql, args = "SELECT * FROM video_outputs WHERE video_id = ?", [vid]
+        if filters is not None:
+            sql += f" AND filter IN ({', '.join('?' * len(filters))})"
+            args += list(filters)
+        rows = [_output_row(r) for r in conn.execute(sql, args).fetchall()]
+        conn.executemany("DELETE FROM video_outputs WHERE video_id = ? AND filter = ?",
+                         [(vid, r['filter']) for r in rows])
+        return rows
+
+# ==========================
+# Armazenamento por conteúdo (blobs e resultados derivados)
+# ==========================
+
+@_timed
+def get_blob(sha1: str):
+    with _db() as conn:
+        row = conn.execute("SELECT * FROM blobs WHERE sha1 = ?", (sha1,)).fetchone()
+        return dict(row) if row else None
+
+@_timed
+def insert_blob(sha1: str, path: str, size_bytes: int):
+    with _db() as conn:
+        # UPSERT (e não INSERT OR REPLACE): o trigger de UPDATE corrige o uso de disco da linha antiga.
+        # Dois uploads dos mesmos bytes podem chegar aqui juntos: a referência de cada um é somada
+        conn.execute(
+            "INSERT INTO blobs (sha1, path, size_bytes, refcount, created_at) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(sha1) DO UPDATE SET path = excluded.path, size_bytes = excluded.size_bytes, "
+            "refcount = MAX(refcount, 0) + 1, created_at = excluded.created_at",
+            (sha1, path, size_bytes, _now()),
+        )
+
+@_timed
+def incr_blob_ref(sha1: str, delta: int = 1):
+    with _db() as conn:
+        conn.execute("UPDATE blobs SET refcount = refcount + ? WHERE sha1 = ?", (delta, sha1))
+
+@_timed
+def get_derived(cache_key: str):
+    with _db() as conn:
+        row = conn.execute("SELECT * FROM derived WHERE cache_key = ?", (cache_key,)).fetchone()
+        return dict(row) if row else None
+
+@_timed
+def insert_derived(entry: dict):
+    with _db() as conn:
+        cols = ['cache_key','sha1','filter','params','codec','path_processed','thumb_frame','thumb_gif','path_hls','bytes']
+        conn.execute(
+            f"INSERT INTO derived ({', '.join(cols)}, refcount, created_at) "
+            f"VALUES ({', '.join(['?']*len(cols))}, 1, ?) "
+            f"ON CONFLICT(cache_key) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in cols[1:])}, "
+            f"refcount = MAX(refcount, 0) + 1, created_at = excluded.created_at",
+            [entry.get(k) for k in cols] + [_now()],
+        )
+
+@_timed
+def incr_derived_ref(cache_key: str, delta: int = 1):
+    with _db() as conn:
+        conn.execute("UPDATE derived SET refcount = refcount + ? WHERE cache_key = ?", (delta, cache_key))
+
+@_timed
+def delete_derived(cache_key: str):
+    with _db() as conn:
+        conn.execute("DELETE FROM derived WHERE cache_key = ?", (cache_key,))
+
+@_timed
+def repoint_derived(cache_key: str, vid: str):
+    """Se a entrada de derived aponta para os arquivos do vídeo `vid` (que vão sair do disco), passa a
+    apontar para outra saída com a mesma chave, se houver; senão a entrada é apagada."""
+    with _db() as conn:
+        entry = conn.execute("SELECT path_processed FROM derived WHERE cache_key = ?", (cache_key,)).fetchone()
+        if entry is None:
+            return
+        owner = conn.execute("SELECT video_id FROM video_outputs WHERE path_processed = ?",
+                             (entry['path_processed'],)).fetchone()
+        if owner is not None and owner['video_id'] != vid:
+            return
+        other = conn.execute(
+            "SELECT o.* FROM video_outputs o LEFT JOIN video_storage s ON s.video_id = o.video_id "
+            "WHERE o.cache_key = ? AND o.video_id != ? AND COALESCE(s.state, 'hot') != 'cold' LIMIT 1",
+            (cache_key, vid)).fetchone()
+        if other is None:
+            conn.execute("DELETE FROM derived WHERE cache_key = ?", (cache_key,))
+        else:
+            conn.execute("UPDATE derived SET path_processed = ?, thumb_frame = ?, thumb_gif = ?, path_hls = ? "
+                         "WHERE cache_key = ?", (other['path_processed'], other['thumb_frame'], other['thumb_gif'],
+                                                 other['path_hls'], cache_key))
+
+@_timed
+def derived_without_size(limit: int = 500) -> list:
+    """Entradas de derived gravadas antes do índice de uso de disco (tamanho ainda não medido)."""
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM derived WHERE bytes IS NULL LIMIT ?", (limit,))
+        return [dict(r) for r in cur.fetchall()]
+
+@_timed
+def set_derived_size(cache_key: str, size: int):
+    with _db() as conn:
+        conn.execute("UPDATE derived SET bytes = ? WHERE cache_key = ?", (size, cache_key))
+
+@_timed
+def delete_unreferenced() -> tuple:
+    """Apaga blobs e derivados com refcount <= 0. Devolve (blobs apagados, nº de derivados apagados);
+    os arquivos dos blobs ficam por conta de quem chamou."""
+    with _db() as conn:
+        blobs = [dict(r) for r in conn.execute("SELECT * FROM blobs WHERE refcount <= 0").fetchall()]
+        conn.executemany("DELETE FROM blobs WHERE sha1 = ? AND refcount <= 0", [(b['sha1'],) for b in blobs])
+        derived = conn.execute("DELETE FROM derived WHERE refcount <= 0").rowcount
+        return blobs, derived
+
+@_timed
+def dedup_totals():
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS blobs, COALESCE(SUM(size_bytes * (refcount - 1)), 0) AS bytes_saved FROM blobs"
+        ).fetchone()
+        derived = conn.execute("SELECT COUNT(*) FROM derived").fetchone()[0]
+        return {'blobs': row['blobs'], 'derived': derived, 'bytes_saved': row['bytes_saved']}
+
+# ==========================
+# Jobs (fila de processamento)
+# ==========================
+
+JOB_COLUMNS = ['id','video_id','status','progress','params','error','created_at','updated_at']
+
+def _job_row(row):
+    if not row:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params']) if job.get('params') else {}
+    return job
+
+@_timed
+def insert_job(job_id: str, video_id: str, params: dict):
+    with _db() as conn:
+        now = _now()
+        conn.execute(
+            f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join(['?']*len(JOB_COLUMNS))})",
+            (job_id, video_id, 'queued', 0.0, json.dumps(params, ensure_ascii=False), None, now, now),
+        )
+
+@_timed
+def get_job(job_id: str):
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return _job_row(cur.fetchone())
+
+@_timed
+def get_latest_job_for_video(vid: str):
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM jobs WHERE video_id = ? ORDER BY created_at DESC LIMIT 1", (vid,))
+        return _job_row(cur.fetchone())
+
+@_timed
+def count_jobs(status: str = 'queued') -> int:
+    with _db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+@_timed
+def count_active_jobs(vid: str) -> dict:
+    """Jobs do vídeo ainda na fila ou em execução: {'queued': n, 'running': n}."""
+    with _db() as conn:
+        cur = conn.execute("SELECT status, COUNT(*) AS n FROM jobs WHERE video_id = ? "
+                           "AND status IN ('queued', 'running') GROUP BY status", (vid,))
+        counts = {'queued': 0, 'running': 0}
+        counts.update({r['status']: r['n'] for r in cur.fetchall()})
+        return counts
+
+@_timed
+def cancel_queued_jobs(vid: str) -> int:
+    """Cancela os jobs na fila de um vídeo já registrado (o upload de um vídeo ainda sem linha não é tocado)."""
+    with _db() as conn:
+        cur = conn.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE video_id = ? AND status = 'queued' "
+                           "AND EXISTS (SELECT 1 FROM videos WHERE id = ?)", (_now(), vid, vid))
+        return cur.rowcount
+
+@_timed
+def failed_uploads(before: str, limit: int = 100) -> list:
+    """Jobs de upload que falharam (ou foram cancelados) antes de `before` e cujo vídeo nunca foi
+    registrado: a pasta do vídeo ficou órfã."""
+    with _db() as conn:
+        cur = conn.execute(
+            "SELECT * FROM jobs WHERE status IN ('failed', 'cancelled') AND updated_at < ? "
+            "AND COALESCE(json_extract(params, '$.kind'), 'upload') = 'upload' "
+            "AND video_id NOT IN (SELECT id FROM videos) ORDER BY updated_at LIMIT ?", (before, limit))
+        return [_job_row(r) for r in cur.fetchall()]
+
+@_timed
+def claim_next_job():
+    """Marca o job mais antigo na fila como 'running'. Seguro entre processos:
+    o UPDATE só vale se o job ainda estiver 'queued'."""
+    with _db() as conn:
+        while True:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (_now(), row['id']),
+            )
+            conn.commit()
+            if cur.rowcount == 1:
+                return get_job(row['id'])
+
+@_timed
+def update_job(job_id: str, **fields):
+    fields['updated_at'] = _now()
+    with _db() as conn:
+        sets = ', '.join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE jobs SET {sets} WHERE id = ?", [*fields.values(), job_id])
+
+@_timed
+def requeue_running_jobs():
+    """Jobs que estavam 'running' quando o servidor caiu voltam para a fila."""
+    with _db() as conn:
+        cur = conn.execute("UPDATE jobs SET status = 'queued', progress = 0, updated_at = ? WHERE status = 'running'", (_now(),))
+        return cur.rowcount
+
+# ==========================
+# Uploads retomáveis (sessões e blocos recebidos)
+# ==========================
+
+@_timed
+def insert_upload_session(sid: str, filename: str, size_bytes: int, chunk_size: int, filter_name: str,
+                          params: dict | None = None):
+    with _db() as conn:
+        now = _now()
+        conn.execute(
+            "INSERT INTO upload_sessions (id, filename, size_bytes, chunk_size, filter, params, status, video_id, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'open', NULL, ?, ?)",
+            (sid, filename, size_bytes, chunk_size, filter_name, json.dumps(params or {}), now, now),
+        )
+
+@_timed
+def get_upload_session(sid: str):
+    with _db() as conn:
+        row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (sid,)).fetchone()
+        return dict(row) if row else None
+
+@_timed
+def update_upload_session(sid: str, **fields):
+    fields['updated_at'] = _now()
+    with _db() as conn:
+        sets = ', '.join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE upload_sessions SET {sets} WHERE id = ?", [*fields.values(), sid])
+
+@_timed
+def claim_upload_session(sid: str) -> bool:
+    """Passa a sessão de 'open' para 'finalizing'; False se outra requisição já fez isso."""
+    with _db() as conn:
+        cur = conn.execute(
+            "UPDATE upload_sessions SET status = 'finalizing', updated_at = ? WHERE id = ? AND status = 'open'",
+            (_now(), sid),
+        )
+        return cur.rowcount == 1
+
+@_timed
+def expire_upload_sessions(before: str) -> list:
+    """Sessões abertas sem atividade desde `before` passam a 'expired'; devolve os ids."""
+    with _db() as conn:
+        ids = [r['id'] for r in conn.execute(
+            "SELECT id FROM upload_sessions WHERE status = 'open' AND updated_at < ?", (before,)).fetchall()]
+        conn.executemany("UPDATE upload_sessions SET status = 'expired', updated_at = ? WHERE id = ? AND status = 'open'",
+                         [(_now(), sid) for sid in ids])
+        return ids
+
+@_timed
+def upload_session_ids(statuses: tuple = ('open', 'finalizing')) -> set:
+    with _db() as conn:
+        cur = conn.execute(f"SELECT id FROM upload_sessions WHERE status IN ({', '.join('?' * len(statuses))})",
+                           statuses)
+        return {r['id'] for r in cur.fetchall()}
+
+@_timed
+def record_upload_chunk(sid: str, offset: int, length: int, sha1: str):
+    with _db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO upload_chunks (session_id, offset, length, sha1) VALUES (?, ?, ?, ?)",
+            (sid, offset, length, sha1),
+        )
+        conn.execute("UPDATE upload_sessions SET updated_at = ? WHERE id = ?", (_now(), sid))
+
+@_timed
+def list_upload_chunks(sid: str):
+    with _db() as conn:
+        cur = conn.execute("SELECT offset, length FROM upload_chunks WHERE session_id = ? ORDER BY offset", (sid,))
+        return [dict(r) for r in cur.fetchall()]
+
+# ==========================
+# Ciclo de vida: lixeira, estado quente/frio e uso de disco
+# ==========================
+
+@_timed
+def delete_video(vid: str):
+    """Remove a linha do vídeo (o trigger deixa a lápide para a sincronização) e o estado dele."""
+    with _db() as conn:
+        conn.execute("DELETE FROM videos WHERE id = ?", (vid,))
+        conn.execute("DELETE FROM video_storage WHERE video_id = ?", (vid,))
+
+@_timed
+def insert_trash(vid: str, path: str, size: int):
+    with _db() as conn:
+        conn.execute("INSERT INTO trash (video_id, path, bytes, deleted_at) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(video_id) DO UPDATE SET path = excluded.path, bytes = excluded.bytes, "
+                     "deleted_at = excluded.deleted_at", (vid, path, size, _now()))
+
+@_timed
+def expired_trash(before: str, limit: int = 100) -> list:
+    with _db() as conn:
+        cur = conn.execute("SELECT * FROM trash WHERE deleted_at < ? ORDER BY deleted_at LIMIT ?", (before, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+@_timed
+def delete_trash(vid: str):
+    with _db() as conn:
+        conn.execute("DELETE FROM trash WHERE video_id = ?", (vid,))
+
+@_timed
+def count_trash() -> int:
+    with _db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM trash").fetchone()[0]
+
+@_timed
+def touch_video(vid: str):
+    """Registra acesso ao vídeo (não altera a linha em videos, então não mexe na revisão do catálogo)."""
+    with _db() as conn:
+        conn.execute("INSERT INTO video_storage (video_id, last_access) VALUES (?, ?) "
+                     "ON CONFLICT(video_id) DO UPDATE SET last_access = excluded.last_access", (vid, _now()))
+
+@_timed
+def get_video_state(vid: str) -> str:
+    with _db() as conn:
+        row = conn.execute("SELECT state FROM video_storage WHERE video_id = ?", (vid,)).fetchone()
+        return row['state'] if row else 'hot'
+
+@_timed
+def set_video_state(vid: str, state: str, expected: str | None = None) -> bool:
+    """Troca o estado (hot, cold, warming). Com `expected`, só se o estado atual for esse (False se não era)."""
+    with _db() as conn:
+        conn.execute("INSERT OR IGNORE INTO video_storage (video_id) VALUES (?)", (vid,))
+        sql = "UPDATE video_storage SET state = ?, cold_at = CASE WHEN ? = 'cold' THEN ? ELSE cold_at END WHERE video_id = ?"
+        args = [state, state, _now(), vid]
+        if expected is not None:
+            sql += " AND state = ?"
+            args.append(expected)
+        return conn.execute(sql, args).rowcount == 1
+
+@_timed
+def idle_videos(before: str, limit: int = 100) -> list:
+    """Vídeos quentes com saídas processadas e sem acesso (ou, se nunca acessados, criados) antes de
+    `before`, do mais antigo ao mais novo."""
+    with _db() as conn:
+        cur = conn.execute(
+            "SELECT v.* FROM videos v LEFT JOIN video_storage s ON s.video_id = v.id "
+            "WHERE COALESCE(s.state, 'hot') = 'hot' AND COALESCE(s.last_access, v.created_at) < ? "
+            "AND EXISTS (SELECT 1 FROM video_outputs o WHERE o.video_id = v.id) "
+            "ORDER BY COALESCE(s.last_access, v.created_at) LIMIT ?", (before, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+@_timed
+def stale_outputs(before: str, limit: int = 100) -> list:
+    """Saídas extras (filtro diferente do principal) de vídeos sem acesso desde `before`."""
+    with _db() as conn:
+        cur = conn.execute(
+            "SELECT o.* FROM video_outputs o JOIN videos v ON v.id = o.video_id "
+            "LEFT JOIN video_storage s ON s.video_id = o.video_id "
+            "WHERE o.filter != v.filter AND COALESCE(s.last_access, o.created_at) < ? "
+            "ORDER BY o.created_at LIMIT ?", (before, limit))
+        return [_output_row(r) for r in cur.fetchall()]
+
+@_timed
+def disk_usage(days: int | None = None) -> list:
+    """Uso de disco por dia e tipo (original, processed, trash), do dia mais recente para o mais antigo."""
+    with _db() as conn:
+        sql = "SELECT day, kind, bytes, files FROM disk_usage WHERE bytes != 0 OR files != 0 ORDER BY day DESC, kind"
+        rows = [dict(r) for r in conn.execute(sql).fetchall()]
+    if days is not None:
+        keep = sorted({r['day'] for r in rows}, reverse=True)[:days]
+        rows = [r for r in rows if r['day'] in keep]
+    return rows
+
+@_timed
+def disk_usage_total(day: str | None = None) -> int:
+    with _db() as conn:
+        if day is None:
+            return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM disk_usage").fetchone()[0]
+        return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM disk_usage WHERE day = ?", (day,)).fetchone()[0]
@@ -0,0 +1,89 @@
+# server/dedup.py
+"""Armazenamento endereçado por conteúdo.
+
+Originais são guardados uma vez em MEDIA_ROOT/blobs/ por SHA-1 e ligados (hardlink) na pasta de
+cada vídeo. Resultados de filtro ficam indexados por (sha1, filtro, parâmetros, codec): um
+re-upload dos mesmos bytes com um filtro já executado reaproveita vídeo processado, thumbnail e GIF.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+from db import (
+    get_blob, insert_blob, incr_blob_ref, get_derived, insert_derived, incr_derived_ref,
+    delete_derived, dedup_totals,
+)
+from storage import blob_path, link_or_copy, link_tree, output_files_size
+from metrics import counter, values
+
+LOOKUPS = counter('video_dedup_lookups_total', 'Consultas ao armazenamento por conteúdo (original/derivado)',
+                  ['kind', 'result'])
+
+def derived_key(sha1: str, filter_name: str, params: dict, codec: str) -> str:
+    raw = json.dumps([sha1, filter_name, params or {}, codec], sort_keys=True)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def store_original(sha1: str, path: Path) -> bool:
+    """Garante o original em `path`. Se o blob já existe, o arquivo recebido é descartado e
+    substituído por um hardlink para ele (retorna True); senão o arquivo vira o blob."""
+    blob = get_blob(sha1)
+    if blob and Path(blob['path']).exists():
+        link_or_copy(Path(blob['path']), path)
+        incr_blob_ref(sha1)
+        LOOKUPS.inc(kind='original', result='hit')
+        return True
+    LOOKUPS.inc(kind='original', result='miss')
+    dest = blob_path(sha1, path.suffix.lower())
+    link_or_copy(path, dest)
+    insert_blob(sha1, str(dest), dest.stat().st_size)
+    return False
+
+def lookup_derived(cache_key: str):
+    """Resultado já processado para a chave, se todos os arquivos ainda existem."""
+    entry = get_derived(cache_key)
+    if entry and all(entry.get(k) is None or Path(entry[k]).exists()
+                     for k in ('path_processed', 'thumb_frame', 'thumb_gif', 'path_hls')):
+        LOOKUPS.inc(kind='derived', result='hit')
+        return entry
+    if entry:
+        delete_derived(cache_key)
+    LOOKUPS.inc(kind='derived', result='miss')
+    return None
+
+def reuse_derived(entry: dict, dir_processed: Path, dir_thumbs: Path) -> dict:
+    """Liga os arquivos do resultado em cache na pasta do novo vídeo e devolve os novos caminhos."""
+    src = Path(entry['path_processed'])
+    processed = dir_processed / entry['filter'] / src.name
+    link_or_copy(src, processed)
+    out = {'path_processed': str(processed), 'thumb_frame': None, 'thumb_gif': None, 'path_hls': None}
+    for key in ('thumb_frame', 'thumb_gif'):
+        if entry.get(key):
+            dst = dir_thumbs / Path(entry[key]).name
+            link_or_copy(Path(entry[key]), dst)
+            out[key] = str(dst)
+    if entry.get('path_hls'):
+        master = Path(entry['path_hls'])
+        hls_dir = processed.parent / master.parent.name
+        link_tree(master.parent, hls_dir)
+        out['path_hls'] = str(hls_dir / master.name)
+    incr_derived_ref(entry['cache_key'])
+    return out
+
+def register_derived(cache_key: str, sha1: str, filter_name: str, params: dict, codec: str, outputs: dict):
+    insert_derived({
+        'cache_key': cache_key, 'sha1': sha1, 'filter': filter_name,
+        'params': json.dumps(params or {}, sort_keys=True), 'codec': codec, **outputs,
+        'bytes': output_files_size(outputs),
+    })
+
+def stats() -> dict:
+    """Acertos/erros do cache (somados entre processos, como no /metrics) e totais do banco."""
+    found = values(LOOKUPS.name)
+    counters = {f'{kind}_{plural}': int(found.get((kind, result), 0))
+                for kind in ('original', 'derived') for result, plural in (('hit', 'hits'), ('miss', 'misses'))}
+    lookups = counters['derived_hits'] + counters['derived_misses']
+    return {
+        **counters,
+        'hit_ratio': round(counters['derived_hits'] / lookups, 3) if lookups else None,
+        **dedup_totals(),
+    }
@@ -0,0 +1,195 @@
+# server/encoders.py
+"""Backends de codificação do vídeo processado.
+
+- 'opencv': cv2.VideoWriter. Tenta os fourcc do contêiner em ordem (ex.: avc1 e depois mp4v),
+  pois vários builds do OpenCV não têm H.264 e o writer simplesmente não abre.
+- 'ffmpeg': um processo ffmpeg recebe os quadros crus (bgr24/gray) pelo stdin e codifica com
+  codec, preset, CRF e threads configuráveis; roda fora do GIL, em paralelo com filtro e decodificação.
+
+O áudio do original não passa pelos quadros: com `audio`, ele é copiado (sem recodificar) para o
+arquivo final num passo de mux depois da codificação — vale para os dois backends e para o modo por
+segmentos.
+"""
+import shutil
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from config import (
+    FFMPEG_BIN, ENCODER_BACKEND, ENCODER_CODEC, ENCODER_PRESET, ENCODER_CRF, ENCODER_THREADS, ENCODER_AUDIO,
+)
+
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+FFMPEG_CODECS = ('libx264', 'libx265', 'libvpx-vp9', 'mpeg4')
+
+def ffmpeg_path():
+    """Caminho do ffmpeg: FFMPEG_BIN no PATH ou, se instalado, o binário do imageio-ffmpeg."""
+    found = shutil.which(FFMPEG_BIN)
+    if found:
+        return found
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+class EncoderSettings:
+    """Parâmetros de codificação de uma saída. Simples de serializar (vai nos params do job e para
+    os processos de segmento)."""
+    FIELDS = ('backend', 'codec', 'preset', 'crf', 'threads', 'audio')
+
+    def __init__(self, backend: str = ENCODER_BACKEND, codec: str = ENCODER_CODEC, preset: str = ENCODER_PRESET,
+                 crf: int = ENCODER_CRF, threads: int = ENCODER_THREADS, audio: bool = ENCODER_AUDIO):
+        if backend not in ('auto', *ENCODERS):
+            raise ValueError(f"Backend de codificação inválido: {backend}")
+        if codec not in FFMPEG_CODECS:
+            raise ValueError(f"Codec inválido: {codec}")
+        if preset not in X264_PRESETS:
+            raise ValueError(f"Preset inválido: {preset}")
+        crf, threads = int(crf), int(threads)
+        if not 0 <= crf <= 51:
+            raise ValueError("CRF deve estar entre 0 e 51")
+        if threads < 0:
+            raise ValueError("Threads deve ser >= 0")
+        if backend == 'auto':
+            backend = 'ffmpeg' if ffmpeg_path() else 'opencv'
+        self.backend = backend
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.audio = bool(audio)
+
+    @classmethod
+    def from_params(cls, params: dict | None) -> 'EncoderSettings':
+        """Configuração padrão com os campos de `params` sobrescritos. Levanta ValueError."""
+        params = params or {}
+        if not isinstance(params, dict):
+            raise ValueError("Campo 'encoder' deve ser um objeto")
+        unknown = set(params) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Parâmetros de codificação inválidos: {', '.join(sorted(unknown))}")
+        try:
+            return cls(**params)
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) or "Parâmetros de codificação inválidos")
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+    def cache_tag(self, out_name: str) -> str:
+        """Identifica o resultado da codificação na chave do cache por conteúdo (threads não muda o vídeo)."""
+        ext = Path(out_name).suffix.lower()
+        if self.backend == 'opencv':
+            tag = f"opencv:{'/'.join(OpenCVEncoder.fourccs_for(ext))}"
+        else:
+            tag = f"ffmpeg:{self.codec}:{self.preset}:crf{self.crf}"
+        return tag + (':audio' if self.audio else '')
+
+class OpenCVEncoder:
+    FOURCCS = {
+        '.mp4': ('avc1', 'mp4v'), '.m4v': ('avc1', 'mp4v'), '.mov': ('avc1', 'mp4v'),
+        '.avi': ('XVID', 'MJPG'), '.mkv': ('XVID', 'MJPG'),
+    }
+
+    @classmethod
+    def fourccs_for(cls, ext: str) -> tuple:
+        return cls.FOURCCS.get(ext, ('XVID', 'MJPG'))
+
+    def __init__(self, out_path: Path, fps: float, size: tuple, is_color: bool, settings: EncoderSettings):
+        # Filtros de 1 canal (grayscale/edges) vão direto para um writer monocromático, sem GRAY2BGR
+        self.writer = None
+        for fourcc in self.fourccs_for(out_path.suffix.lower()):
+            writer = cv2.VideoWriter(str(out_path), cv2.VideoWriter_fourcc(*fourcc), fps, size, is_color)
+            if writer.isOpened():
+                self.writer = writer
+                self.fourcc = fourcc
+                break
+            writer.release()
+
+    def isOpened(self) -> bool:
+        return self.writer is not None
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+class FFmpegEncoder:
+    def __init__(self, out_path: Path, fps: float, size: tuple, is_color: bool, settings: EncoderSettings):
+        self.out_path = out_path
+        self.error = ''
+        ffmpeg = ffmpeg_path()
+        self.proc = None
+        if not ffmpeg:
+            return
+        w, h = size
+        cmd = [ffmpeg, '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24' if is_color else 'gray', '-s', f'{w}x{h}', '-r', f'{fps:.6g}',
+               '-i', '-', '-an', '-c:v', settings.codec]
+        if settings.codec in ('libx264', 'libx265'):
+            cmd += ['-preset', settings.preset, '-crf', str(settings.crf)]
+        elif settings.codec == 'libvpx-vp9':
+            cmd += ['-crf', str(settings.crf), '-b:v', '0', '-deadline', 'realtime', '-cpu-used', '8']
+        else:
+            cmd += ['-q:v', str(max(2, min(31, settings.crf // 2)))]
+        if settings.threads:
+            cmd += ['-threads', str(settings.threads)]
+        # yuv420p exige lados pares: corta a última linha/coluna ímpar
+        cmd += ['-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2', '-pix_fmt', 'yuv420p']
+        if out_path.suffix.lower() in ('.mp4', '.m4v', '.mov'):
+            cmd += ['-movflags', '+faststart']
+        cmd.append(str(out_path))
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def isOpened(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self.release()
+            raise RuntimeError(f"ffmpeg encerrou durante a codificação: {self.error}")
+
+    def release(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.error = proc.stderr.read().decode('utf-8', 'replace').strip()
+        proc.stderr.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg falhou ao codificar {self.out_path.name}: {self.error}")
+
+ENCODERS = {'opencv': OpenCVEncoder, 'ffmpeg': FFmpegEncoder}
+
+def open_encoder(out_path: Path, fps: float, size: tuple, is_color: bool = True,
+                 settings: EncoderSettings | None = None):
+    """Abre o encoder do backend configurado. Mesmo contrato do cv2.VideoWriter (isOpened/write/release)."""
+    settings = settings or EncoderSettings()
+    return ENCODERS[settings.backend](Path(out_path), fps, size, is_color, settings)
+
+def mux_audio(video_path: Path, src_path: Path) -> bool:
+    """Copia a trilha de áudio do original para o vídeo processado (sem recodificar). Sem ffmpeg,
+    sem áudio no original ou se o contêiner não aceitar a trilha, o vídeo fica como está."""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        return False
+    tmp = video_path.with_name(f".audio-{video_path.name}")
+    cmd = [ffmpeg, '-y', '-loglevel', 'error', '-i', str(video_path), '-i', str(src_path),
+           '-map', '0:v', '-map', '1:a?', '-c', 'copy', '-shortest', str(tmp)]
+    ok = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).returncode == 0
+    if ok:
+        tmp.replace(video_path)
+    else:
+        tmp.unlink(missing_ok=True)
+    return ok
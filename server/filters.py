@@ -0,0 +1,156 @@
+# server/filters.py
+"""Registro de filtros de vídeo.
+
+Cada filtro declara nome, parâmetros (com valores padrão) e quantos canais produz
+(1 = cinza, 3 = BGR, None = os mesmos da entrada). `apply` trata um quadro; `apply_batch`
+recebe N quadros empilhados num único array (N, H, W[, C]). O `apply_batch` padrão só chama
+`apply` quadro a quadro e empilha; grayscale converte o lote inteiro numa chamada; pixelate e edges
+gravam cada quadro direto no array de saída do lote (edges sobre a conversão para cinza em lote).
+Filtros podem ser encadeados com '+', ex.: "pixelate+edges".
+Faixas de valores são conferidas em `check` (ValueError, que a API devolve como 400).
+
+Para adicionar um filtro basta uma subclasse de Filter decorada com @register_filter.
+"""
+import cv2
+import numpy as np
+
+FILTERS = {}
+
+def register_filter(cls):
+    FILTERS[cls.name] = cls
+    return cls
+
+class Filter:
+    name = ''
+    defaults = {}
+    channels = None
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Parâmetros inválidos para '{self.name}': {', '.join(sorted(unknown))}")
+        self.params = {k: type(v)(params.get(k, v)) for k, v in self.defaults.items()}
+        self.check()
+
+    def check(self):
+        """Valida as faixas dos parâmetros (ValueError se inválidos)."""
+
+    def output_channels(self, in_channels: int) -> int:
+        return self.channels or in_channels
+
+    def apply(self, frame):
+        raise NotImplementedError
+
+    def apply_batch(self, frames):
+        return np.stack([self.apply(f) for f in frames])
+
+def _to_gray_batch(frames):
+    if frames.ndim == 3:
+        return frames
+    # Um único cvtColor para o lote inteiro: (N, H, W, 3) -> (N*H, W, 3)
+    n, h, w, _ = frames.shape
+    return cv2.cvtColor(frames.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY).reshape(n, h, w)
+
+@register_filter
+class Grayscale(Filter):
+    name = 'grayscale'
+    channels = 1
+
+    def apply(self, frame):
+        return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def apply_batch(self, frames):
+        return _to_gray_batch(frames)
+
+@register_filter
+class Pixelate(Filter):
+    name = 'pixelate'
+    defaults = {'blocks': 32}
+
+    def check(self):
+        if self.params['blocks'] < 1:
+            raise ValueError("Parâmetro 'blocks' de 'pixelate' deve ser >= 1")
+
+    def apply(self, frame):
+        h, w = frame.shape[:2]
+        scale = max(1, min(w, h) // self.params['blocks'])
+        small = cv2.resize(frame, (w//scale, h//scale), interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    def apply_batch(self, frames):
+        # Cada quadro é reduzido e ampliado direto na sua posição do lote de saída (sem o np.stack).
+        # Um único resize para o lote todo (quadros como canais ou lado a lado) mediu mais lento
+        n, h, w = frames.shape[:3]
+        scale = max(1, min(w, h) // self.params['blocks'])
+        out = np.empty_like(frames)
+        for frame, dst in zip(frames, out):
+            small = cv2.resize(frame, (w//scale, h//scale), interpolation=cv2.INTER_LINEAR)
+            cv2.resize(small, (w, h), dst=dst, interpolation=cv2.INTER_NEAREST)
+        return out
+
+@register_filter
+class Edges(Filter):
+    name = 'edges'
+    defaults = {'low': 100, 'high': 200}
+    channels = 1
+
+    def check(self):
+        if not 0 <= self.params['low'] <= self.params['high']:
+            raise ValueError("Parâmetros de 'edges' devem respeitar 0 <= low <= high")
+
+    def apply(self, frame):
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.Canny(gray, self.params['low'], self.params['high'])
+
+    def apply_batch(self, frames):
+        gray = _to_gray_batch(frames)
+        out = np.empty_like(gray)
+        for i in range(len(gray)):
+            cv2.Canny(gray[i], self.params['low'], self.params['high'], edges=out[i])
+        return out
+
+class FilterChain:
+    """Sequência de filtros aplicada numa única passada sobre cada lote de quadros."""
+    def __init__(self, filters: list):
+        self.filters = filters
+        self.name = '+'.join(f.name for f in filters)
+
+    @property
+    def channels(self) -> int:
+        ch = 3
+        for f in self.filters:
+            ch = f.output_channels(ch)
+        return ch
+
+    def params(self) -> dict:
+        return {f.name: f.params for f in self.filters if f.params}
+
+    def apply(self, frame):
+        for f in self.filters:
+            frame = f.apply(frame)
+        return frame
+
+    def apply_batch(self, frames):
+        for f in self.filters:
+            frames = f.apply_batch(frames)
+        return frames
+
+def build_chain(spec: str, params: dict | None = None) -> FilterChain:
+    """Monta a cadeia a partir de "a+b" e de parâmetros no formato {"a": {...}, "b": {...}}.
+    Levanta ValueError para filtros ou parâmetros desconhecidos."""
+    names = [n.strip().lower() for n in (spec or '').split('+') if n.strip()]
+    if not names:
+        raise ValueError("Nenhum filtro informado")
+    params = params or {}
+    filters = []
+    for n in names:
+        if n not in FILTERS:
+            raise ValueError(f"Filtro desconhecido: {n}")
+        try:
+            filters.append(FILTERS[n](**(params.get(n) or {})))
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) or f"Parâmetros inválidos para '{n}'")
+    return FilterChain(filters)
+
+def describe_filters() -> list:
+    return [{"name": cls.name, "params": cls.defaults, "channels": cls.channels} for cls in FILTERS.values()]
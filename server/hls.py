@@ -0,0 +1,65 @@
+# server/hls.py
+"""Saída HLS: renditions em várias alturas, segmentos curtos e master playlist.
+
+Gerado a partir do vídeo já processado, em processed/<filtro>/hls/:
+    master.m3u8
+    720p/index.m3u8, 720p/seg_0000.ts, ...
+"""
+import shutil
+import subprocess
+from pathlib import Path
+
+from config import HLS_RENDITIONS, HLS_SEGMENT_SEC
+from encoders import ffmpeg_path
+
+# CRF por altura: renditions menores aceitam um pouco mais de compressão
+_CRF = {1080: 22, 720: 23, 480: 24, 360: 26}
+
+def ladder_for(source_height: int, renditions=HLS_RENDITIONS):
+    """Alturas da escada que não ampliam a fonte; fonte menor que todas usa a própria altura."""
+    heights = sorted({h for h in renditions if h <= source_height}, reverse=True)
+    return heights or [source_height - source_height % 2]
+
+def _encode_rendition(ffmpeg: str, src: Path, out_dir: Path, height: int, fps: float) -> bool:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    gop = max(1, round((fps or 25.0) * HLS_SEGMENT_SEC))
+    cmd = [
+        ffmpeg, '-y', '-loglevel', 'error', '-i', str(src),
+        '-vf', f'scale=-2:{height}', '-c:v', 'libx264', '-preset', 'veryfast',
+        '-crf', str(_CRF.get(height, 23)), '-pix_fmt', 'yuv420p',
+        # GOP fixo alinhado ao segmento: todo segmento começa em keyframe
+        '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0', '-an',
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SEC), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', str(out_dir / 'seg_%04d.ts'), str(out_dir / 'index.m3u8'),
+    ]
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).returncode == 0
+
+def _bandwidth(rendition_dir: Path, duration_sec: float) -> int:
+    size = sum(p.stat().st_size for p in rendition_dir.glob('*.ts'))
+    return int(size * 8 / duration_sec) if duration_sec > 0 else 0
+
+def generate_hls(src_path: Path, hls_dir: Path, width: int, height: int, fps: float, duration_sec: float):
+    """Gera a escada HLS de `src_path` em `hls_dir` e devolve o caminho do master.m3u8
+    (None se não houver ffmpeg ou nenhuma rendition for gerada)."""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg or not height:
+        return None
+    if hls_dir.exists():
+        shutil.rmtree(hls_dir)
+
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for h in ladder_for(height):
+        name = f'{h}p'
+        if not _encode_rendition(ffmpeg, src_path, hls_dir / name, h, fps):
+            continue
+        w = round(width * h / height / 2) * 2
+        bw = _bandwidth(hls_dir / name, duration_sec)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={w}x{h}')
+        lines.append(f'{name}/index.m3u8')
+    if len(lines) == 2:
+        shutil.rmtree(hls_dir, ignore_errors=True)
+        return None
+
+    master = hls_dir / 'master.m3u8'
+    master.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return master
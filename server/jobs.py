@@ -0,0 +1,314 @@
+# server/jobs.py
+import atexit
+import json
+import multiprocessing as mp
+import os
+import shutil
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    DB_PATH, JOB_WORKERS, JOB_POLL_INTERVAL, THUMB_WIDTH, PREVIEW_FRAMES, PREVIEW_WIDTH,
+    META_TIMINGS, METRICS_SNAPSHOT_INTERVAL,
+)
+from db import (
+    init_db, insert_video, insert_job, claim_next_job, update_job, requeue_running_jobs,
+    insert_output, get_output, list_outputs, batch, set_video_state, get_video,
+)
+from storage import (
+    write_meta_json, thumbnail_indices, preview_indices, write_thumbnails, thumbs_dir_for,
+    write_small_thumbnail, small_thumb_path,
+)
+from processing import process_outputs, Output, file_sha1, FrameSampler
+from encoders import EncoderSettings
+from filters import build_chain
+from dedup import derived_key, lookup_derived, register_derived, reuse_derived
+from hls import generate_hls
+from previews import write_preview
+from metrics import counter, histogram, SnapshotWriter, clear_snapshots
+
+_workers = []
+_stop = None
+
+JOBS = counter('video_jobs_total', 'Jobs executados pelos workers', ['kind', 'status'])
+JOB_SECONDS = histogram('video_job_seconds', 'Duração total de cada job', ['kind'])
+JOB_QUEUE_SECONDS = histogram('video_job_queue_seconds', 'Espera do job na fila até ser pego por um worker')
+JOB_STAGE_SECONDS = histogram('video_job_stage_seconds', 'Duração de cada etapa do job', ['stage'])
+
+@contextmanager
+def _stage(timings: dict, name: str):
+    """Mede uma etapa do job: vai para o histograma e soma em timings['<etapa>_sec']."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        JOB_STAGE_SECONDS.observe(elapsed, stage=name)
+        timings[f'{name}_sec'] = round(timings.get(f'{name}_sec', 0.0) + elapsed, 4)
+
+def enqueue_job(vid: str, params: dict) -> str:
+    """Registra um job 'queued' para o vídeo e devolve o id do job."""
+    job_id = str(uuid.uuid4())
+    insert_job(job_id, vid, params)
+    return job_id
+
+def public_job(job: dict) -> dict:
+    """Representação do job exposta pela API."""
+    return {
+        "id": job['id'],
+        "video_id": job['video_id'],
+        "status": job['status'],
+        "progress": round(job.get('progress') or 0.0, 1),
+        "error": job.get('error'),
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+        "detail_url": f"/api/videos/{job['video_id']}" if job['status'] == 'done' else None,
+    }
+
+class _Progress:
+    """Converte frações de processamento em % do job, gravando só quando muda >= 1 ponto."""
+    def __init__(self, job_id: str, start: float, end: float):
+        self.job_id = job_id
+        self.start = start
+        self.end = end
+        self.last = -1.0
+
+    def __call__(self, frac: float):
+        pct = self.start + (self.end - self.start) * frac
+        if pct - self.last >= 1.0:
+            self.last = pct
+            update_job(self.job_id, progress=pct)
+
+def _job_outputs(p: dict) -> list:
+    """Saídas a processar no job. Jobs enfileirados antes do fan-out trazem um único filtro."""
+    if p.get('outputs') is not None:
+        return p['outputs']
+    return [{'filter': p['filter'], 'filter_params': p.get('filter_params'),
+             'cache_key': p.get('cache_key'), 'cache_params': p.get('cache_params')}]
+
+def run_job(job: dict):
+    """Executa o processamento de um job: todas as saídas pedidas numa única decodificação,
+    depois thumbnails, GIF e HLS de cada uma e a gravação no banco."""
+    p = job['params']
+    vid = job['video_id']
+    dir_uuid = Path(p['dir_uuid'])
+    path_original = Path(p['path_original'])
+    primary = p['filter']
+    specs = _job_outputs(p)
+    encoder = EncoderSettings.from_params(p.get('encoder'))
+    if _video_deleted(p, vid):
+        return
+
+    # Uma única decodificação: metadados, filtros e quadros para thumbnail/GIF saem da mesma passada
+    outputs = []
+    for spec in specs:
+        chain = build_chain(spec['filter'], spec.get('filter_params'))
+        samplers = [FrameSampler(lambda total: thumbnail_indices(total, num_frames=1)),
+                    FrameSampler(lambda total: preview_indices(total, max_frames=PREVIEW_FRAMES),
+                                 max_width=PREVIEW_WIDTH)]
+        outputs.append(Output(chain, dir_uuid / 'processed' / chain.name / ('video' + p['ext']), samplers, encoder))
+
+    hls = bool(p.get('hls'))
+    stats = {}
+    # Etapas do upload (medidas no servidor web) + etapas deste job
+    timings = dict(p.get('timings') or {})
+    with _stage(timings, 'process'):
+        ok = process_outputs(path_original, outputs, progress=_Progress(job['id'], 0.0, 60.0 if hls else 90.0),
+                             stats=stats, target=p.get('target'))
+    if not ok:
+        raise RuntimeError("Falha ao processar vídeo")
+    source = stats['source']
+    written = stats['output']
+
+    results = []
+    for i, (spec, out) in enumerate(zip(specs, outputs)):
+        thumbs_dir = thumbs_dir_for(dir_uuid, out.chain.name, primary)
+        thumb_frames = out.samplers[0].ordered()
+        with _stage(timings, 'thumbnails'):
+            thumbs = write_thumbnails(thumb_frames, thumbs_dir)
+            if thumb_frames and out.chain.name == primary and p.get('kind') != 'derive':
+                # Miniatura da galeria já sai do quadro em memória (sem reler o JPEG grande)
+                write_small_thumbnail(thumb_frames[0], small_thumb_path(vid, THUMB_WIDTH), THUMB_WIDTH)
+        with _stage(timings, 'preview'):
+            preview_gif_path = write_preview(out.samplers[1].ordered(), thumbs_dir)
+
+        # HLS (opcional): escada de renditions a partir do vídeo processado
+        hls_master = None
+        if hls:
+            update_job(job['id'], progress=60.0 + 30.0 * i / len(outputs))
+            with _stage(timings, 'hls'):
+                hls_master = generate_hls(out.out_path, out.out_path.parent / 'hls', written['width'],
+                                          written['height'], written['fps'], source['duration_sec'])
+        files = {
+            "path_processed": str(out.out_path),
+            "thumb_frame": str(thumbs[0]) if thumbs else None,
+            "thumb_gif": str(preview_gif_path) if preview_gif_path else None,
+            "path_hls": str(hls_master) if hls_master else None,
+        }
+        results.append((spec, out.chain, files))
+    update_job(job['id'], progress=95.0)
+
+    # Todas as linhas do job (saídas, cache e vídeo) numa única transação
+    sha1 = p.get('sha1') or file_sha1(path_original)
+    if _video_deleted(p, vid):
+        # A pasta do vídeo foi para a lixeira durante o job: o que sobrou nela é só o que o job gravou
+        shutil.rmtree(dir_uuid, ignore_errors=True)
+        return
+    with _stage(timings, 'db'), batch():
+        for spec, chain, files in results:
+            insert_output(vid, chain.name, chain.params(), files, spec.get('cache_key'))
+            if spec.get('cache_key'):
+                register_derived(spec['cache_key'], sha1, chain.name, spec.get('cache_params') or {},
+                                 p.get('codec'), files)
+        if p.get('kind') == 'derive':
+            refresh_meta_outputs(vid, dir_uuid)
+            if p.get('rederive'):
+                # Vídeo frio com as saídas regeradas: volta a ser quente
+                set_video_state(vid, 'hot')
+        else:
+            finish_video(vid, p, source, stats, timings)
+
+def _video_deleted(p: dict, vid: str) -> bool:
+    """Job de derive de um vídeo que foi apagado (DELETE /api/videos/<id>): não grava nada.
+    Jobs de upload registram o vídeo no fim, então ainda não têm linha em videos."""
+    return p.get('kind') == 'derive' and get_video(vid) is None
+
+def _video_meta(vid: str, p: dict, source: dict, outputs: dict, stats: dict | None = None) -> dict:
+    path_original = Path(p['path_original'])
+    sha1 = p.get('sha1') or file_sha1(path_original)
+    return {
+        "id": vid,
+        "original_name": p['original_name'],
+        "original_ext": p['ext'][1:],
+        "mime_type": p.get('mime_type'),
+        "size_bytes": os.path.getsize(path_original),
+        "duration_sec": source['duration_sec'],
+        "fps": source['fps'],
+        "width": source['width'],
+        "height": source['height'],
+        "filter": p['filter'],
+        "created_at": p.get('created_at') or datetime.utcnow().isoformat() + 'Z',
+        "path_original": str(path_original),
+        **outputs,
+        "checksum": sha1,
+        "checksums": {'sha1': sha1},
+        "params": {"filter": p['filter'], "filters": p.get('filters') or [p['filter']],
+                   "filter_params": p.get('filter_params') or {}, "hls": bool(p.get('hls')),
+                   "encoder": p.get('encoder') or {}, "target": p.get('target')},
+        "processing": stats or {},
+    }
+
+def _meta_outputs(vid: str) -> list:
+    return [{k: o[k] for k in ('filter', 'params', 'path_processed', 'thumb_frame', 'thumb_gif', 'path_hls')}
+            for o in list_outputs(vid)]
+
+def refresh_meta_outputs(vid: str, dir_uuid: Path):
+    """Atualiza a lista de saídas no meta.json de um vídeo já registrado."""
+    meta_path = dir_uuid / 'meta.json'
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return
+    meta['outputs'] = _meta_outputs(vid)
+    write_meta_json(meta_path, meta)
+
+def finish_video(vid: str, p: dict, source: dict, stats: dict | None = None, timings: dict | None = None) -> dict:
+    """Registra o vídeo (linha em videos + meta.json); os caminhos principais vêm da saída do
+    filtro principal e o meta.json lista todas as saídas. Com META_TIMINGS, `timings` (segundos
+    por etapa do upload e do job) também vai para o meta.json."""
+    primary = get_output(vid, p['filter']) or {}
+    files = {k: primary.get(k) for k in ('path_processed', 'thumb_frame', 'thumb_gif', 'path_hls')}
+    meta = _video_meta(vid, p, source, files, stats)
+    meta['outputs'] = _meta_outputs(vid)
+    if META_TIMINGS:
+        meta['timings'] = timings if timings is not None else dict(p.get('timings') or {})
+    write_meta_json(Path(p['dir_uuid']) / 'meta.json', meta)
+    insert_video(meta)
+    return meta
+
+def plan_outputs(vid: str, dirs: dict, sha1: str, chains: list, codec: str, hls: bool, primary: str,
+                 target: str | None = None):
+    """Para cada cadeia pedida, reaproveita o resultado em cache (mesmos bytes, filtro, parâmetros,
+    resolução/fps de saída e codec) ligando os arquivos na pasta do vídeo. Devolve (filtros reaproveitados, saídas que
+    ainda precisam ser processadas, no formato de params['outputs'] do job)."""
+    cached, pending = [], []
+    with batch():
+        for chain in chains:
+            cache_params = {}
+            if chain.params():
+                cache_params['filters'] = chain.params()
+            if hls:
+                cache_params['hls'] = True
+            if target:
+                cache_params['target'] = target
+            cache_key = derived_key(sha1, chain.name, cache_params, codec)
+            entry = lookup_derived(cache_key)
+            if entry:
+                thumbs_dir = thumbs_dir_for(dirs['dir_uuid'], chain.name, primary)
+                files = reuse_derived(entry, dirs['dir_processed'], thumbs_dir)
+                insert_output(vid, chain.name, chain.params(), files, cache_key)
+                cached.append(chain.name)
+            else:
+                pending.append({'filter': chain.name, 'filter_params': chain.params(),
+                                'cache_key': cache_key, 'cache_params': cache_params})
+    return cached, pending
+
+def _worker_main(stop):
+    """Loop de um processo worker: pega o próximo job da fila e executa."""
+    init_db(DB_PATH)
+    snapshots = SnapshotWriter(METRICS_SNAPSHOT_INTERVAL).start()
+    while not stop.is_set():
+        job = claim_next_job()
+        if not job:
+            stop.wait(JOB_POLL_INTERVAL)
+            continue
+        kind = job['params'].get('kind') or 'upload'
+        try:
+            JOB_QUEUE_SECONDS.observe(max(0.0, (datetime.utcnow() - _parse_ts(job['created_at'])).total_seconds()))
+        except (TypeError, ValueError):
+            pass
+        start = time.perf_counter()
+        try:
+            run_job(job)
+            update_job(job['id'], status='done', progress=100.0, error=None)
+            JOBS.inc(kind=kind, status='done')
+        except Exception as e:
+            traceback.print_exc()
+            update_job(job['id'], status='failed', error=str(e))
+            JOBS.inc(kind=kind, status='failed')
+        JOB_SECONDS.observe(time.perf_counter() - start, kind=kind)
+        snapshots.flush()
+    snapshots.stop()
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.rstrip('Z'))
+
+def start_workers(n: int = JOB_WORKERS):
+    """Sobe `n` processos worker. Jobs interrompidos numa execução anterior voltam para a fila."""
+    global _stop
+    if _workers:
+        return
+    init_db(DB_PATH)
+    requeue_running_jobs()
+    clear_snapshots()
+    ctx = mp.get_context('spawn')
+    _stop = ctx.Event()
+    for i in range(max(1, n)):
+        proc = ctx.Process(target=_worker_main, args=(_stop,), name=f'job-worker-{i}')
+        proc.start()
+        _workers.append(proc)
+    atexit.register(stop_workers)
+
+def stop_workers(timeout: float = 5.0):
+    if _stop is not None:
+        _stop.set()
+    deadline = time.monotonic() + timeout
+    for proc in _workers:
+        proc.join(max(0.0, deadline - time.monotonic()))
+        if proc.is_alive():
+            proc.terminate()
+    _workers.clear()
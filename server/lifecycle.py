@@ -0,0 +1,396 @@
+# server/lifecycle.py
+"""Ciclo de vida do armazenamento.
+
+- `trash_video` (DELETE /api/videos/<id>): move a pasta do vídeo para trash/ e solta na hora as
+  referências ao blob do original e aos derivados; o espaço só sai do disco quando o GC esvaziar a
+  lixeira, depois de TRASH_RETENTION_HOURS.
+- `collect`: uma passada do GC. Esfria vídeos sem acesso há COLD_AFTER_DAYS, remove saídas extras
+  sem acesso há OUTPUT_RETENTION_DAYS, limpa sobras de uploads (incoming/, sessões retomáveis
+  paradas, pastas de uploads cujo job falhou), apaga blobs e derivados sem referência e esvazia a
+  lixeira vencida. Roda numa thread do servidor a cada GC_INTERVAL_SEC (`start_gc`).
+- Vídeo frio: ficam só o original e as thumbnails. `warm` (chamado quando o processado é pedido)
+  religa as saídas a partir do cache de derivados ou enfileira um job que as regera.
+- Cotas: `quota_error` soma o índice disk_usage (mantido por triggers no banco), sem varrer o disco.
+"""
+import shutil
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from config import (
+    MEDIA_ROOT, GC_INTERVAL_SEC, TRASH_RETENTION_HOURS, ORPHAN_MAX_AGE_HOURS, OUTPUT_RETENTION_DAYS,
+    COLD_AFTER_DAYS, ACCESS_TOUCH_INTERVAL, DISK_QUOTA_BYTES, DAILY_QUOTA_BYTES,
+)
+from db import (
+    get_video, list_outputs, delete_outputs, insert_output, incr_blob_ref, get_blob, get_derived, incr_derived_ref,
+    repoint_derived, delete_unreferenced, derived_without_size, set_derived_size, count_active_jobs,
+    cancel_queued_jobs, failed_uploads, update_job, get_latest_job_for_video, expire_upload_sessions,
+    upload_session_ids, delete_video, insert_trash, expired_trash, delete_trash, count_trash, touch_video,
+    get_video_state, set_video_state, idle_videos, stale_outputs, disk_usage, disk_usage_total, batch,
+)
+from storage import (
+    video_dir, path_size, output_files_size, remove_output_files, move_to_trash, remove_small_thumbnails,
+    thumbs_dir_for,
+)
+from dedup import lookup_derived, reuse_derived
+from encoders import EncoderSettings
+from jobs import enqueue_job, refresh_meta_outputs
+from metrics import counter, histogram
+
+GC_ITEMS = counter('video_gc_items_total', 'Itens removidos pelo GC do armazenamento', ['kind'])
+GC_SECONDS = histogram('video_gc_seconds', 'Duração de cada passada do GC do armazenamento')
+
+# Itens tratados por consulta em cada etapa do GC (repete até esvaziar)
+GC_BATCH = 100
+
+class LifecycleError(Exception):
+    """Operação recusada no estado atual do vídeo; `status` é o código HTTP sugerido."""
+    def __init__(self, message: str, status: int = 409):
+        super().__init__(message)
+        self.status = status
+
+def _ago(**delta) -> str:
+    return (datetime.utcnow() - timedelta(**delta)).isoformat() + 'Z'
+
+def _release_output(vid: str, output: dict):
+    """O vídeo deixa de usar o derivado desta saída (os arquivos são apagados por quem chamou).
+    Saídas cujo vídeo processado já saiu do disco (vídeo frio, ou ainda não regerado) não seguram referência."""
+    if output.get('cache_key') and output.get('path_processed') and Path(output['path_processed']).exists():
+        incr_derived_ref(output['cache_key'], -1)
+        repoint_derived(output['cache_key'], vid)
+
+# ==========================
+# Exclusão (lixeira)
+# ==========================
+
+def trash_video(vid: str) -> dict | None:
+    """Apaga o vídeo: linha, saídas e referências saem do banco e a pasta vai para trash/.
+    Jobs ainda na fila são cancelados; com um job em execução levanta LifecycleError (409).
+    Devolve None se o vídeo não existe."""
+    moved = None
+    try:
+        with batch():
+            # O UPDATE abre a transação de escrita: nenhum worker pega um job do vídeo entre o
+            # cancelamento e a conferência abaixo (um rollback desfaz o cancelamento se houver 409)
+            cancel_queued_jobs(vid)
+            if count_active_jobs(vid)['running']:
+                raise LifecycleError("Vídeo em processamento; tente de novo quando o job terminar")
+            row = get_video(vid)
+            if row is None:
+                return None
+            dir_uuid = video_dir(row['path_original'])
+            outputs = delete_outputs(vid)
+            for output in outputs:
+                _release_output(vid, output)
+            if row.get('checksum'):
+                incr_blob_ref(row['checksum'], -1)
+            delete_video(vid)
+            size = _trash_size(dir_uuid, outputs)
+            trashed = dir_uuid
+            if dir_uuid.exists():
+                trashed = move_to_trash(dir_uuid, vid)
+                moved = (dir_uuid, trashed)
+            insert_trash(vid, str(trashed), size)
+    except BaseException:
+        # A transação foi desfeita: a pasta volta para o lugar, junto com a linha do vídeo
+        if moved is not None and moved[1].exists():
+            shutil.move(str(moved[1]), moved[0])
+        raise
+    remove_small_thumbnails(vid)
+    until = datetime.utcnow() + timedelta(hours=TRASH_RETENTION_HOURS)
+    return {"ok": True, "id": vid, "status": "deleted", "purge_after": until.isoformat() + 'Z'}
+
+def _trash_size(dir_uuid: Path, outputs: list) -> int:
+    """Bytes que só a lixeira ocupa. Ficam de fora os hardlinks (o original é o blob) e os arquivos
+    de derivados guardados na pasta: esses já contam em disk_usage até o GC apagar a entrada."""
+    counted, hls_dirs = set(), []
+    for output in outputs:
+        derived = get_derived(output['cache_key']) if output.get('cache_key') else None
+        if derived:
+            counted |= {Path(derived[k]) for k in ('path_processed', 'thumb_frame', 'thumb_gif') if derived.get(k)}
+            if derived.get('path_hls'):
+                hls_dirs.append(Path(derived['path_hls']).parent)
+    total = 0
+    for path in dir_uuid.rglob('*'):
+        if path in counted or any(d in path.parents for d in hls_dirs):
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if path.is_file() and st.st_nlink == 1:
+            total += st.st_size
+    return total
+
+# ==========================
+# Vídeos frios
+# ==========================
+
+def make_cold(row: dict) -> bool:
+    """Apaga os vídeos processados (e HLS) do vídeo, mantendo original e thumbnails."""
+    vid = row['id']
+    outputs = list_outputs(vid)
+    if not outputs or any(count_active_jobs(vid).values()):
+        return False
+    if not set_video_state(vid, 'cold', expected='hot'):
+        return False
+    with batch():
+        for output in outputs:
+            _release_output(vid, output)
+    for output in outputs:
+        remove_output_files(output, keep_thumbs=True)
+    return True
+
+def warm(vid: str) -> dict | None:
+    """Devolve as saídas de um vídeo frio: religa o que ainda existe no cache de derivados e
+    enfileira um job para o resto. {'status': 'hot'} se já está pronto; {'status': 'warming',
+    'job_id': ...} enquanto o job roda. None se o vídeo não existe."""
+    row = get_video(vid)
+    if row is None:
+        return None
+    state = get_video_state(vid)
+    if state == 'hot':
+        return {"status": "hot"}
+    last_job = get_latest_job_for_video(vid)
+    if state == 'warming':
+        if last_job and last_job['status'] in ('queued', 'running'):
+            return {"status": "warming", "job_id": last_job['id']}
+        # O job anterior falhou: tenta de novo
+        set_video_state(vid, 'cold', expected='warming')
+    if not set_video_state(vid, 'warming', expected='cold'):
+        return warm(vid)
+
+    try:
+        return _rederive(row, (last_job or {}).get('params') or {})
+    except BaseException:
+        set_video_state(vid, 'cold', expected='warming')
+        raise
+
+def _rederive(row: dict, job_params: dict) -> dict:
+    vid = row['id']
+    dir_uuid = video_dir(row['path_original'])
+    known = {spec['filter']: spec for spec in job_params.get('outputs') or []}
+    pending = []
+    with batch():
+        for output in list_outputs(vid):
+            entry = lookup_derived(output['cache_key']) if output.get('cache_key') else None
+            if entry:
+                thumbs_dir = thumbs_dir_for(dir_uuid, output['filter'], row['filter'])
+                files = reuse_derived(entry, dir_uuid / 'processed', thumbs_dir)
+                insert_output(vid, output['filter'], output['params'], files, output['cache_key'])
+            else:
+                pending.append({'filter': output['filter'], 'filter_params': output['params'],
+                                'cache_key': output.get('cache_key'),
+                                'cache_params': (known.get(output['filter']) or {}).get('cache_params') or {}})
+    if not pending:
+        set_video_state(vid, 'hot')
+        refresh_meta_outputs(vid, dir_uuid)
+        return {"status": "hot"}
+
+    encoder = EncoderSettings.from_params(job_params.get('encoder'))
+    path_original = Path(row['path_original'])
+    job_id = enqueue_job(vid, {
+        "kind": "derive",
+        "rederive": True,
+        "filter": row['filter'],
+        "outputs": pending,
+        "ext": path_original.suffix,
+        "dir_uuid": str(dir_uuid),
+        "path_original": str(path_original),
+        "sha1": row.get('checksum'),
+        "codec": job_params.get('codec') or encoder.cache_tag(path_original.name),
+        "encoder": encoder.to_dict(),
+        "target": job_params.get('target'),
+        "hls": bool(job_params.get('hls')),
+    })
+    return {"status": "warming", "job_id": job_id}
+
+_touched = {}
+_touch_lock = threading.Lock()
+
+def touch(vid: str):
+    """Registra acesso ao vídeo (no máximo uma escrita por ACCESS_TOUCH_INTERVAL por vídeo)."""
+    now = time.monotonic()
+    with _touch_lock:
+        last = _touched.get(vid)
+        if last is not None and now - last < ACCESS_TOUCH_INTERVAL:
+            return
+        if len(_touched) > 100_000:
+            _touched.clear()
+        _touched[vid] = now
+    touch_video(vid)
+
+# ==========================
+# Cotas e relatório de uso
+# ==========================
+
+def quota_error(incoming: int) -> str | None:
+    """Mensagem de erro se gravar mais `incoming` bytes passaria de uma cota; None se cabe."""
+    if DISK_QUOTA_BYTES and disk_usage_total() + incoming > DISK_QUOTA_BYTES:
+        return f"Cota de disco esgotada ({DISK_QUOTA_BYTES} bytes)"
+    if DAILY_QUOTA_BYTES:
+        today = datetime.utcnow().date().isoformat()
+        if disk_usage_total(today) + incoming > DAILY_QUOTA_BYTES:
+            return f"Cota diária de disco esgotada ({DAILY_QUOTA_BYTES} bytes)"
+    return None
+
+_last_run = {}
+
+def storage_report(days: int = 30) -> dict:
+    by_day, totals = {}, {}
+    for r in disk_usage():
+        totals[r['kind']] = totals.get(r['kind'], 0) + r['bytes']
+        by_day.setdefault(r['day'], {'day': r['day']})[r['kind']] = r['bytes']
+    return {
+        "total_bytes": sum(totals.values()),
+        "by_kind": totals,
+        "days": sorted(by_day.values(), key=lambda d: d['day'], reverse=True)[:days],
+        "quota": {"total_bytes": DISK_QUOTA_BYTES or None, "daily_bytes": DAILY_QUOTA_BYTES or None},
+        "trash_videos": count_trash(),
+        "last_gc": dict(_last_run),
+    }
+
+# ==========================
+# Coleta de lixo
+# ==========================
+
+def _drain(fetch, handle) -> int:
+    """Chama `handle` para cada item de `fetch()` até uma página vir incompleta."""
+    done = 0
+    while True:
+        items = fetch()
+        for item in items:
+            done += 1 if handle(item) is not False else 0
+        if len(items) < GC_BATCH:
+            return done
+
+def _reap_trash() -> int:
+    def handle(entry):
+        shutil.rmtree(entry['path'], ignore_errors=True)
+        delete_trash(entry['video_id'])
+    return _drain(lambda: expired_trash(_ago(hours=TRASH_RETENTION_HOURS), GC_BATCH), handle)
+
+def _reap_unreferenced() -> tuple:
+    blobs, derived = delete_unreferenced()
+    for blob in blobs:
+        # Um upload dos mesmos bytes pode ter recriado o blob no mesmo caminho
+        if get_blob(blob['sha1']) is None and blob.get('path'):
+            Path(blob['path']).unlink(missing_ok=True)
+    return len(blobs), derived
+
+def _reap_failed_uploads() -> int:
+    def handle(job):
+        p = job['params']
+        with batch():
+            for output in delete_outputs(job['video_id']):
+                _release_output(job['video_id'], output)
+            if p.get('sha1'):
+                incr_blob_ref(p['sha1'], -1)
+            update_job(job['id'], status='expired')
+        if p.get('dir_uuid'):
+            shutil.rmtree(p['dir_uuid'], ignore_errors=True)
+    return _drain(lambda: failed_uploads(_ago(hours=ORPHAN_MAX_AGE_HOURS), GC_BATCH), handle)
+
+def _reap_stale_files() -> int:
+    """incoming/ antigos e pastas de uploads retomáveis sem sessão aberta."""
+    removed = 0
+    cutoff = time.time() - ORPHAN_MAX_AGE_HOURS * 3600
+    base = Path(MEDIA_ROOT)
+    for path in (base / 'incoming').glob('*'):
+        if path.is_file() and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    for sid in expire_upload_sessions(_ago(hours=ORPHAN_MAX_AGE_HOURS)):
+        shutil.rmtree(base / 'uploads' / sid, ignore_errors=True)
+        removed += 1
+    active = upload_session_ids()
+    for path in (base / 'uploads').glob('*'):
+        if path.is_dir() and path.name not in active and path.stat().st_mtime < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def _apply_output_retention() -> int:
+    def handle(output):
+        vid = output['video_id']
+        with batch():
+            delete_outputs(vid, [output['filter']])
+            _release_output(vid, output)
+        remove_output_files(output)
+        if output.get('path_processed'):
+            shutil.rmtree(Path(output['path_processed']).parent, ignore_errors=True)
+        row = get_video(vid)
+        if row:
+            refresh_meta_outputs(vid, video_dir(row['path_original']))
+    return _drain(lambda: stale_outputs(_ago(days=OUTPUT_RETENTION_DAYS), GC_BATCH), handle)
+
+def _cool_idle_videos() -> int:
+    cooled = 0
+    # Vídeos que não puderam esfriar (job ativo) continuam na consulta: para na primeira página sem progresso
+    while True:
+        rows = idle_videos(_ago(days=COLD_AFTER_DAYS), GC_BATCH)
+        done = sum(1 for row in rows if make_cold(row))
+        cooled += done
+        if len(rows) < GC_BATCH or not done:
+            return cooled
+
+def _measure_derived() -> int:
+    """Mede os derivados gravados antes do índice de uso de disco (entram em disk_usage)."""
+    def handle(entry):
+        set_derived_size(entry['cache_key'], output_files_size(entry))
+    return _drain(lambda: derived_without_size(GC_BATCH), handle)
+
+def collect() -> dict:
+    """Uma passada completa do GC; devolve quantos itens cada etapa tratou."""
+    start = time.perf_counter()
+    stats = {}
+    if COLD_AFTER_DAYS:
+        stats['cooled'] = _cool_idle_videos()
+    if OUTPUT_RETENTION_DAYS:
+        stats['expired_outputs'] = _apply_output_retention()
+    stats['failed_uploads'] = _reap_failed_uploads()
+    stats['stale_files'] = _reap_stale_files()
+    stats['blobs'], stats['derived'] = _reap_unreferenced()
+    stats['trash'] = _reap_trash()
+    stats['measured'] = _measure_derived()
+    for kind, n in stats.items():
+        if n:
+            GC_ITEMS.inc(n, kind=kind)
+    elapsed = time.perf_counter() - start
+    GC_SECONDS.observe(elapsed)
+    _last_run.clear()
+    _last_run.update(stats, finished_at=datetime.utcnow().isoformat() + 'Z', seconds=round(elapsed, 3))
+    return stats
+
+class Collector:
+    """Thread do GC: uma passada ao subir e depois a cada `interval` segundos."""
+    def __init__(self, interval: float = GC_INTERVAL_SEC):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='storage-gc')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                collect()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+_collector = None
+
+def start_gc(interval: float = GC_INTERVAL_SEC):
+    """Sobe a thread do GC (uma por processo; GC_INTERVAL_SEC=0 desliga)."""
+    global _collector
+    if _collector is None and interval > 0:
+        _collector = Collector(interval).start()
+    return _collector
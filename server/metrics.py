@@ -0,0 +1,242 @@
+# server/metrics.py
+"""Métricas do servidor no formato texto do Prometheus (exposto em /metrics).
+
+Contadores e histogramas simples, com rótulos, guardados em memória no processo. Os processos
+worker (jobs) e o servidor web são processos diferentes: cada worker grava periodicamente um
+snapshot em METRICS_DIR/<pid>.json e o /metrics soma os snapshots aos valores do próprio
+processo. Os snapshots são apagados quando o servidor sobe os workers (contadores recomeçam do
+zero a cada execução, como num restart de processo).
+
+Uso:
+    UPLOADS = counter('video_uploads_total', 'Uploads recebidos', ['endpoint'])
+    UPLOADS.inc(endpoint='multipart')
+    with STAGE_SECONDS.time(stage='probe'):
+        ...
+"""
+import json
+import os
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+
+from config import METRICS_DIR
+
+# Latências de 1 ms a 5 min
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = {}
+_lock = threading.Lock()
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Rótulos de {self.name}: esperado {self.labels}, recebido {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.labels)
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _snapshot(self):
+        return [[list(k), v] for k, v in self._values.items()]
+
+    def _merge(self, into: dict, values):
+        for key, v in values:
+            key = tuple(key)
+            into[key] = into.get(key, 0.0) + v
+
+    def _render(self, values: dict) -> list:
+        return [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _snapshot(self):
+        return [[list(k), v] for k, v in self._values.items()]
+
+    def _merge(self, into: dict, values):
+        for key, v in values:
+            key = tuple(key)
+            state = into.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            state['counts'] = [a + b for a, b in zip(state['counts'], v['counts'])]
+            state['sum'] += v['sum']
+            state['count'] += v['count']
+
+    def _render(self, values: dict) -> list:
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, state['counts']):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (_num(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {state['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(state['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {state['count']}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+def _register(metric):
+    with _lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+def counter(name: str, help: str, labels=()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+def histogram(name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+def timed(hist: Histogram, label: str = 'op'):
+    """Decorador: mede cada chamada em `hist`, com o nome da função no rótulo `label`."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start, **{label: fn.__name__})
+        return wrapper
+    return decorator
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(names, escaped)) + '}'
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+# ==========================
+# Snapshots entre processos
+# ==========================
+
+def _snapshot_dir() -> Path:
+    return Path(METRICS_DIR)
+
+def write_snapshot():
+    """Grava as métricas deste processo em METRICS_DIR/<pid>.json (troca atômica)."""
+    with _lock:
+        data = {name: m._snapshot() for name, m in _registry.items() if m._values}
+    d = _snapshot_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = d / f".{os.getpid()}.json.tmp"
+    tmp.write_text(json.dumps(data), encoding='utf-8')
+    tmp.replace(d / f"{os.getpid()}.json")
+
+def clear_snapshots():
+    for path in _snapshot_dir().glob('*.json'):
+        path.unlink(missing_ok=True)
+
+def _read_snapshots():
+    own = f"{os.getpid()}.json"
+    for path in _snapshot_dir().glob('*.json'):
+        if path.name == own:
+            continue
+        try:
+            yield json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+
+def _merged() -> tuple:
+    """(métricas registradas, valores deste processo somados aos snapshots dos workers)."""
+    with _lock:
+        merged = {}
+        for name, m in _registry.items():
+            values = merged[name] = {}
+            m._merge(values, m._snapshot())
+        metrics = dict(_registry)
+    for snap in _read_snapshots():
+        for name, values in snap.items():
+            if name in metrics:
+                metrics[name]._merge(merged[name], values)
+    return metrics, merged
+
+def values(name: str) -> dict:
+    """Valores somados (todos os processos) de uma métrica, por tupla de rótulos."""
+    return _merged()[1].get(name, {})
+
+def render() -> str:
+    """Todas as métricas (deste processo + snapshots dos workers) no formato texto do Prometheus."""
+    metrics, merged = _merged()
+    lines = []
+    for name, m in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {m.help}")
+        lines.append(f"# TYPE {name} {m.type}")
+        lines.extend(m._render(merged[name]))
+    return '\n'.join(lines) + '\n'
+
+class SnapshotWriter:
+    """Thread que grava o snapshot do processo a cada `interval` segundos (usada nos workers)."""
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='metrics-snapshot')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
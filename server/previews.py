@@ -0,0 +1,103 @@
+# server/previews.py
+"""Preview animado dos vídeos (GIF, WebP animado ou MP4 mudo em loop).
+
+Os quadros vêm já reduzidos a PREVIEW_WIDTH: no processamento, por um FrameSampler com max_width;
+fora dele, por `sample_preview_frames`, que percorre o vídeo em sequência com grab() e só
+decodifica (retrieve) os quadros escolhidos, sem seek. O GIF usa uma única paleta para todos os
+quadros, calculada sobre o conjunto, em vez de uma paleta (e dithering) por quadro.
+"""
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import PREVIEW_FORMAT, PREVIEW_WIDTH, PREVIEW_FRAMES, PREVIEW_FPS, PREVIEW_COLORS, PREVIEW_QUALITY
+from processing import fit_width
+from encoders import ffmpeg_path
+from storage import preview_indices
+
+PREVIEW_FORMATS = ('gif', 'webp', 'mp4')
+
+def preview_name(fmt: str = PREVIEW_FORMAT) -> str:
+    return f"preview.{fmt}"
+
+def sample_preview_frames(video_path: Path, max_frames: int = PREVIEW_FRAMES, width: int = PREVIEW_WIDTH):
+    """Quadros do preview lidos em uma passada sequencial (grab/retrieve), já reduzidos."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return []
+    wanted = set(preview_indices(int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0), max_frames))
+    last = max(wanted) if wanted else -1
+    frames = []
+    idx = 0
+    while idx <= last and cap.grab():
+        if idx in wanted:
+            ok, frame = cap.retrieve()
+            if ok:
+                frames.append(fit_width(frame, width))
+        idx += 1
+    cap.release()
+    return frames
+
+def _to_image(frame) -> Image.Image:
+    if frame.ndim == 2:
+        return Image.fromarray(frame, 'L')
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 'RGB')
+
+def _write_gif(frames, path: Path, fps: int):
+    images = [_to_image(f) for f in frames]
+    if images[0].mode == 'RGB':
+        # Paleta única: quantiza todos os quadros empilhados e aplica a mesma paleta em cada um
+        w, h = images[0].size
+        stack = Image.new('RGB', (w, h * len(images)))
+        for i, im in enumerate(images):
+            stack.paste(im, (0, i * h))
+        palette = stack.quantize(colors=PREVIEW_COLORS, method=Image.Quantize.MEDIANCUT)
+        images = [im.quantize(palette=palette, dither=Image.Dither.NONE) for im in images]
+    images[0].save(path, format='GIF', save_all=True, append_images=images[1:],
+                   duration=int(1000 / max(1, fps)), loop=0, optimize=True)
+
+def _write_webp(frames, path: Path, fps: int):
+    images = [_to_image(f) for f in frames]
+    images[0].save(path, format='WEBP', save_all=True, append_images=images[1:],
+                   duration=int(1000 / max(1, fps)), loop=0, quality=PREVIEW_QUALITY, method=4)
+
+def _write_mp4(frames, path: Path, fps: int) -> bool:
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        return False
+    h, w = frames[0].shape[:2]
+    pix_fmt = 'gray' if frames[0].ndim == 2 else 'bgr24'
+    cmd = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{w}x{h}',
+           '-r', str(fps), '-i', '-', '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '32',
+           '-pix_fmt', 'yuv420p', '-movflags', '+faststart', str(path)]
+    data = b''.join(np.ascontiguousarray(f).tobytes() for f in frames)
+    return subprocess.run(cmd, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).returncode == 0
+
+def write_preview(frames, thumbs_dir: Path, fps: int = PREVIEW_FPS, fmt: str = PREVIEW_FORMAT,
+                  width: int = PREVIEW_WIDTH) -> Path | None:
+    """Grava o preview animado (preview.gif/.webp/.mp4) a partir de quadros BGR ou cinza.
+    Sem ffmpeg, o MP4 cai para GIF."""
+    if not frames:
+        return None
+    if fmt not in PREVIEW_FORMATS:
+        fmt = 'gif'
+    frames = [fit_width(f, width) for f in frames]
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    path = thumbs_dir / preview_name(fmt)
+    if fmt == 'mp4':
+        if _write_mp4(frames, path, fps):
+            return path
+        path.unlink(missing_ok=True)
+        fmt, path = 'gif', thumbs_dir / preview_name('gif')
+    if fmt == 'webp':
+        _write_webp(frames, path, fps)
+    else:
+        _write_gif(frames, path, fps)
+    return path
+
+def generate_preview(video_path: Path, thumbs_dir: Path, fmt: str = PREVIEW_FORMAT) -> Path | None:
+    """Preview de um vídeo já gravado (fora do processamento, ex.: regerar um preview apagado)."""
+    return write_preview(sample_preview_frames(video_path), thumbs_dir, fmt=fmt)
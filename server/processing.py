@@ -1,13 +1,46 @@
 # server/processing.py
+import multiprocessing as mp
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import cv2
 import numpy as np
-import imageio
 import hashlib
+import logging
+import math
+import re
 
-SUPPORTED_FILTERS = {"grayscale", "pixelate", "edges"}
+from config import PROCESS_WORKERS, PARALLEL_MIN_FRAMES, PROCESS_MODE, PIPELINE_DEPTH, FILTER_BATCH, OUTPUT_TARGET
+from filters import FILTERS, FilterChain, build_chain
+from encoders import EncoderSettings, open_encoder, ffmpeg_path, mux_audio
+from metrics import counter, histogram
 
-def probe_video(src_path: Path) -> dict:
+PROCESS_SECONDS = histogram('video_process_seconds', 'Duração de process_outputs (decodificação única, todas as saídas)', ['mode'])
+STAGE_SECONDS = counter('video_process_stage_seconds_total', 'Tempo acumulado por estágio do processamento', ['stage'])
+FRAMES = counter('video_process_frames_total', 'Quadros da fonte processados', ['mode'])
+PROCESS_FPS = histogram('video_process_fps', 'Quadros da fonte por segundo em cada processamento', [],
+                        buckets=(1, 5, 10, 25, 50, 100, 200, 400, 800, 1600))
+FILTER_FRAME_SECONDS = histogram('video_filter_frame_seconds', 'Tempo médio de filtro por quadro e saída', [],
+                                 buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+SUPPORTED_FILTERS = set(FILTERS)
+
+log = logging.getLogger('processing')
+_warned_serial = False
+
+def file_sha1(path: Path) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def probe_video(src_path: Path, sha1: str | None = None) -> dict:
+    """Metadados do vídeo. Se o SHA-1 já é conhecido (calculado no upload), o arquivo não é relido."""
     cap = cv2.VideoCapture(str(src_path))
     if not cap.isOpened():
         return {}
@@ -18,99 +51,511 @@ def probe_video(src_path: Path) -> dict:
     duration = frames / fps if fps > 0 else 0
     cap.release()
 
-    sha1 = hashlib.sha1()
-    with open(src_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b''):
-            sha1.update(chunk)
-
     return {
         'fps': float(fps),
         'width': w,
         'height': h,
         'duration_sec': float(duration),
-        'checksums': { 'sha1': sha1.hexdigest() }
+        'checksums': { 'sha1': sha1 or file_sha1(src_path) }
     }
 
-def _apply_filter(frame, name: str):
-    if name == 'grayscale':
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    elif name == 'pixelate':
-        h, w = frame.shape[:2]
-        scale = max(1, min(w, h) // 32)
-        small = cv2.resize(frame, (w//scale, h//scale), interpolation=cv2.INTER_LINEAR)
-        return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
-    elif name == 'edges':
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        return cv2.Canny(gray, 100, 200)
-    else:
+def fit_width(frame, width: int | None):
+    """Reduz o quadro para no máximo `width` px de largura mantendo a proporção, com lados pares
+    (exigência do yuv420p). Nunca amplia; devolve o próprio quadro se já couber."""
+    h, w = frame.shape[:2]
+    if not width or w <= width:
         return frame
+    new_w = max(2, width - width % 2)
+    new_h = max(2, round(h * new_w / w / 2) * 2)
+    return cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
 
-def process_video(src_path: Path, dst_dir: Path, out_name: str, filter_name: str):
-    filter_name = (filter_name or 'grayscale').lower()
-    if filter_name not in SUPPORTED_FILTERS:
-        filter_name = 'grayscale'
+class FrameSampler:
+    """Guarda cópias de quadros processados em índices escolhidos, durante a própria passada de
+    processamento (sem reabrir o vídeo nem fazer seek).
 
-    dst_dir.mkdir(parents=True, exist_ok=True)
-    out_path = dst_dir / out_name
+    `pick(total_frames)` devolve os índices desejados e é chamado por process_video quando o total
+    de quadros é conhecido; alternativamente os índices podem ser passados prontos em `indices`.
+    Com `max_width`, os quadros já são guardados reduzidos (previews não precisam da resolução cheia).
+    """
+    def __init__(self, pick=None, indices=None, max_width: int | None = None):
+        self.pick = pick
+        self.indices = set(indices or ())
+        self.max_width = max_width
+        self.frames = {}
 
-    cap = cv2.VideoCapture(str(src_path))
-    if not cap.isOpened():
-        return False, None
+    def bind(self, total_frames: int):
+        if self.pick:
+            self.indices = set(self.pick(total_frames))
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    def offer(self, idx: int, frame):
+        if idx in self.indices:
+            small = fit_width(frame, self.max_width)
+            self.frames[idx] = small.copy() if small is frame else small
+
+    def ordered(self):
+        return [self.frames[i] for i in sorted(self.frames)]
+
+_TARGET_RE = re.compile(r'^(?:(\d+)x(\d+)|(\d+)p?)?(?:@(\d+(?:\.\d+)?))?$')
+
+def parse_target(spec: str | None) -> str | None:
+    """Valida e normaliza um alvo de saída: "720p@24", "720p", "1280x720", "@15"...
+    Devolve None para vazio/"source" (mantém a fonte). Levanta ValueError."""
+    spec = (spec or '').strip().lower()
+    if spec in ('', 'source', 'original'):
+        return None
+    m = _TARGET_RE.match(spec)
+    if not m or not any(m.groups()):
+        raise ValueError(f"Alvo de saída inválido: {spec} (ex.: 720p@24)")
+    w, h, height, fps = m.groups()
+    if w and (int(w) < 2 or int(h) < 2) or height and int(height) < 2:
+        raise ValueError(f"Resolução de saída inválida: {spec}")
+    if fps and not 0 < float(fps) <= 240:
+        raise ValueError(f"FPS de saída inválido: {spec}")
+    size = f"{int(w)}x{int(h)}" if w else (f"{int(height)}p" if height else '')
+    return size + (f"@{float(fps):g}" if fps else '')
+
+class OutputTarget:
+    """Resolução/fps de saída aplicados logo depois da decodificação, antes dos filtros.
+
+    Quadros são descartados por uma regra determinística (quadro i da fonte fica se floor(i*r)
+    avança, r = fps_saida/fps_fonte), o que permite a cada segmento do modo paralelo saber sozinho
+    quais quadros mantém e qual índice de saída eles recebem. Nunca amplia nem aumenta o fps.
+    """
+    def __init__(self, src_size: tuple, src_fps: float, spec: str | None = None):
+        sw, sh = src_size
+        self.spec = parse_target(spec)
+        w, h, fps = sw, sh, src_fps
+        if self.spec:
+            size, _, fps_spec = self.spec.partition('@')
+            if size.endswith('p'):
+                h = min(sh, int(size[:-1]))
+                w = sw * h / sh
+            elif size:
+                bw, bh = (int(v) for v in size.split('x'))
+                scale = min(1.0, bw / sw, bh / sh)
+                w, h = sw * scale, sh * scale
+            if fps_spec and src_fps > 0:
+                fps = min(src_fps, float(fps_spec))
+        if (w, h) != (sw, sh):
+            # Lados pares (yuv420p)
+            w, h = max(2, round(w / 2) * 2), max(2, round(h / 2) * 2)
+        self.size = (int(w), int(h))
+        self.src_size = (sw, sh)
+        self.fps = float(fps)
+        self.ratio = fps / src_fps if src_fps > 0 and fps < src_fps else 1.0
+        self.resize = self.size != self.src_size
+
+    @property
+    def identity(self) -> bool:
+        return not self.resize and self.ratio == 1.0
+
+    def out_index(self, i: int) -> int:
+        return math.floor(i * self.ratio)
+
+    def keep(self, i: int) -> bool:
+        return i == 0 or self.out_index(i) > self.out_index(i - 1)
+
+    def out_frames(self, n: int) -> int:
+        """Quadros de saída produzidos pelos `n` primeiros quadros da fonte."""
+        return self.out_index(n - 1) + 1 if n > 0 else 0
+
+    def prepare(self, frames, first: int):
+        """Aplica o alvo a um lote decodificado cujo primeiro quadro é o `first` da fonte.
+        Devolve (quadros de saída, índice de saída do primeiro)."""
+        out_first = self.out_frames(first)
+        if self.identity:
+            return frames, out_first
+        if self.ratio != 1.0:
+            frames = frames[[k for k in range(len(frames)) if self.keep(first + k)]]
+        if self.resize and len(frames):
+            w, h = self.size
+            out = np.empty((len(frames), h, w) + frames.shape[3:], frames.dtype)
+            for k in range(len(frames)):
+                cv2.resize(frames[k], (w, h), dst=out[k], interpolation=cv2.INTER_AREA)
+            frames = out
+        return frames, out_first
+
+    def to_dict(self) -> dict:
+        return {'spec': self.spec, 'width': self.size[0], 'height': self.size[1], 'fps': self.fps}
+
+def _new_timings():
+    return {'decode': 0.0, 'filter': 0.0, 'encode': 0.0}
+
+def _alloc_batch(cap, batch_size: int):
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
+    return np.empty((batch_size, h, w, 3), np.uint8)
 
-    # Usa H.264 para web (se disponível), senão cai no XVID
-    if out_path.suffix.lower() in {'.mp4', '.m4v', '.mov'}:
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264
-    else:
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+def _read_batch(cap, batch) -> int:
+    """Decodifica até len(batch) quadros direto nos buffers do lote. Retorna quantos leu."""
+    for n in range(len(batch)):
+        ok, frame = cap.read(batch[n])
+        if not ok:
+            return n
+        if not np.shares_memory(frame, batch[n]):
+            batch[n][...] = frame
+    return len(batch)
 
-    writer = cv2.VideoWriter(str(out_path), fourcc, fps, (w, h), True)
-    if not writer.isOpened():
-        cap.release()
-        return False, None
+class Output:
+    """Uma saída do processamento: cadeia de filtros, arquivo de destino, configuração do encoder
+    e samplers que recebem os quadros já filtrados. Várias saídas compartilham a mesma
+    decodificação (fan-out por quadro)."""
+    def __init__(self, chain: FilterChain, out_path: Path, samplers=(), encoder: EncoderSettings | None = None):
+        self.chain = chain
+        self.out_path = Path(out_path)
+        self.samplers = list(samplers)
+        self.encoder = encoder or EncoderSettings()
+        self.writer = None
 
-    while True:
-        ok, frame = cap.read()
-        if not ok:
+    def open(self, fps: float, size: tuple) -> bool:
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = open_encoder(self.out_path, fps, size, self.chain.channels == 3, self.encoder)
+        return self.writer.isOpened()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+def _write_batch(outputs: list, outs: list, n: int, first: int):
+    """Grava o lote filtrado de cada saída e oferece os quadros aos seus samplers."""
+    for o, out in zip(outputs, outs):
+        for i in range(n):
+            o.writer.write(out[i])
+            for sampler in o.samplers:
+                sampler.offer(first + i, out[i])
+
+def _filter_frames(cap, outputs: list, max_frames: int | None = None, on_frame=None,
+                   timings: dict | None = None, start: int = 0, batch_size: int = FILTER_BATCH,
+                   target: OutputTarget | None = None):
+    """Lê até `max_frames` quadros (ou até o fim) em lotes de `batch_size`; cada lote passa pelo
+    `target` (descarte/redução), é filtrado e gravado por todas as `outputs`. Retorna quantos
+    quadros da fonte foram lidos."""
+    timings = timings if timings is not None else _new_timings()
+    batch = _alloc_batch(cap, batch_size)
+    done = 0
+    while max_frames is None or done < max_frames:
+        want = batch_size if max_frames is None else min(batch_size, max_frames - done)
+        t0 = time.perf_counter()
+        n = _read_batch(cap, batch[:want])
+        if n == 0:
+            timings['decode'] += time.perf_counter() - t0
+            break
+        frames, first = target.prepare(batch[:n], start + done) if target else (batch[:n], start + done)
+        t1 = time.perf_counter()
+        timings['decode'] += t1 - t0
+        outs = [o.chain.apply_batch(frames) for o in outputs]
+        t2 = time.perf_counter()
+        timings['filter'] += t2 - t1
+        _write_batch(outputs, outs, len(frames), first)
+        done += n
+        timings['encode'] += time.perf_counter() - t2
+        if on_frame:
+            on_frame(done)
+        if n < want:
             break
-        proc = _apply_filter(frame, filter_name)
-        if len(proc.shape) == 2:  # grayscale/edges
-            proc = cv2.cvtColor(proc, cv2.COLOR_GRAY2BGR)
-        writer.write(proc)
+    return done
 
-    cap.release()
-    writer.release()
-    return True, out_path
+def _pipeline_frames(cap, outputs: list, max_frames: int | None = None, on_frame=None,
+                     timings: dict | None = None, start: int = 0,
+                     depth: int = PIPELINE_DEPTH, batch_size: int = FILTER_BATCH,
+                     target: OutputTarget | None = None):
+    """Mesmo contrato de `_filter_frames`, mas com decodificação, filtro e codificação em threads
+    separadas (o OpenCV libera o GIL nessas chamadas), ligadas por filas limitadas. O `target` é
+    aplicado no estágio de decodificação.
+
+    Os lotes decodificados usam `depth` buffers pré-alocados que só voltam para a fila `free`
+    depois de gravados; assim o decodificador nunca fica mais de `depth` lotes à frente.
+    """
+    timings = timings if timings is not None else _new_timings()
+    free = queue.Queue()
+    for _ in range(depth):
+        free.put(_alloc_batch(cap, batch_size))
+    decoded = queue.Queue(depth)
+    filtered = queue.Queue(depth)
+    errors = []
+
+    def decode_stage():
+        read = 0
+        try:
+            while max_frames is None or read < max_frames:
+                buf = free.get()
+                if buf is None:  # codificação abortada
+                    return
+                want = batch_size if max_frames is None else min(batch_size, max_frames - read)
+                t0 = time.perf_counter()
+                n = _read_batch(cap, buf[:want])
+                if n == 0:
+                    timings['decode'] += time.perf_counter() - t0
+                    break
+                frames, first = target.prepare(buf[:n], start + read) if target else (buf[:n], start + read)
+                timings['decode'] += time.perf_counter() - t0
+                decoded.put((buf, n, frames, first))
+                read += n
+                if n < want:
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            decoded.put(None)
+
+    def filter_stage():
+        try:
+            while True:
+                item = decoded.get()
+                if item is None:
+                    break
+                buf, n, frames, first = item
+                t0 = time.perf_counter()
+                outs = [o.chain.apply_batch(frames) for o in outputs]
+                timings['filter'] += time.perf_counter() - t0
+                filtered.put((buf, n, len(frames), first, outs))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            filtered.put(None)
+
+    threads = [threading.Thread(target=decode_stage, daemon=True),
+               threading.Thread(target=filter_stage, daemon=True)]
+    for t in threads:
+        t.start()
+
+    done = 0
+    try:
+        while True:
+            item = filtered.get()
+            if item is None:
+                break
+            buf, n, m, first, outs = item
+            t0 = time.perf_counter()
+            _write_batch(outputs, outs, m, first)
+            done += n
+            timings['encode'] += time.perf_counter() - t0
+            free.put(buf)
+            if on_frame:
+                on_frame(done)
+    finally:
+        free.put(None)
+        # Esvazia as filas para destravar estágios bloqueados em put()
+        while any(t.is_alive() for t in threads):
+            for q in (decoded, filtered):
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+            time.sleep(0.001)
+    if errors:
+        raise errors[0]
+    return done
+
+FRAME_LOOPS = {'serial': _filter_frames, 'pipeline': _pipeline_frames}
+
+def _process_segment(src_path: str, specs: list, start: int, count: int | None,
+                     target: OutputTarget, mode: str):
+    """Processa a faixa [start, start+count) da fonte em um processo separado. `specs` traz, por
+    saída, (cadeia, arquivo do segmento, (índices de saída, max_width) de cada sampler, encoder).
+    Retorna (quadros lidos, tempos por estágio, quadros amostrados por saída e sampler); -1 quadros
+    indica falha."""
+    timings = _new_timings()
+    outputs = [Output(chain, seg_path, [FrameSampler(indices=idx, max_width=mw) for idx, mw in samplers], encoder)
+               for chain, seg_path, samplers, encoder in specs]
+    cap = cv2.VideoCapture(src_path)
+    if not cap.isOpened():
+        return -1, timings, []
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        if not all(o.open(target.fps, target.size) for o in outputs):
+            return -1, timings, []
+        done = FRAME_LOOPS[mode](cap, outputs, count, timings=timings, start=start, target=target)
+    finally:
+        cap.release()
+        for o in outputs:
+            o.close()
+    return done, timings, [[s.frames for s in o.samplers] for o in outputs]
+
+def _concat_segments(seg_paths: list, out_path: Path) -> bool:
+    """Junta os segmentos com o demuxer concat do ffmpeg, copiando os streams (sem recodificar)."""
+    list_file = out_path.with_suffix('.segments.txt')
+    list_file.write_text(''.join(f"file '{Path(p).resolve().as_posix()}'\n" for p in seg_paths), encoding='utf-8')
+    cmd = [ffmpeg_path(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+           '-i', str(list_file), '-c', 'copy', str(out_path)]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).returncode == 0
+    finally:
+        list_file.unlink(missing_ok=True)
+
+def _process_parallel(src_path: Path, outputs: list, target: OutputTarget, total: int, workers: int,
+                      mode: str, progress=None, timings: dict | None = None) -> tuple:
+    """Processa as faixas em processos separados e concatena. Devolve (segmentos processados,
+    quadros decodificados); (0, quadros) em caso de falha."""
+    per_seg = -(-total // workers)
+    ranges = [(i * per_seg, per_seg) for i in range(workers) if i * per_seg < total]
+    # O último segmento lê até o fim: CAP_PROP_FRAME_COUNT pode ser aproximado
+    ranges[-1] = (ranges[-1][0], None)
+    seg_dirs = [o.out_path.parent / f".segments-{o.out_path.stem}" for o in outputs]
+    seg_paths = [[d / f"seg_{i:04d}{o.out_path.suffix}" for i in range(len(ranges))]
+                 for d, o in zip(seg_dirs, outputs)]
+
+    def specs_for(seg_no, start, count):
+        # Índices dos samplers são de quadros de saída: converte a faixa da fonte
+        lo = target.out_frames(start)
+        hi = None if count is None else target.out_frames(start + count)
+        return [(o.chain, str(paths[seg_no]),
+                 [(sorted(i for i in s.indices if i >= lo and (hi is None or i < hi)), s.max_width)
+                  for s in o.samplers], o.encoder)
+                for o, paths in zip(outputs, seg_paths)]
+
+    for d in seg_dirs:
+        d.mkdir(parents=True, exist_ok=True)
+    try:
+        ctx = mp.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_process_segment, str(src_path), specs_for(seg_no, start, count),
+                            start, count, target, mode)
+                for seg_no, (start, count) in enumerate(ranges)
+            ]
+            done = 0
+            for fut in as_completed(futures):
+                n, seg_timings, seg_samples = fut.result()
+                if n < 0:
+                    return 0, done
+                for o, frames_by_sampler in zip(outputs, seg_samples):
+                    for sampler, frames in zip(o.samplers, frames_by_sampler):
+                        sampler.frames.update(frames)
+                done += n
+                if timings is not None:
+                    for k, v in seg_timings.items():
+                        timings[k] += v
+                if progress:
+                    progress(min(1.0, done / total))
+        if not all(_concat_segments(paths, o.out_path) for o, paths in zip(outputs, seg_paths)):
+            return 0, done
+        return len(ranges), done
+    finally:
+        for d in seg_dirs:
+            shutil.rmtree(d, ignore_errors=True)
+
+def _chain_or_default(filter_name, filter_params: dict | None = None) -> FilterChain:
+    if isinstance(filter_name, FilterChain):
+        return filter_name
+    try:
+        return build_chain(filter_name or 'grayscale', filter_params)
+    except ValueError:
+        return build_chain('grayscale')
+
+def _mux_audio(src_path: Path, outputs: list, timings: dict):
+    t0 = time.perf_counter()
+    muxed = False
+    for o in outputs:
+        if o.encoder.audio:
+            mux_audio(o.out_path, src_path)
+            muxed = True
+    if muxed:
+        timings['mux'] = time.perf_counter() - t0
+
+def _warn_serial():
+    """Avisa (uma vez por processo) que o modo paralelo está desligado por falta de ffmpeg."""
+    global _warned_serial
+    if not _warned_serial:
+        _warned_serial = True
+        log.warning("PROCESS_WORKERS > 1, mas o ffmpeg não foi encontrado (FFMPEG_BIN ou pacote "
+                    "imageio-ffmpeg): vídeos longos serão processados em série")
 
-def generate_thumbnails(src_path: Path, thumbs_dir: Path):
-    thumbs_dir.mkdir(parents=True, exist_ok=True)
+def process_outputs(src_path: Path, outputs: list, progress=None, workers: int = PROCESS_WORKERS,
+                    mode: str = PROCESS_MODE, stats: dict | None = None, target: str | None = OUTPUT_TARGET) -> bool:
+    """Decodifica o vídeo uma única vez e grava todas as `outputs` (Output) na mesma passada:
+    cada lote de quadros passa por todas as cadeias de filtros e codificadores.
+    `progress`, se informado, recebe a fração (0..1) já processada.
+    `target` ("720p@24", ver parse_target) reduz resolução e fps logo após a decodificação: filtros,
+    encoders e samplers já trabalham no tamanho final.
+
+    Vídeos longos (>= PARALLEL_MIN_FRAMES) são divididos em `workers` faixas de frames processadas
+    em paralelo e concatenadas sem recodificação; exige ffmpeg, senão o processamento é serial.
+    Saídas com `encoder.audio` recebem a trilha de áudio do original depois de gravadas.
+    `mode` escolhe o laço de cada faixa: 'serial' ou 'pipeline' (estágios em threads).
+    Se `stats` for um dict, recebe o modo, os quadros lidos, o tempo gasto em cada estágio,
+    em 'source' os metadados do vídeo de entrada (dispensa um probe_video separado) e em 'output'
+    a resolução/fps gravados.
+    """
+    if mode not in FRAME_LOOPS:
+        mode = 'serial'
 
     cap = cv2.VideoCapture(str(src_path))
-    first_frame_path = None
-    frames_for_gif = []
-    step = 5
-    idx = 0
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        if idx == 0:
-            first = frame
-            first_frame_path = thumbs_dir / 'frame_0001.jpg'
-            cv2.imwrite(str(first_frame_path), first)
-        if idx % step == 0 and len(frames_for_gif) < 40:
-            bgr = frame
-            rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-            frames_for_gif.append(rgb)
-        idx += 1
-    cap.release()
+    if not cap.isOpened():
+        return False
 
-    preview_gif_path = None
-    if frames_for_gif:
-        preview_gif_path = thumbs_dir / 'preview.gif'
-        imageio.mimsave(preview_gif_path, frames_for_gif, fps=8)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    source = {
+        'fps': float(fps), 'width': w, 'height': h, 'frames': total,
+        'duration_sec': float(total / fps) if fps > 0 else 0.0,
+    }
+    target = OutputTarget((w, h), fps, target)
+    for o in outputs:
+        for sampler in o.samplers:
+            sampler.bind(target.out_frames(total))
+
+    timings = _new_timings()
+    started = time.perf_counter()
+
+    def fill_stats(segments: int, frames: int):
+        wall = time.perf_counter() - started
+        PROCESS_SECONDS.observe(wall, mode=mode)
+        FRAMES.inc(frames, mode=mode)
+        for k, v in timings.items():
+            STAGE_SECONDS.inc(v, stage=k)
+        if frames and wall > 0:
+            PROCESS_FPS.observe(frames / wall)
+            FILTER_FRAME_SECONDS.observe(timings['filter'] / frames / max(1, len(outputs)))
+        if stats is not None:
+            stats.update({
+                'mode': mode, 'segments': segments, 'frames': frames, 'outputs': len(outputs),
+                'source': source, 'output': target.to_dict(), 'wall_sec': round(wall, 3),
+                **{f'{k}_sec': round(v, 3) for k, v in timings.items()},
+            })
+
+    parallel = workers > 1 and total >= PARALLEL_MIN_FRAMES
+    if parallel and not ffmpeg_path():
+        _warn_serial()
+        parallel = False
+    if parallel:
+        cap.release()
+        segments, done = _process_parallel(src_path, outputs, target, total, workers, mode, progress, timings)
+        if segments:
+            _mux_audio(src_path, outputs, timings)
+        fill_stats(segments, done)
+        return bool(segments)
+
+    reported = [0]
+
+    def on_frame(done):
+        if progress and total and done - reported[0] >= 25:
+            reported[0] = done
+            progress(min(1.0, done / total))
+
+    try:
+        if not all(o.open(target.fps, target.size) for o in outputs):
+            return False
+        done = FRAME_LOOPS[mode](cap, outputs, on_frame=on_frame, timings=timings,
+                                 target=None if target.identity else target)
+    finally:
+        cap.release()
+        for o in outputs:
+            o.close()
+    _mux_audio(src_path, outputs, timings)
+    fill_stats(1, done)
+    return True
 
-    return first_frame_path, preview_gif_path
+def process_video(src_path: Path, dst_dir: Path, out_name: str, filter_name, progress=None,
+                  workers: int = PROCESS_WORKERS, mode: str = PROCESS_MODE, stats: dict | None = None,
+                  samplers=(), filter_params: dict | None = None, encoder: EncoderSettings | None = None,
+                  target: str | None = OUTPUT_TARGET):
+    """Aplica um único filtro (nome registrado, cadeia "a+b" ou FilterChain); atalho para
+    process_outputs com uma saída. `samplers` (FrameSampler) recebem os quadros processados."""
+    out = Output(_chain_or_default(filter_name, filter_params), dst_dir / out_name, samplers, encoder)
+    ok = process_outputs(src_path, [out], progress, workers, mode, stats, target)
+    return (True, out.out_path) if ok else (False, None)
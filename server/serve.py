@@ -0,0 +1,67 @@
+# server/serve.py
+"""Ponto de entrada de produção (o `python app.py` continua sendo o servidor de desenvolvimento).
+
+Sobe os workers de processamento e o GC do armazenamento (lifecycle.py) e serve o app com um
+servidor WSGI multi-thread, sem debug e sem reloader:
+- 'waitress' (padrão quando instalado; funciona também no Windows): SERVER_THREADS threads
+  atendem as requisições e o corpo de cada upload é recebido pelo próprio waitress antes de chegar
+  ao app, então clientes lentos não seguram threads;
+- 'werkzeug': servidor threaded do Werkzeug (uma thread por conexão), sem dependências extras.
+
+Limites (config.py):
+- HEAVY_CONCURRENCY: uploads/finalize/derive executando ao mesmo tempo; o resto das threads fica
+  para catálogo, galeria e mídia (ver app.heavy);
+- JOB_WORKERS: processamentos simultâneos (processos worker);
+- MAX_QUEUED_JOBS: fila máxima de jobs; acima dela novos uploads recebem 503 + Retry-After.
+"""
+import logging
+from pathlib import Path
+
+from config import (
+    MEDIA_ROOT, DB_PATH, SERVER_HOST, SERVER_PORT, SERVER_RUNNER, SERVER_THREADS, SERVER_CONNECTION_LIMIT,
+    JOB_WORKERS, MAX_UPLOAD_BYTES, HEAVY_CONCURRENCY, MAX_QUEUED_JOBS,
+)
+from db import init_db
+from jobs import start_workers
+from lifecycle import start_gc
+from app import app
+
+RUNNERS = ('auto', 'waitress', 'werkzeug')
+
+def _runner(name: str) -> str:
+    if name not in RUNNERS:
+        raise SystemExit(f"SERVER_RUNNER inválido: {name} (use {', '.join(RUNNERS)})")
+    if name in ('auto', 'waitress'):
+        try:
+            import waitress  # noqa: F401
+            return 'waitress'
+        except ImportError:
+            if name == 'waitress':
+                raise SystemExit("SERVER_RUNNER=waitress, mas o pacote waitress não está instalado")
+    return 'werkzeug'
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, runner: str = SERVER_RUNNER):
+    runner = _runner(runner)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    log = logging.getLogger('serve')
+    log.info("servidor %s em %s:%s (threads=%s, pesadas=%s, workers=%s, fila máx.=%s)",
+             runner, host, port, SERVER_THREADS, HEAVY_CONCURRENCY, JOB_WORKERS, MAX_QUEUED_JOBS or '-')
+
+    if runner == 'waitress':
+        from waitress import serve as waitress_serve
+        waitress_serve(app, host=host, port=port, threads=SERVER_THREADS,
+                       connection_limit=SERVER_CONNECTION_LIMIT, max_request_body_size=MAX_UPLOAD_BYTES,
+                       channel_timeout=120, ident='video-server')
+    else:
+        from werkzeug.serving import make_server
+        make_server(host, port, app, threaded=True).serve_forever()
+
+def main():
+    Path(MEDIA_ROOT).mkdir(parents=True, exist_ok=True)
+    init_db(DB_PATH)
+    start_workers(JOB_WORKERS)
+    start_gc()
+    serve()
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ call .venv\Scripts\activate
 REM Instala dependências caso ainda não tenha
 pip install -r requirements.txt
 
-REM Roda o servidor Flask
-python app.py
+REM Roda o servidor de produção (waitress); para desenvolvimento use python app.py
+python serve.py
 
 pause
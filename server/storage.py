@@ -1,10 +1,25 @@
+import hashlib
 import json
+import os
 import shutil
+import uuid
 from pathlib import Path
 from datetime import datetime
-from config import MEDIA_ROOT, SERVER_BASE_URL
+from config import MEDIA_ROOT, SERVER_BASE_URL, MAX_UPLOAD_BYTES, THUMB_WIDTH, THUMB_FORMAT, THUMB_QUALITY
+from metrics import histogram, timed
 import cv2
-import imageio
+
+# Tempo das operações de disco (rótulo op = nome da função)
+STORAGE_SECONDS = histogram('video_storage_op_seconds', 'Duração das operações de armazenamento', ['op'])
+_timed = timed(STORAGE_SECONDS)
+
+CHUNK_SIZE = 1024 * 1024
+
+class IngestError(Exception):
+    """Upload rejeitado durante a gravação; `status` é o código HTTP sugerido."""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
 
 def ensure_media_root():
     """Cria pastas principais do MEDIA_ROOT se não existirem."""
@@ -12,22 +27,30 @@ def ensure_media_root():
     (base / 'incoming').mkdir(parents=True, exist_ok=True)
     (base / 'videos').mkdir(parents=True, exist_ok=True)
     (base / 'trash').mkdir(parents=True, exist_ok=True)
+    (base / 'uploads').mkdir(parents=True, exist_ok=True)
+    (base / 'thumbcache').mkdir(parents=True, exist_ok=True)
 
+@_timed
 def save_incoming(file_storage):
-    """Salva upload em MEDIA_ROOT/incoming/ com nome seguro."""
+    """Salva upload em MEDIA_ROOT/incoming/ com nome seguro.
+    O SHA-1 é calculado sobre os próprios blocos gravados, sem reler o arquivo depois."""
     incoming_dir = Path(MEDIA_ROOT) / 'incoming'
     incoming_dir.mkdir(parents=True, exist_ok=True)
     original_name = file_storage.filename
-    dest = incoming_dir / original_name
-    file_storage.save(dest)
-    return dest, original_name
+    # Prefixo único: dois clientes enviando arquivos com o mesmo nome não colidem
+    dest = incoming_dir / f"{uuid.uuid4().hex}_{Path(original_name).name}"
+    sha1 = hashlib.sha1()
+    with open(dest, 'wb') as out:
+        for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+            out.write(chunk)
+    return dest, original_name, sha1.hexdigest()
 
-def move_to_final_structure(incoming_path: Path, vid: str, original_name: str):
-    """Organiza vídeo em estrutura por data e cria pastas para original, processado e thumbs."""
+def video_dirs(vid: str, ext: str):
+    """Cria a estrutura por data (original, processado e thumbs) de um vídeo e devolve os caminhos."""
     now = datetime.utcnow()
     yyyy = f"{now.year:04d}"; mm = f"{now.month:02d}"; dd = f"{now.day:02d}"
 
-    ext = incoming_path.suffix.lower()
     dir_uuid = Path(MEDIA_ROOT) / 'videos' / yyyy / mm / dd / vid
     dir_original = dir_uuid / 'original'
     dir_processed = dir_uuid / 'processed'
@@ -36,18 +59,174 @@ def move_to_final_structure(incoming_path: Path, vid: str, original_name: str):
     for p in [dir_original, dir_processed, dir_thumbs]:
         p.mkdir(parents=True, exist_ok=True)
 
-    final_original = dir_original / f"video{ext}"
-    shutil.move(str(incoming_path), final_original)
-
     return {
         'dir_uuid': dir_uuid,
         'dir_original': dir_original,
         'dir_processed': dir_processed,
         'dir_thumbs': dir_thumbs,
-        'path_original': final_original,
+        'path_original': dir_original / f"video{ext}",
         'ext': ext,
     }
 
+def thumbs_dir_for(dir_uuid: Path, filter_name: str, primary: str) -> Path:
+    """Thumbnails do filtro principal do vídeo ficam em thumbs/; os das demais saídas, em thumbs/<filtro>/."""
+    base = Path(dir_uuid) / 'thumbs'
+    return base if filter_name == primary else base / filter_name
+
+def sniff_container(head: bytes, ext: str) -> bool:
+    """Confere a assinatura do contêiner nos primeiros bytes contra a extensão declarada."""
+    if ext in {'.mp4', '.m4v', '.mov'}:
+        return head[4:8] in {b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'}
+    if ext == '.avi':
+        return head[:4] == b'RIFF' and head[8:12] == b'AVI '
+    if ext in {'.mkv', '.webm'}:
+        return head[:4] == b'\x1a\x45\xdf\xa3'
+    return True  # extensão sem assinatura conhecida
+
+@_timed
+def ingest_stream(stream, vid: str, original_name: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Grava o corpo do upload direto em videos/.../<uuid>/original/, em blocos, sem passar por
+    incoming/. Calcula o SHA-1, valida o cabeçalho do contêiner e aplica o limite de tamanho
+    durante a própria leitura. Retorna (paths, sha1, tamanho); em erro a pasta é removida."""
+    ext = Path(original_name).suffix.lower()
+    paths = video_dirs(vid, ext)
+    dest = paths['path_original']
+    part = dest.with_name(dest.name + '.part')
+    sha1 = hashlib.sha1()
+    size = 0
+    head = b''
+    try:
+        with open(part, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                if len(head) < 12:
+                    head += chunk[:12 - len(head)]
+                    if len(head) == 12 and not sniff_container(head, ext):
+                        raise IngestError(f"Conteúdo não corresponde a um arquivo {ext}")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise IngestError(f"Arquivo maior que o limite de {max_bytes} bytes", 413)
+                sha1.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise IngestError("Arquivo vazio")
+        if len(head) < 12 and not sniff_container(head, ext):
+            raise IngestError(f"Conteúdo não corresponde a um arquivo {ext}")
+        part.replace(dest)
+    except BaseException:
+        shutil.rmtree(paths['dir_uuid'], ignore_errors=True)
+        raise
+    return paths, sha1.hexdigest(), size
+
+def upload_session_file(sid: str) -> Path:
+    """Arquivo em montagem de um upload retomável (MEDIA_ROOT/uploads/<sessão>/data.part)."""
+    return Path(MEDIA_ROOT) / 'uploads' / sid / 'data.part'
+
+def create_upload_file(sid: str, size: int):
+    """Pré-aloca o arquivo da sessão com o tamanho final; blocos são gravados em seus offsets."""
+    part = upload_session_file(sid)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    with open(part, 'wb') as f:
+        f.truncate(size)
+    return part
+
+def write_upload_chunk(sid: str, offset: int, data: bytes):
+    with open(upload_session_file(sid), 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+@_timed
+def finish_upload_file(sid: str, vid: str, original_name: str):
+    """Move o arquivo montado para a pasta final do vídeo (rename no mesmo disco, sem cópia).
+    Confere o cabeçalho do contêiner e calcula o SHA-1 completo. Retorna (paths, sha1)."""
+    part = upload_session_file(sid)
+    ext = Path(original_name).suffix.lower()
+    with open(part, 'rb') as f:
+        head = f.read(12)
+        if not sniff_container(head, ext):
+            raise IngestError(f"Conteúdo não corresponde a um arquivo {ext}")
+        f.seek(0)
+        sha1 = hashlib.sha1()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    paths = video_dirs(vid, ext)
+    shutil.move(str(part), paths['path_original'])
+    shutil.rmtree(part.parent, ignore_errors=True)
+    return paths, sha1.hexdigest()
+
+@_timed
+def move_to_final_structure(incoming_path: Path, vid: str, original_name: str):
+    """Organiza vídeo em estrutura por data e cria pastas para original, processado e thumbs."""
+    paths = video_dirs(vid, incoming_path.suffix.lower())
+    shutil.move(str(incoming_path), paths['path_original'])
+    return paths
+
+def blob_path(sha1: str, ext: str) -> Path:
+    """Local do original no armazenamento endereçado por conteúdo (MEDIA_ROOT/blobs/ab/<sha1>.ext)."""
+    return Path(MEDIA_ROOT) / 'blobs' / sha1[:2] / f"{sha1}{ext}"
+
+def link_or_copy(src: Path, dst: Path):
+    """Hardlink de src em dst (mesmo arquivo em disco); copia se o sistema de arquivos não suportar."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def link_tree(src: Path, dst: Path):
+    """Replica a árvore `src` em `dst` com hardlinks (ou cópias), ex.: a pasta HLS de um resultado."""
+    if dst.exists():
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, copy_function=lambda s, d: link_or_copy(Path(s), Path(d)))
+
+def video_dir(path_original) -> Path:
+    """Pasta do vídeo (videos/yyyy/mm/dd/<uuid>) a partir do caminho do original."""
+    return Path(path_original).parents[1]
+
+def path_size(path) -> int:
+    """Bytes de um arquivo ou de uma pasta inteira; 0 se não existir."""
+    if not path:
+        return 0
+    path = Path(path)
+    try:
+        if path.is_file():
+            return path.stat().st_size
+        return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+    except OSError:
+        return 0
+
+def output_files_size(files: dict) -> int:
+    """Bytes de uma saída processada: vídeo, thumbnail, preview e a pasta HLS (se houver)."""
+    total = sum(path_size(files.get(k)) for k in ('path_processed', 'thumb_frame', 'thumb_gif'))
+    if files.get('path_hls'):
+        total += path_size(Path(files['path_hls']).parent)
+    return total
+
+def remove_output_files(files: dict, keep_thumbs: bool = False):
+    """Apaga os arquivos de uma saída (com keep_thumbs, só o vídeo processado e o HLS)."""
+    keys = ('path_processed',) if keep_thumbs else ('path_processed', 'thumb_frame', 'thumb_gif')
+    for key in keys:
+        if files.get(key):
+            Path(files[key]).unlink(missing_ok=True)
+    if files.get('path_hls'):
+        shutil.rmtree(Path(files['path_hls']).parent, ignore_errors=True)
+
+@_timed
+def move_to_trash(dir_uuid: Path, vid: str) -> Path:
+    """Move a pasta do vídeo para MEDIA_ROOT/trash/<uuid> (rename no mesmo disco)."""
+    dest = Path(MEDIA_ROOT) / 'trash' / vid
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        shutil.rmtree(dest)
+    shutil.move(str(dir_uuid), dest)
+    return dest
+
+def remove_small_thumbnails(vid: str):
+    for path in (Path(MEDIA_ROOT) / 'thumbcache' / vid[:2]).glob(f"{vid}_*"):
+        path.unlink(missing_ok=True)
+
+@_timed
 def write_meta_json(path: Path, meta: dict):
     """Salva dicionário como JSON formatado."""
     with open(path, 'w', encoding='utf-8') as f:
@@ -66,49 +245,60 @@ def public_paths_for(row: dict):
         'processed_url': to_url(row.get('path_processed')),
         'thumb_url': to_url(row.get('thumb_frame')),
         'preview_url': to_url(row.get('thumb_gif')),
+        'hls_url': to_url(row.get('path_hls')),
+        'thumb_small_url': f"{SERVER_BASE_URL}/thumbs/{row['id']}/{THUMB_WIDTH}"
+                           if row.get('id') and row.get('thumb_frame') else None,
     }
 
-def generate_thumbnails(video_path: Path, thumbs_dir: Path, num_frames: int = 3):
-    """
-    Gera miniaturas do vídeo e retorna lista de Paths.
-    """
-    thumbs_dir.mkdir(parents=True, exist_ok=True)
-    cap = cv2.VideoCapture(str(video_path))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def thumbnail_indices(total_frames: int, num_frames: int = 3):
+    """Índices dos quadros usados como miniatura."""
     step = max(1, total_frames // (num_frames + 1))
+    return [i * step for i in range(1, num_frames + 1)]
 
-    saved_paths = []
-    for i in range(1, num_frames + 1):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i * step)
-        ret, frame = cap.read()
-        if ret:
-            thumb_path = thumbs_dir / f"thumb_{i}.jpg"
-            cv2.imwrite(str(thumb_path), frame)
-            saved_paths.append(thumb_path)
-    cap.release()
-    return saved_paths
+def preview_indices(total_frames: int, max_frames: int = 20):
+    """Índices dos quadros usados no preview animado (espaçados ao longo do vídeo)."""
+    step = max(1, total_frames // max_frames)
+    return [i * step for i in range(0, max_frames)]
 
-def generate_preview_gif(video_path: Path, thumbs_dir: Path, fps: int = 5, max_frames: int = 20):
-    """
-    Gera GIF de preview do vídeo a partir de frames.
-    """
+@_timed
+def write_thumbnails(frames, thumbs_dir: Path):
+    """Grava quadros BGR já decodificados como thumb_1.jpg, thumb_2.jpg, ..."""
     thumbs_dir.mkdir(parents=True, exist_ok=True)
-    cap = cv2.VideoCapture(str(video_path))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    step = max(1, total_frames // max_frames)
+    saved_paths = []
+    for i, frame in enumerate(frames, start=1):
+        thumb_path = thumbs_dir / f"thumb_{i}.jpg"
+        cv2.imwrite(str(thumb_path), frame)
+        saved_paths.append(thumb_path)
+    return saved_paths
 
-    frames = []
-    for i in range(0, max_frames):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i * step)
-        ret, frame = cap.read()
-        if ret:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frames.append(frame_rgb)
-    cap.release()
+def small_thumb_path(vid: str, width: int) -> Path:
+    """Miniatura reduzida no cache de thumbnails: MEDIA_ROOT/thumbcache/ab/<id>_<largura>.<formato>."""
+    return Path(MEDIA_ROOT) / 'thumbcache' / vid[:2] / f"{vid}_{width}.{THUMB_FORMAT}"
 
-    if not frames:
+@_timed
+def write_small_thumbnail(frame, dest: Path, width: int) -> Path | None:
+    """Reduz o quadro (BGR ou cinza) para `width` px de largura, mantendo a proporção, e grava com
+    a qualidade de THUMB_QUALITY. Nunca amplia."""
+    if frame is None:
         return None
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    flag = cv2.IMWRITE_WEBP_QUALITY if THUMB_FORMAT == 'webp' else cv2.IMWRITE_JPEG_QUALITY
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{uuid.uuid4().hex}{dest.suffix}")
+    if not cv2.imwrite(str(tmp), frame, [flag, THUMB_QUALITY]):
+        tmp.unlink(missing_ok=True)
+        return None
+    tmp.replace(dest)
+    return dest
 
-    gif_path = thumbs_dir / "preview.gif"
-    imageio.mimsave(str(gif_path), frames, fps=fps)
-    return gif_path
+@_timed
+def small_thumbnail(vid: str, thumb_frame: str | None, width: int) -> Path | None:
+    """Miniatura reduzida do vídeo, gerada a partir de thumb_frame na primeira vez e depois lida do cache."""
+    dest = small_thumb_path(vid, width)
+    if dest.exists():
+        return dest
+    if not thumb_frame or not Path(thumb_frame).exists():
+        return None
+    return write_small_thumbnail(cv2.imread(thumb_frame, cv2.IMREAD_UNCHANGED), dest, width)
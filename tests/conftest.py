@@ -0,0 +1,68 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# config.py lê o ambiente na importação: a mídia dos testes vai para uma pasta temporária
+os.environ.setdefault('MEDIA_ROOT', tempfile.mkdtemp(prefix='media-test-'))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'server'))
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'client'))
+
+@pytest.fixture
+def database(tmp_path):
+    """Banco novo (com todas as migrações) para cada teste."""
+    import db
+    db.init_db(str(tmp_path / 'server.db'))
+    return db
+
+@pytest.fixture
+def client(database):
+    from app import app, response_cache
+    # A revisão do catálogo recomeça em cada banco novo: respostas de outro teste não valem
+    response_cache.clear()
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def sample_video(tmp_path_factory):
+    """Vídeo curto (48 quadros 64x48, com movimento) gravado com o VideoWriter do OpenCV."""
+    import cv2
+    import numpy as np
+    path = tmp_path_factory.mktemp('video') / 'sample.mp4'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 24, (64, 48))
+    for i in range(48):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        frame[:, :, 1] = 40
+        frame[8:24, i:i + 16] = (255, 128, 0)
+        writer.write(frame)
+    writer.release()
+    return path
+
+@pytest.fixture
+def processed_video(client, database, sample_video):
+    """Upload do vídeo de exemplo com o job já executado; devolve a linha em videos."""
+    import jobs
+    with open(sample_video, 'rb') as f:
+        r = client.post('/api/upload', data={'file': (f, 'sample.mp4'), 'filter': 'grayscale'})
+    assert r.status_code == 202, r.get_json()
+    job = database.claim_next_job()
+    jobs.run_job(job)
+    database.update_job(job['id'], status='done', progress=100.0)
+    return database.get_video(r.get_json()['id'])
+
+def media_url(path: str) -> str:
+    """URL /media/... de um arquivo dentro de MEDIA_ROOT."""
+    from config import MEDIA_ROOT
+    return '/media/' + Path(path).resolve().relative_to(Path(MEDIA_ROOT).resolve()).as_posix()
+
+def video_meta(n: int, **overrides) -> dict:
+    """Metadados de um vídeo de teste (id determinístico a partir de `n`)."""
+    meta = {
+        'id': f'00000000-0000-4000-8000-{n:012d}', 'original_name': f'video-{n}.mp4', 'original_ext': '.mp4',
+        'mime_type': 'video/mp4', 'size_bytes': 1000 + n, 'duration_sec': 1.0 + n, 'fps': 24.0,
+        'width': 64, 'height': 48, 'filter': 'grayscale', 'created_at': f'2024-01-{1 + n % 28:02d}T00:00:00Z',
+    }
+    meta.update(overrides)
+    return meta
@@ -0,0 +1,47 @@
+# tests/test_catalog_cache.py
+from conftest import video_meta
+
+def test_second_request_with_etag_gets_304(database, client):
+    database.insert_video(video_meta(1))
+    first = client.get('/api/videos')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+    again = client.get('/api/videos', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    detail = client.get(f"/api/videos/{video_meta(1)['id']}")
+    assert client.get(f"/api/videos/{video_meta(1)['id']}",
+                      headers={'If-None-Match': detail.headers['ETag']}).status_code == 304
+
+def test_write_bumps_revision_and_invalidates(database, client):
+    database.insert_video(video_meta(1))
+    first = client.get('/api/videos')
+    rev = database.catalog_revision()
+
+    database.insert_video(video_meta(2))
+    assert database.catalog_revision() > rev
+    after_insert = client.get('/api/videos', headers={'If-None-Match': first.headers['ETag']})
+    assert after_insert.status_code == 200
+    assert len(after_insert.get_json()) == 2
+
+    # Atualização de um vídeo existente e saídas novas também invalidam
+    rev = database.catalog_revision()
+    database.insert_video(video_meta(2, original_name='renomeado.mp4'))
+    assert database.catalog_revision() > rev
+    body = client.get('/api/videos').get_json()
+    assert 'renomeado.mp4' in {r['original_name'] for r in body}
+
+    rev = database.catalog_revision()
+    database.insert_output(video_meta(1)['id'], 'blur', {}, {'path_processed': '/tmp/x.mp4'})
+    assert database.catalog_revision() > rev
+    rev = database.catalog_revision()
+    database.delete_outputs(video_meta(1)['id'], ['blur'])
+    assert database.catalog_revision() > rev
+
+def test_delete_invalidates_cached_detail(database, client):
+    vid = video_meta(1)['id']
+    database.insert_video(video_meta(1))
+    assert client.get(f'/api/videos/{vid}').status_code == 200
+    database.delete_video(vid)
+    assert client.get(f'/api/videos/{vid}').status_code == 404
+    assert client.get('/api/videos').get_json() == []
@@ -0,0 +1,86 @@
+# tests/test_db.py
+import pytest
+
+def test_insert_blob_twice_keeps_both_references(database):
+    database.insert_blob('ab' * 20, '/tmp/blob.mp4', 10)
+    database.insert_blob('ab' * 20, '/tmp/blob.mp4', 10)
+    assert database.get_blob('ab' * 20)['refcount'] == 2
+
+def test_insert_derived_twice_keeps_both_references(database):
+    entry = {'cache_key': 'k1', 'sha1': 'ab' * 20, 'filter': 'grayscale', 'params': '{}', 'codec': 'mp4v',
+             'path_processed': '/tmp/video.mp4', 'bytes': 10}
+    database.insert_derived(entry)
+    database.insert_derived(entry)
+    assert database.get_derived('k1')['refcount'] == 2
+
+def test_dedup_lookups_are_exported_as_metrics(database):
+    import dedup
+    from metrics import render
+    before = dedup.stats()['derived_misses']
+    assert dedup.lookup_derived('nao-existe') is None
+    assert dedup.stats()['derived_misses'] == before + 1
+    assert 'video_dedup_lookups_total{kind="derived",result="miss"}' in render()
+
+def test_list_videos_pages_with_cursor(database):
+    from conftest import video_meta
+    # Datas repetidas: o desempate pelo id não pode pular nem repetir vídeos entre páginas
+    for n in range(23):
+        database.insert_video(video_meta(n, created_at=f'2024-01-{1 + n // 4:02d}T00:00:00Z'))
+    seen, cursor = [], None
+    while True:
+        page = database.list_videos(limit=5, cursor=cursor)
+        seen += page
+        if len(page) < 5:
+            break
+        cursor = database.encode_cursor(page[-1])
+    assert len(seen) == 23
+    keys = [(r['created_at'], r['id']) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+def test_migrations_upgrade_baseline_database(tmp_path):
+    import sqlite3
+    import db
+    from conftest import video_meta
+    # Banco criado pela primeira versão do servidor: só a tabela videos, sem user_version
+    path = tmp_path / 'server.db'
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE videos (id TEXT PRIMARY KEY, original_name TEXT, original_ext TEXT,
+        mime_type TEXT, size_bytes INTEGER, duration_sec REAL, fps REAL, width INTEGER, height INTEGER,
+        filter TEXT, created_at TEXT, path_original TEXT, path_processed TEXT, thumb_frame TEXT, thumb_gif TEXT)""")
+    old = video_meta(1, original_name='ferias na praia.mp4')
+    conn.execute(f"INSERT INTO videos ({', '.join(old)}) VALUES ({', '.join('?' * len(old))})", list(old.values()))
+    conn.commit()
+    conn.close()
+
+    db.init_db(str(path))
+    with db._db() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+        columns = {r['name'] for r in conn.execute("PRAGMA table_info(videos)")}
+    assert {'checksum', 'path_hls', 'rev'} <= columns
+    assert db.get_video(old['id'])['original_name'] == 'ferias na praia.mp4'
+    assert [r['id'] for r in db.search_videos(q='praia')] == [old['id']]
+    assert [r['id'] for r in db.video_changes()['changed']] == [old['id']]
+
+    # Rodar de novo não reaplica nada
+    db.init_db(str(path))
+    assert db.get_video(old['id']) is not None
+
+def test_batch_commits_once_at_the_end(database):
+    from conftest import video_meta
+    with database.batch():
+        database.insert_video(video_meta(1))
+        database.insert_video(video_meta(2))
+    assert database.get_video(video_meta(1)['id']) and database.get_video(video_meta(2)['id'])
+
+def test_batch_rolls_back_every_write_on_error(database):
+    from conftest import video_meta
+    rev = database.catalog_revision()
+    with pytest.raises(RuntimeError):
+        with database.batch():
+            database.insert_video(video_meta(1))
+            with database.batch():
+                database.insert_video(video_meta(2))
+            raise RuntimeError('falhou no meio')
+    assert database.get_video(video_meta(1)['id']) is None
+    assert database.get_video(video_meta(2)['id']) is None
+    assert database.catalog_revision() == rev
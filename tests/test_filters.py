@@ -0,0 +1,43 @@
+# tests/test_filters.py
+import io
+import json
+
+import numpy as np
+import pytest
+
+from filters import FILTERS, build_chain
+
+@pytest.mark.parametrize('spec, params', [
+    ('pixelate', {'pixelate': {'blocks': 0}}),
+    ('pixelate', {'pixelate': {'blocks': -4}}),
+    ('edges', {'edges': {'low': -1}}),
+    ('edges', {'edges': {'low': 200, 'high': 100}}),
+])
+def test_build_chain_rejects_out_of_range_params(spec, params):
+    with pytest.raises(ValueError):
+        build_chain(spec, params)
+
+def test_build_chain_accepts_bounds():
+    chain = build_chain('pixelate+edges', {'pixelate': {'blocks': 1}, 'edges': {'low': 0, 'high': 0}})
+    assert chain.params() == {'pixelate': {'blocks': 1}, 'edges': {'low': 0, 'high': 0}}
+
+def test_upload_with_invalid_filter_param_is_rejected(database):
+    from app import app
+    client = app.test_client()
+    r = client.post('/api/upload', data={
+        'file': (io.BytesIO(b'\x00' * 64), 'video.mp4'),
+        'filter': 'pixelate',
+        'params': json.dumps({'pixelate': {'blocks': 0}}),
+    })
+    assert r.status_code == 400
+    assert 'blocks' in r.get_json()['error']
+    assert database.count_jobs('queued') == 0
+
+@pytest.mark.parametrize('name', sorted(FILTERS))
+@pytest.mark.parametrize('shape', [(5, 37, 53, 3), (5, 37, 53), (200, 20, 30, 3)])
+def test_apply_batch_matches_apply(name, shape):
+    frames = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    f = FILTERS[name](**({'blocks': 7} if name == 'pixelate' else {}))
+    batch = f.apply_batch(frames)
+    assert batch.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(batch, np.stack([f.apply(frame) for frame in frames]))
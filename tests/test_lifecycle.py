@@ -0,0 +1,86 @@
+# tests/test_lifecycle.py
+import os
+
+import pytest
+
+from config import MEDIA_ROOT
+
+VID = '0f0e0d0c-0000-4000-8000-000000000001'
+VIDEO_DIR = os.path.join(MEDIA_ROOT, 'videos', '2024', '01', '01', VID)
+
+@pytest.fixture
+def video(database):
+    database.insert_video({
+        'id': VID, 'original_name': 'a.mp4', 'filter': 'grayscale', 'created_at': '2024-01-01T00:00:00Z',
+        'path_original': os.path.join(VIDEO_DIR, 'original', 'a.mp4'), 'width': 10, 'height': 10, 'fps': 1,
+        'duration_sec': 1,
+    })
+    database.insert_output(VID, 'grayscale', {}, {
+        'path_processed': os.path.join(VIDEO_DIR, 'processed', 'grayscale', 'video.mp4'),
+    }, cache_key='k1')
+    return VID
+
+def test_trash_cancels_queued_jobs(database, video):
+    import lifecycle
+    from jobs import enqueue_job
+    job_id = enqueue_job(video, {'kind': 'derive'})
+    assert lifecycle.trash_video(video)['status'] == 'deleted'
+    assert database.get_job(job_id)['status'] == 'cancelled'
+    assert database.get_video(video) is None
+
+def test_trash_refuses_while_job_running(database, video):
+    import lifecycle
+    from jobs import enqueue_job
+    enqueue_job(video, {'kind': 'derive'})
+    database.claim_next_job()
+    with pytest.raises(lifecycle.LifecycleError):
+        lifecycle.trash_video(video)
+    assert database.get_video(video) is not None
+
+def test_trash_leaves_unregistered_upload_alone(database):
+    import lifecycle
+    from jobs import enqueue_job
+    job_id = enqueue_job('sem-linha', {'kind': 'upload'})
+    assert lifecycle.trash_video('sem-linha') is None
+    assert database.get_job(job_id)['status'] == 'queued'
+
+def test_media_only_warms_known_outputs(database, video):
+    from app import app
+    database.set_video_state(video, 'cold')
+    client = app.test_client()
+    base = f'/media/videos/2024/01/01/{video}/processed/grayscale'
+    assert client.get(f'{base}/inventado.mp4').status_code == 404
+    assert database.count_jobs('queued') == 0
+    r = client.get(f'{base}/video.mp4')
+    assert r.status_code == 503
+    assert r.get_json()['status'] == 'warming'
+    assert database.count_jobs('queued') == 1
+
+def test_trash_usage_matches_bytes_on_disk(database, processed_video):
+    import lifecycle
+    from pathlib import Path
+    vid = processed_video['id']
+    lifecycle.trash_video(vid)
+    # Até o GC rodar, o disco guarda o blob do original e a pasta na lixeira (o original lá é o
+    # mesmo inode do blob); o índice de uso não pode contar nada duas vezes
+    files = [Path(database.get_blob(processed_video['checksum'])['path'])]
+    files += [p for p in (Path(MEDIA_ROOT) / 'trash' / vid).rglob('*') if p.is_file()]
+    inodes = {p.stat().st_ino: p.stat().st_size for p in files}
+    assert len(inodes) < len(files)
+    assert database.disk_usage_total() == sum(inodes.values())
+
+def test_trash_moves_folder_back_when_db_fails(database, processed_video, monkeypatch):
+    import lifecycle
+    from pathlib import Path
+    vid = processed_video['id']
+    original = Path(processed_video['path_original'])
+
+    def fail(*args):
+        raise RuntimeError('disco cheio')
+    monkeypatch.setattr(lifecycle, 'insert_trash', fail)
+    with pytest.raises(RuntimeError):
+        lifecycle.trash_video(vid)
+    assert original.is_file()
+    assert not (Path(MEDIA_ROOT) / 'trash' / vid).exists()
+    assert database.get_video(vid) is not None
+    assert database.list_outputs(vid)
@@ -0,0 +1,56 @@
+# tests/test_media.py
+from pathlib import Path
+
+from conftest import media_url
+
+def test_range_requests(client, processed_video):
+    url = media_url(processed_video['path_original'])
+    size = Path(processed_video['path_original']).stat().st_size
+    r = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert r.status_code == 206
+    assert len(r.data) == 10
+    assert r.headers['Content-Range'] == f'bytes 0-9/{size}'
+    assert client.get(url, headers={'Range': f'bytes={size + 10}-'}).status_code == 416
+
+def test_strong_etag_from_checksum(client, processed_video):
+    url = media_url(processed_video['path_original'])
+    r = client.get(url)
+    assert r.headers['ETag'] == f'"{processed_video["checksum"]}"'
+    assert client.get(url, headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+    # Derivados: ETag forte próprio, diferente do original
+    processed = client.get(media_url(processed_video['path_processed']))
+    assert processed.status_code == 200
+    assert not processed.headers['ETag'].startswith('W/')
+    assert processed.headers['ETag'] != r.headers['ETag']
+
+def test_immutable_cache_headers(client, database, processed_video):
+    blob = database.get_blob(processed_video['checksum'])
+    for path in (processed_video['path_original'], processed_video['path_processed'], blob['path']):
+        r = client.get(media_url(path))
+        assert r.status_code == 200
+        assert 'immutable' in r.headers['Cache-Control']
+        assert 'public' in r.headers['Cache-Control']
+
+def test_deleted_video_is_not_served(client, processed_video):
+    from config import MEDIA_ROOT
+    vid = processed_video['id']
+    original = media_url(processed_video['path_original'])
+    processed = media_url(processed_video['path_processed'])
+    assert client.get(original).status_code == 200
+    assert client.delete(f'/api/videos/{vid}').status_code == 200
+    assert client.get(original).status_code == 404
+    assert client.get(processed).status_code == 404
+    # Os arquivos continuam na lixeira até o GC, mas /media não serve trash/
+    trashed = [p for p in (Path(MEDIA_ROOT) / 'trash' / vid).rglob('*') if p.is_file()]
+    assert trashed
+    for path in trashed:
+        assert client.get(media_url(str(path))).status_code == 404
+    assert client.get(f'/media/videos/../trash/{vid}/{trashed[0].relative_to(Path(MEDIA_ROOT) / "trash" / vid).as_posix()}').status_code == 404
+
+def test_internal_dirs_are_not_served(client, database):
+    from config import MEDIA_ROOT
+    for rel in ('uploads/abc/data.part', 'metrics/nota.txt', 'incoming/x.mp4'):
+        path = Path(MEDIA_ROOT) / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'segredo')
+        assert client.get(f'/media/{rel}').status_code == 404
@@ -0,0 +1,14 @@
+# tests/test_player.py
+from player import MediaCache
+
+def test_media_cache_keys_outputs_by_url(tmp_path):
+    cache = MediaCache(tmp_path)
+    vid = '0f0e0d0c-0000-4000-8000-000000000001'
+    base = f'http://localhost:5000/media/videos/2024/01/01/{vid}'
+    gray = cache.path_for(vid, 'processed', f'{base}/grayscale/video.mp4')
+    blur = cache.path_for(vid, 'processed', f'{base}/blur/video.mp4')
+    original = cache.path_for(vid, 'original', f'{base}/original.mov')
+    assert len({gray, blur, original}) == 3
+    assert original.suffix == '.mov' and gray.parent == tmp_path / vid
+    # Mesmo arquivo por outro host (ou com query string) reaproveita o cache
+    assert cache.path_for(vid, 'processed', f'http://10.0.0.2:5000/media/videos/2024/01/01/{vid}/blur/video.mp4?x=1') == blur
@@ -0,0 +1,71 @@
+# tests/test_processing.py
+import cv2
+import numpy as np
+import pytest
+
+import processing
+from encoders import EncoderSettings, ffmpeg_path
+from processing import OutputTarget, parse_target
+
+@pytest.mark.parametrize('spec, expected', [
+    ('720p@24', '720p@24'), ('720P', '720p'), ('720', '720p'), ('1280x720', '1280x720'),
+    ('@15', '@15'), ('@12.50', '@12.5'), ('', None), ('source', None), (None, None),
+])
+def test_parse_target_normalizes(spec, expected):
+    assert parse_target(spec) == expected
+
+@pytest.mark.parametrize('spec', ['abc', '720p@', '1p', '1x720', '@0', '@500', '720p@24@12'])
+def test_parse_target_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_target(spec)
+
+@pytest.mark.parametrize('src, fps, spec, size, out_fps', [
+    ((640, 480), 30.0, '160p@10', (214, 160), 10.0),
+    ((640, 480), 30.0, '320x320', (320, 240), 30.0),
+    ((640, 480), 24.0, '1080p@60', (640, 480), 24.0),   # nunca amplia nem aumenta o fps
+    ((1920, 1080), 25.0, '@12.5', (1920, 1080), 12.5),
+    ((64, 48), 24.0, None, (64, 48), 24.0),
+])
+def test_output_target_size_and_fps(src, fps, spec, size, out_fps):
+    target = OutputTarget(src, fps, spec)
+    assert target.size == size
+    assert target.fps == out_fps
+    assert target.identity == (size == src and out_fps == fps)
+
+def test_output_target_keeps_frames_by_ratio():
+    target = OutputTarget((640, 480), 30.0, '@10')
+    assert [i for i in range(12) if target.keep(i)] == [0, 3, 6, 9]
+    assert target.out_frames(30) == 10
+    frames = np.zeros((6, 480, 640, 3), np.uint8)
+    # Lote começando no quadro 4 da fonte: ficam 6 e 9, que viram os quadros de saída 2 e 3
+    kept, first = target.prepare(frames, 4)
+    assert (len(kept), first) == (2, 2)
+
+def _read_frames(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return np.stack(frames)
+
+@pytest.mark.skipif(not ffmpeg_path(), reason='modo paralelo exige ffmpeg')
+def test_modes_produce_identical_frames(tmp_path, sample_video, monkeypatch):
+    monkeypatch.setattr(processing, 'PARALLEL_MIN_FRAMES', 1)
+    # crf 0: x264 sem perdas, então os quadros decodificados só dependem dos quadros filtrados
+    encoder = EncoderSettings(backend='ffmpeg', codec='libx264', crf=0, audio=False)
+    results = {}
+    for name, mode, workers in [('serial', 'serial', 1), ('pipeline', 'pipeline', 1), ('parallel', 'serial', 3)]:
+        stats = {}
+        ok, out = processing.process_video(sample_video, tmp_path / name, 'out.mp4', 'grayscale', workers=workers,
+                                           mode=mode, stats=stats, encoder=encoder, target='32p@12')
+        assert ok
+        assert stats['segments'] == (3 if workers > 1 else 1)
+        assert stats['output'] == {'spec': '32p@12', 'width': 42, 'height': 32, 'fps': 12.0}
+        results[name] = _read_frames(out)
+    assert results['serial'].shape == (24, 32, 42, 3)
+    assert np.array_equal(results['serial'], results['pipeline'])
+    assert np.array_equal(results['serial'], results['parallel'])
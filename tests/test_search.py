@@ -0,0 +1,67 @@
+# tests/test_search.py
+import pytest
+
+from conftest import video_meta
+
+NAMES = ['Férias na praia.mp4', 'aniversario_2023.mov', 'praia-de-inverno.mkv', 'reuniao 50%.mp4', 'ab.mp4', 'xab.avi']
+
+@pytest.fixture
+def catalog(database):
+    for n, name in enumerate(NAMES):
+        database.insert_video(video_meta(n, original_name=name, width=64 * (n % 3 + 1), height=48 * (n % 2 + 1),
+                                         created_at=f'2024-0{1 + n % 3}-15T12:00:00Z'))
+    return database
+
+def _names(rows):
+    return sorted(r['original_name'] for r in rows)
+
+def test_fts_trigram_matches_inside_words(catalog):
+    assert _names(catalog.search_videos(q='raia')) == ['Férias na praia.mp4', 'praia-de-inverno.mkv']
+    assert _names(catalog.search_videos(q='ANIVER')) == ['aniversario_2023.mov']
+    assert catalog.search_videos(q='nada disso') == []
+
+def test_short_query_falls_back_to_like(catalog):
+    assert _names(catalog.search_videos(q='ab')) == ['ab.mp4', 'xab.avi']
+    # Curingas do LIKE contam como texto
+    assert _names(catalog.search_videos(q='%')) == ['reuniao 50%.mp4']
+    assert _names(catalog.search_videos(q='_2')) == ['aniversario_2023.mov']
+
+def test_since_is_inclusive_and_until_exclusive(catalog):
+    rows = catalog.search_videos(since='2024-02-15T12:00:00Z', until='2024-03-15T12:00:00Z')
+    assert {r['created_at'] for r in rows} == {'2024-02-15T12:00:00Z'}
+    assert len(catalog.search_videos(until='2024-02-01')) == 2
+
+@pytest.mark.parametrize('sort', [prefix + key for key in
+                                  ['created_at', 'name', 'duration', 'size', 'width', 'height'] for prefix in ('', '-')])
+def test_every_sort_key_pages_with_cursor(catalog, sort):
+    expected = catalog.search_videos(sort=sort, limit=100)
+    seen, cursor = [], None
+    while True:
+        page = catalog.search_videos(sort=sort, limit=2, cursor=cursor)
+        seen += page
+        if len(page) < 2:
+            break
+        cursor = catalog.encode_cursor(page[-1], sort)
+    assert [r['id'] for r in seen] == [r['id'] for r in expected]
+    col = catalog.SORT_COLUMNS[sort.lstrip('-')]
+    keys = [(r[col], r['id']) for r in seen]
+    assert keys == sorted(keys, reverse=sort.startswith('-'))
+
+def test_cursor_of_another_sort_is_rejected(catalog):
+    cursor = catalog.encode_cursor(catalog.search_videos(sort='name')[0], 'name')
+    with pytest.raises(ValueError):
+        catalog.search_videos(sort='size', cursor=cursor)
+
+def test_api_fields_projection(catalog, client):
+    r = client.get('/api/videos?fields=id,original_name,thumb_url&sort=name&limit=2')
+    assert r.status_code == 200
+    rows = r.get_json()
+    assert [set(row) for row in rows] == [{'id', 'original_name', 'thumb_url'}] * 2
+    assert r.headers['X-Next-Cursor']
+    following = client.get(f"/api/videos?fields=id&sort=name&limit=2&cursor={r.headers['X-Next-Cursor']}")
+    assert following.status_code == 200
+    assert not {row['id'] for row in rows} & {row['id'] for row in following.get_json()}
+
+def test_api_rejects_unknown_fields_and_sort(catalog, client):
+    assert client.get('/api/videos?fields=id,senha').status_code == 400
+    assert client.get('/api/videos?sort=-rowid').status_code == 400
@@ -0,0 +1,71 @@
+# tests/test_uploads.py
+import hashlib
+
+import requests
+
+def _create(client, data: bytes, chunk_size: int):
+    r = client.post('/api/uploads', json={'filename': 'sample.mp4', 'size': len(data), 'filter': 'grayscale',
+                                          'chunk_size': chunk_size})
+    assert r.status_code == 201
+    return r.get_json()
+
+def _put(client, sid: str, data: bytes, offset: int, chunk_size: int, sha1: str | None = None):
+    chunk = data[offset:offset + chunk_size]
+    return client.put(f'/api/uploads/{sid}?offset={offset}', data=chunk,
+                      headers={'X-Chunk-SHA1': sha1 or hashlib.sha1(chunk).hexdigest()})
+
+def test_resumable_upload_protocol(client, database, sample_video):
+    data = sample_video.read_bytes()
+    chunk_size = 4096
+    sess = _create(client, data, chunk_size)
+    offsets = list(range(0, len(data), chunk_size))
+    assert sess['missing'] == offsets and sess['bytes_received'] == 0
+
+    # Blocos fora de ordem; o último fica faltando
+    for offset in reversed(offsets[:-1]):
+        assert _put(client, sess['id'], data, offset, chunk_size).status_code == 200
+    status = client.get(f"/api/uploads/{sess['id']}").get_json()
+    assert status['missing'] == offsets[-1:]
+    r = client.post(f"/api/uploads/{sess['id']}/finalize")
+    assert r.status_code == 409 and r.get_json()['missing'] == offsets[-1:]
+
+    assert _put(client, sess['id'], data, offsets[-1], chunk_size).status_code == 200
+    r = client.post(f"/api/uploads/{sess['id']}/finalize")
+    assert r.status_code == 202
+    vid = r.get_json()['id']
+    assert database.count_jobs('queued') == 1
+    # Finalize repetido devolve o mesmo vídeo; a sessão não aceita mais blocos
+    assert client.post(f"/api/uploads/{sess['id']}/finalize").get_json()['id'] == vid
+    assert _put(client, sess['id'], data, 0, chunk_size).status_code == 409
+
+def test_upload_chunk_validation(client, sample_video):
+    data = sample_video.read_bytes()
+    sess = _create(client, data, 4096)
+    assert _put(client, sess['id'], data, 0, 4096, sha1='0' * 40).status_code == 422
+    assert _put(client, sess['id'], data, 100, 4096).status_code == 400
+    assert client.put(f"/api/uploads/{sess['id']}?offset=0", data=b'curto').status_code == 400
+    assert client.get('/api/uploads/nao-existe').status_code == 404
+
+class _FakeSession:
+    """Responde ao uploader com respostas prontas, uma por chamada."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        status, body, headers = self.responses.pop(0)
+        r = requests.Response()
+        r.status_code = status
+        r.headers.update(headers)
+        r._content = body.encode()
+        return r
+
+def test_uploader_retries_finalize_after_503(tmp_path):
+    import uploader
+    session = _FakeSession([(503, '{"error": "ocupado"}', {'Retry-After': '0'}),
+                            (200, '{"ok": true, "id": "v1"}', {})])
+    up = uploader.ResumableUploader('http://servidor', session=session, state_file=tmp_path / 'state.json')
+    r = up._request('post', 'http://servidor/api/uploads/s1/finalize', None, timeout=1)
+    assert r.json()['id'] == 'v1'
+    assert len(session.calls) == 2